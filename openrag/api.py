@@ -23,6 +23,7 @@ from components import RagPipeline
 from config import load_config
 from fastapi import Depends, FastAPI, HTTPException, Request, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from fastapi.staticfiles import StaticFiles
 from routers.extract import router as extract_router
@@ -31,14 +32,16 @@ from routers.openai import router as openai_router
 from routers.partition import router as partition_router
 from routers.queue import router as queue_router
 from routers.search import router as search_router
-from utils.dependencies import get_vectordb
+from utils.dependencies import get_metrics_collector, get_vectordb
 from utils.logger import get_logger
+from utils.uploads import max_request_size
 
 logger = get_logger()
 config = load_config()
 DATA_DIR = Path(config.paths.data_dir)
 
 vectordb = get_vectordb()
+metrics_collector = get_metrics_collector()
 
 ragPipe = RagPipeline(config=config, vectordb=vectordb, logger=logger)
 
@@ -106,6 +109,32 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+# Multipart framing overhead tolerated on top of the largest per-file limit
+UPLOAD_BODY_OVERHEAD = 1024 * 1024
+
+
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    """Reject single-file uploads above every size limit before reading their body."""
+    if (
+        request.method in ("POST", "PUT")
+        and request.url.path.startswith("/indexer/partition/")
+        and "/file/" in request.url.path
+    ):
+        content_length = request.headers.get("content-length")
+        if (
+            content_length
+            and content_length.isdigit()
+            and int(content_length) > max_request_size() + UPLOAD_BODY_OVERHEAD
+        ):
+            return JSONResponse(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                content={"detail": "Request body exceeds the maximum upload size."},
+            )
+    return await call_next(request)
+
+
 app.state.app_state = AppState(config)
 app.mount(
     "/static", StaticFiles(directory=DATA_DIR.resolve(), check_dir=True), name="static"
@@ -120,6 +149,14 @@ async def health_check(request: Request):
     return "RAG API is up."
 
 
+@app.get("/metrics", summary="Indexing metrics in the Prometheus text format")
+async def get_metrics():
+    return PlainTextResponse(
+        await metrics_collector.render.remote(),
+        media_type="text/plain; version=0.0.4",
+    )
+
+
 WITH_CHAINLIT_UI: Optional[bool] = (
     os.getenv("WITH_CHAINLIT_UI", "true").lower() == "true"
 )
@@ -0,0 +1,321 @@
+import asyncio
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+import ray
+
+
+@dataclass(eq=False)
+class _PooledActor:
+    handle: Any
+    busy: int = 0
+    healthy: bool = True
+    draining: bool = False  # no new work; killed once idle
+    idle_since: float = field(default_factory=time.monotonic)
+    served: int = 0
+
+
+class ActorPool:
+    """
+    Actors of one class, each running up to `slots_per_actor` tasks at once,
+    for use inside an async actor.
+
+    Work goes to the least busy healthy actor. The pool grows by one actor
+    (up to `max_actors`) each `scale_interval` while work has waited longer
+    than `scale_up_wait`, and drops actors idle for `idle_timeout` (down to
+    `min_actors`). Actors failing their health check are replaced.
+
+    The backlog is either the pool's own waiters (`acquire`) or reported by
+    the owner through `backlog`, when it queues work itself and hands out
+    slots from `on_available`, called whenever slots may have freed up.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        actor_cls,
+        slots_per_actor: int,
+        min_actors: int,
+        max_actors: int,
+        scale_up_wait: float = 30.0,
+        idle_timeout: float = 300.0,
+        scale_interval: float = 5.0,
+        health_check_interval: float = 60.0,
+        health_check_timeout: float = 30.0,
+        actor_options: Optional[Dict[str, Any]] = None,
+        health_check: Optional[Callable[[Any], Awaitable[bool]]] = None,
+        backlog: Optional[Callable[[], Tuple[int, float]]] = None,
+        on_available: Optional[Callable[[], None]] = None,
+        logger=None,
+    ):
+        if not 0 < min_actors <= max_actors:
+            raise ValueError(
+                f"Pool '{name}' needs 0 < min_actors ({min_actors}) <= max_actors ({max_actors})"
+            )
+        self.name = name
+        self.actor_cls = actor_cls
+        self.slots_per_actor = slots_per_actor
+        self.min_actors = min_actors
+        self.max_actors = max_actors
+        self.scale_up_wait = scale_up_wait
+        self.idle_timeout = idle_timeout
+        self.scale_interval = scale_interval
+        self.health_check_interval = health_check_interval
+        self.health_check_timeout = health_check_timeout
+        self.actor_options = actor_options or {}
+        self.health_check = health_check or self._ping
+        self.backlog = backlog or self._own_backlog
+        self.on_available = on_available
+        self.logger = logger
+
+        self.actors: List[_PooledActor] = [self._spawn() for _ in range(min_actors)]
+        self._by_handle: Dict[int, _PooledActor] = {
+            id(a.handle): a for a in self.actors
+        }
+        # acquire() callers: (future, enqueued at)
+        self._waiters: Deque[Tuple[asyncio.Future, float]] = deque()
+        self._maintainer: Optional[asyncio.Task] = None
+        self._last_health_check = time.monotonic()
+        self.scale_ups = self.scale_downs = self.replaced = 0
+
+    @classmethod
+    def from_config(
+        cls, name: str, actor_cls, slots_per_actor: int, pools_config, **kwargs
+    ):
+        """A pool set up from `ray.actor_pools` and its `name` section."""
+        pool_config = pools_config[name]
+        options = {
+            "scheduling_strategy": pool_config.get("scheduling_strategy", "DEFAULT")
+        }
+        if pool_config.get("resources"):
+            options["resources"] = dict(pool_config.resources)
+        return cls(
+            name,
+            actor_cls,
+            slots_per_actor=slots_per_actor,
+            min_actors=pool_config.min_actors,
+            max_actors=pool_config.max_actors,
+            scale_up_wait=pool_config.scale_up_wait,
+            idle_timeout=pool_config.idle_timeout,
+            scale_interval=pools_config.scale_interval,
+            health_check_interval=pools_config.health_check_interval,
+            actor_options=options,
+            **kwargs,
+        )
+
+    # -- actors --------------------------------------------------------------
+
+    def _spawn(self) -> _PooledActor:
+        return _PooledActor(
+            handle=self.actor_cls.options(**self.actor_options).remote()
+        )
+
+    def _add_actor(self) -> _PooledActor:
+        actor = self._spawn()
+        self.actors.append(actor)
+        self._by_handle[id(actor.handle)] = actor
+        return actor
+
+    def _remove_actor(self, actor: _PooledActor):
+        self.actors.remove(actor)
+        del self._by_handle[id(actor.handle)]
+        try:
+            ray.kill(actor.handle)
+        except Exception:
+            pass
+
+    def _serving(self) -> List[_PooledActor]:
+        return [a for a in self.actors if a.healthy and not a.draining]
+
+    @staticmethod
+    async def _ping(handle) -> bool:
+        await handle.__ray_ready__.remote()
+        return True
+
+    # -- slots ---------------------------------------------------------------
+
+    @property
+    def capacity(self) -> int:
+        return len(self._serving()) * self.slots_per_actor
+
+    @property
+    def busy(self) -> int:
+        return sum(a.busy for a in self.actors)
+
+    def _with_free_slot(self) -> List[_PooledActor]:
+        return [a for a in self._serving() if a.busy < self.slots_per_actor]
+
+    @property
+    def has_free_slot(self) -> bool:
+        return bool(self._with_free_slot())
+
+    def try_acquire(self):
+        """A slot on the least busy actor, or None if all are taken."""
+        candidates = self._with_free_slot()
+        if not candidates:
+            return None
+        actor = min(candidates, key=lambda a: a.busy)
+        actor.busy += 1
+        actor.served += 1
+        return actor.handle
+
+    async def acquire(self):
+        """Wait for a slot, first come first served."""
+        self.start()
+        if not self._waiters:
+            handle = self.try_acquire()
+            if handle is not None:
+                return handle
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append((waiter, time.monotonic()))
+        try:
+            return await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release(waiter.result())
+            raise
+
+    def release(self, handle, failed: bool = False):
+        """
+        Give a slot back. `failed` flags an actor error: the actor is health
+        checked before getting more work.
+        """
+        actor = self._by_handle.get(id(handle))
+        if actor is not None:
+            actor.busy -= 1
+            if actor.busy == 0:
+                actor.idle_since = time.monotonic()
+            if failed:
+                actor.healthy = False
+                asyncio.create_task(self._check(actor))
+            if actor.draining and actor.busy == 0:
+                self._remove_actor(actor)
+        self._dispatch()
+
+    def _dispatch(self):
+        while self._waiters:
+            waiter, _ = self._waiters[0]
+            if waiter.done():  # the caller went away
+                self._waiters.popleft()
+                continue
+            handle = self.try_acquire()
+            if handle is None:
+                break
+            self._waiters.popleft()
+            waiter.set_result(handle)
+        if self.on_available is not None:
+            self.on_available()
+
+    def _own_backlog(self) -> Tuple[int, float]:
+        if not self._waiters:
+            return 0, 0.0
+        return len(self._waiters), time.monotonic() - self._waiters[0][1]
+
+    # -- maintenance ---------------------------------------------------------
+
+    def start(self):
+        """Start health checks and autoscaling. Must be called from a running loop."""
+        if self._maintainer is None or self._maintainer.done():
+            self._maintainer = asyncio.create_task(self._maintain())
+
+    async def _maintain(self):
+        while True:
+            await asyncio.sleep(self.scale_interval)
+            try:
+                self._autoscale()
+                if (
+                    time.monotonic() - self._last_health_check
+                    >= self.health_check_interval
+                ):
+                    self._last_health_check = time.monotonic()
+                    await asyncio.gather(*(self._check(a) for a in list(self.actors)))
+            except Exception:
+                if self.logger:
+                    self.logger.exception(f"Maintenance of the {self.name} pool failed")
+
+    def _autoscale(self):
+        queued, oldest_wait = self.backlog()
+        serving = self._serving()
+        if (
+            queued
+            and oldest_wait >= self.scale_up_wait
+            and len(serving) < self.max_actors
+        ):
+            self._add_actor()
+            self.scale_ups += 1
+            if self.logger:
+                self.logger.info(
+                    f"Scaled up the {self.name} pool",
+                    actors=len(serving) + 1,
+                    queued=queued,
+                    oldest_wait=round(oldest_wait, 1),
+                )
+            self._dispatch()
+            return
+
+        now = time.monotonic()
+        for actor in serving:
+            if len(self._serving()) <= self.min_actors or queued:
+                break
+            if actor.busy == 0 and now - actor.idle_since >= self.idle_timeout:
+                self._remove_actor(actor)
+                self.scale_downs += 1
+                if self.logger:
+                    self.logger.info(
+                        f"Scaled down the idle {self.name} pool",
+                        actors=len(self._serving()),
+                    )
+
+    async def _check(self, actor: _PooledActor):
+        try:
+            healthy = await asyncio.wait_for(
+                self.health_check(actor.handle), self.health_check_timeout
+            )
+        except Exception:
+            healthy = False
+        if actor not in self.actors:
+            return
+        if healthy:
+            actor.healthy = True
+            self._dispatch()
+            return
+
+        # replace it; work still running on it is left to finish or fail
+        if self.logger:
+            self.logger.warning(
+                f"Replacing an unhealthy {self.name} actor", busy=actor.busy
+            )
+        actor.healthy = False
+        actor.draining = True
+        if actor.busy == 0:
+            self._remove_actor(actor)
+        self._add_actor()
+        self.replaced += 1
+        self._dispatch()
+
+    def stats(self) -> Dict[str, Any]:
+        capacity = self.capacity
+        busy = sum(a.busy for a in self._serving())
+        queued, oldest_wait = self.backlog()
+        return {
+            "actors": len(self._serving()),
+            "min_actors": self.min_actors,
+            "max_actors": self.max_actors,
+            "slots_per_actor": self.slots_per_actor,
+            "capacity": capacity,
+            "busy": busy,
+            "utilization": round(busy / capacity, 4) if capacity else 0.0,
+            "queued": queued,
+            "oldest_wait_seconds": round(oldest_wait, 1),
+            "unhealthy": sum(not a.healthy for a in self.actors),
+            "draining": sum(a.draining for a in self.actors),
+            "scale_ups": self.scale_ups,
+            "scale_downs": self.scale_downs,
+            "replaced": self.replaced,
+            "per_actor": [
+                {"busy": a.busy, "served": a.served, "healthy": a.healthy}
+                for a in self.actors
+            ],
+        }
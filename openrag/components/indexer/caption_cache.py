@@ -0,0 +1,237 @@
+import asyncio
+import hashlib
+import sqlite3
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import ray
+from config import load_config
+
+# bits of a dHash: (DHASH_SIZE + 1) x DHASH_SIZE grayscale thumbnail
+DHASH_SIZE = 8
+
+
+def image_digest(image) -> str:
+    """
+    SHA-256 of the decoded pixels of an image (with its mode and size): the
+    same picture embedded in several documents, whatever its encoding, gets
+    the same digest, and different pictures never do.
+    """
+    digest = hashlib.sha256(f"{image.mode} {image.width}x{image.height}\n".encode())
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+
+def dhash(image) -> int:
+    """
+    Difference hash of an image: one bit per pair of horizontally adjacent
+    pixels of a small grayscale thumbnail. Re-encoded, rescaled or slightly
+    altered copies of a picture get the same hash, or one a few bits away;
+    so do different pictures of the same layout (slides of one template).
+    """
+    thumbnail = image.convert("L").resize((DHASH_SIZE + 1, DHASH_SIZE))
+    pixels = np.asarray(thumbnail, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def prompt_key(prompt: str, model: Optional[str]) -> str:
+    """Captions are only shared between requests made with the same prompt and VLM."""
+    return hashlib.sha256(f"{model}\n{prompt}".encode()).hexdigest()[:16]
+
+
+def _hamming(hashes: np.ndarray, phash: int) -> np.ndarray:
+    diff = np.bitwise_xor(hashes, np.uint64(phash))
+    return np.unpackbits(diff.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+
+class _PromptIndex:
+    """dHashes of the images captioned with one prompt, for near-duplicate lookups."""
+
+    def __init__(self):
+        self.hashes: Dict[str, int] = {}  # image digest -> dHash
+        self._array: Optional[np.ndarray] = None
+        self._keys: List[str] = []
+
+    def add(self, digest: str, phash: int):
+        self.hashes[digest] = phash
+        self._array = None
+
+    def remove(self, digest: str):
+        if self.hashes.pop(digest, None) is not None:
+            self._array = None
+
+    def nearest(self, phash: int, max_distance: int) -> Optional[str]:
+        """Digest of the closest image within `max_distance` bits, if any."""
+        if not self.hashes:
+            return None
+        if self._array is None:
+            self._keys = list(self.hashes)
+            self._array = np.array(list(self.hashes.values()), dtype=np.uint64)
+        distances = _hamming(self._array, phash)
+        best = int(distances.argmin())
+        return self._keys[best] if distances[best] <= max_distance else None
+
+
+@ray.remote(max_concurrency=100)
+class CaptionCache:
+    """
+    Persistent cache of image captions, shared by every loader of the cluster.
+
+    Captions are keyed by the digest of the decoded image and by the prompt
+    (and VLM) they were made with, so a picture embedded in many documents is
+    only captioned once. With `caption_cache.max_distance` above 0, a lookup
+    missing the exact image also reuses the caption of the closest cached one
+    within that many dHash bits (re-encoded or rescaled copies), at the risk
+    of matching a different picture of the same layout. Least recently used
+    captions are evicted past `caption_cache.max_entries`.
+    """
+
+    def __init__(self):
+        from utils.logger import get_logger
+
+        self.config = load_config()
+        self.logger = get_logger()
+        cache_config = self.config.caption_cache
+        self.enabled = cache_config.enable
+        self.max_entries = cache_config.max_entries
+        self.max_distance = cache_config.max_distance
+        path = Path(
+            cache_config.path
+            or Path(self.config.paths.state_dir) / "cache" / "captions.db"
+        )
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        # a single thread owns the connection and keeps writes in order
+        self._db = ThreadPoolExecutor(max_workers=1)
+        self._conn = self._db.submit(self._connect, str(path)).result()
+
+        self._indexes: Dict[str, _PromptIndex] = {}
+        # (prompt key, image digest) -> caption, least recently used first
+        self._captions: OrderedDict[Tuple[str, str], str] = OrderedDict()
+        for prompt, digest, phash, caption in self._run_sync(
+            "SELECT prompt, digest, phash, caption FROM image_captions "
+            "ORDER BY accessed"
+        ):
+            self._captions[(prompt, digest)] = caption
+            if phash is not None:
+                self._index(prompt).add(digest, int(phash, 16))
+        self.hits = self.near_hits = self.misses = self.puts = self.evictions = 0
+        self.logger.info("CaptionCache initialized.", entries=len(self._captions))
+
+    @staticmethod
+    def _connect(path: str) -> sqlite3.Connection:
+        conn = sqlite3.connect(path, check_same_thread=False)
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS image_captions ("
+            "prompt TEXT NOT NULL, digest TEXT NOT NULL, phash TEXT, "
+            "caption TEXT NOT NULL, accessed REAL NOT NULL, "
+            "PRIMARY KEY (prompt, digest))"
+        )
+        conn.commit()
+        return conn
+
+    def _execute(self, query: str, params=(), many: bool = False) -> list:
+        if many:
+            self._conn.executemany(query, params)
+        else:
+            rows = self._conn.execute(query, params).fetchall()
+        self._conn.commit()
+        return [] if many else rows
+
+    def _run_sync(self, query: str, params=()) -> list:
+        return self._db.submit(self._execute, query, params).result()
+
+    async def _run(self, query: str, params=(), many: bool = False) -> list:
+        return await asyncio.get_running_loop().run_in_executor(
+            self._db, self._execute, query, params, many
+        )
+
+    def _index(self, prompt: str) -> _PromptIndex:
+        index = self._indexes.get(prompt)
+        if index is None:
+            index = self._indexes[prompt] = _PromptIndex()
+        return index
+
+    async def get(
+        self, digest: str, phash: Optional[int], prompt: str
+    ) -> Optional[str]:
+        """
+        Caption of the image, or of the closest cached one when near matches
+        are enabled and `phash` (its dHash) is given; None on a miss.
+        """
+        if not self.enabled:
+            return None
+        key = (prompt, digest)
+        caption = self._captions.get(key)
+        if caption is None and self.max_distance > 0 and phash is not None:
+            match = self._index(prompt).nearest(phash, self.max_distance)
+            if match is not None:
+                key = (prompt, match)
+                caption = self._captions[key]
+                self.near_hits += 1
+        if caption is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._captions.move_to_end(key)
+        await self._run(
+            "UPDATE image_captions SET accessed = ? WHERE prompt = ? AND digest = ?",
+            (time.time(), *key),
+        )
+        return caption
+
+    async def put(self, digest: str, phash: Optional[int], prompt: str, caption: str):
+        if not self.enabled:
+            return
+        key = (prompt, digest)
+        self._captions[key] = caption
+        self._captions.move_to_end(key)
+        if phash is not None:
+            self._index(prompt).add(digest, phash)
+        self.puts += 1
+        await self._run(
+            "INSERT OR REPLACE INTO image_captions "
+            "(prompt, digest, phash, caption, accessed) VALUES (?, ?, ?, ?, ?)",
+            (
+                prompt,
+                digest,
+                None if phash is None else f"{phash:016x}",
+                caption,
+                time.time(),
+            ),
+        )
+        await self._evict()
+
+    async def _evict(self):
+        evicted = []
+        while len(self._captions) > self.max_entries:
+            (prompt, digest), _ = self._captions.popitem(last=False)
+            self._index(prompt).remove(digest)
+            evicted.append((prompt, digest))
+        if not evicted:
+            return
+        self.evictions += len(evicted)
+        await self._run(
+            "DELETE FROM image_captions WHERE prompt = ? AND digest = ?",
+            evicted,
+            many=True,
+        )
+
+    async def get_stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._captions),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "near_duplicate_hits": self.near_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "puts": self.puts,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,109 @@
+import hashlib
+import json
+import os
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from langchain_core.documents.base import Document
+
+# stages whose output is checkpointed, in pipeline order
+CHECKPOINT_STAGES = ("serialized", "chunked", "embedded")
+
+# metadata left out of the key: the ctime of the stored upload changes when
+# the same content is uploaded again
+UNKEYED_METADATA = ("created_at",)
+
+
+def checkpoint_key(metadata: Dict[str, Any]) -> Optional[str]:
+    """
+    Checkpoint of a file upload: the same content, indexed as the same file of
+    the same partition, with the same metadata (the checkpointed chunks carry
+    it, so an upload correcting it starts over).
+    """
+    if metadata.get("file_id") is None or metadata.get("sha256") is None:
+        return None
+    keyed = {k: v for k, v in metadata.items() if k not in UNKEYED_METADATA}
+    return hashlib.sha256(
+        json.dumps(keyed, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+
+def _dump_doc(doc: Document) -> dict:
+    return {"page_content": doc.page_content, "metadata": doc.metadata}
+
+
+def _load_doc(entry: dict) -> Document:
+    return Document(page_content=entry["page_content"], metadata=entry["metadata"])
+
+
+class CheckpointStore:
+    """
+    Output of the last completed stage of the files being indexed, so that a
+    retried or resubmitted task resumes after it instead of parsing, chunking
+    (contextualization included) and embedding the file again.
+
+    One JSON file per file under `root`, overwritten by each stage, removed
+    once the file is indexed, and purged after `max_age_hours` otherwise.
+    All methods block: call them from a thread.
+    """
+
+    def __init__(self, root: str, max_age_hours: float):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_age = max_age_hours * 3600
+
+    def _path(self, key: str) -> Path:
+        return self.root / f"{key}.json"
+
+    def save(
+        self,
+        key: str,
+        stage: str,
+        *,
+        doc: Optional[Document] = None,
+        chunks: Optional[List[Document]] = None,
+        embeddings: Optional[List[List[float]]] = None,
+    ):
+        if stage not in CHECKPOINT_STAGES:
+            raise ValueError(f"Unknown checkpoint stage '{stage}'")
+        entry: Dict[str, Any] = {"stage": stage, "saved_at": time.time()}
+        if doc is not None:
+            entry["doc"] = _dump_doc(doc)
+        if chunks is not None:
+            entry["chunks"] = [_dump_doc(chunk) for chunk in chunks]
+        if embeddings is not None:
+            entry["embeddings"] = embeddings
+        path = self._path(key)
+        tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex}")
+        tmp.write_text(json.dumps(entry, default=str))
+        os.replace(tmp, path)
+
+    def load(self, key: str) -> Optional[Dict[str, Any]]:
+        """The last checkpoint of a file: its `stage` and that stage's output."""
+        try:
+            entry = json.loads(self._path(key).read_text())
+        except FileNotFoundError:
+            return None
+        if "doc" in entry:
+            entry["doc"] = _load_doc(entry["doc"])
+        if "chunks" in entry:
+            entry["chunks"] = [_load_doc(chunk) for chunk in entry["chunks"]]
+        return entry
+
+    def clear(self, key: str):
+        self._path(key).unlink(missing_ok=True)
+
+    def purge(self) -> int:
+        """Delete the checkpoints older than `max_age_hours`; returns their number."""
+        cutoff = time.time() - self.max_age
+        deleted = 0
+        for path in self.root.glob("*.json"):
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+                    deleted += 1
+            except FileNotFoundError:
+                continue
+        return deleted
@@ -1,5 +1,6 @@
 import re
 from abc import ABC, abstractmethod
+from dataclasses import dataclass
 from pathlib import Path
 from typing import Optional
 
@@ -17,6 +18,7 @@ from langchain_text_splitters import (
 from omegaconf import OmegaConf
 from tqdm.asyncio import tqdm
 from utils.logger import get_logger
+from utils.metrics import file_type, metrics
 
 from ..utils import llmSemaphore, load_config, load_sys_template
 
@@ -32,6 +34,16 @@ def _get_token_length(llm: ChatOpenAI, documents: list[Document]) -> int:
     return sum(llm.get_num_tokens(doc.page_content) for doc in documents)
 
 
+@dataclass
+class ChunkingState:
+    """What chunking a document batch by batch carries from one batch to the next."""
+
+    carry: str = ""  # last chunk of the previous batch, possibly cut by its end
+    page: int = 1  # page the last emitted chunk ends on
+    first_chunks: Optional[str] = None  # contextualization: start of the document
+    prev_chunk: str = ""  # contextualization: last emitted chunk
+
+
 class BaseChunker(ABC):
     """Base class for document chunkers with built-in contextualization capability."""
 
@@ -78,22 +90,48 @@ class BaseChunker(ABC):
                 )
                 return ""
 
-    async def _contextualize_chunks(self, chunks: list[str], source: str) -> list[str]:
-        """Contextualize a list of document chunks."""
-        if not self.contextual_retrieval or len(chunks) < 2:
+    async def _contextualize_chunks(
+        self,
+        chunks: list[str],
+        source: str,
+        partition: str = "",
+        first_chunks: Optional[str] = None,
+        prev_chunk: str = "",
+    ) -> list[str]:
+        """
+        Contextualize a list of document chunks. `first_chunks` and `prev_chunk`
+        are given when the chunks follow others of the same document.
+        """
+        if not self.contextual_retrieval or not chunks:
             return chunks
+        if len(chunks) < 2 and first_chunks is None:
+            return chunks
+        with metrics.timer(
+            "contextualize", file_type=file_type(source), partition=partition
+        ):
+            return await self._generate_contexts(
+                chunks, source, first_chunks=first_chunks, prev_chunk=prev_chunk
+            )
 
+    async def _generate_contexts(
+        self,
+        chunks: list[str],
+        source: str,
+        first_chunks: Optional[str] = None,
+        prev_chunk: str = "",
+    ) -> list[str]:
+        if first_chunks is None:
+            first_chunks = "\n".join(chunks[:4])
         try:
             tasks = []
             for i in range(len(chunks)):
-                prev_chunk = chunks[i - 1] if i > 0 else ""
+                previous = chunks[i - 1] if i > 0 else prev_chunk
                 curr_chunk = chunks[i]
-                first_chunks = "\n".join(chunks[:4])
 
                 tasks.append(
                     self._generate_context(
                         first_chunks=first_chunks,
-                        prev_chunk=prev_chunk,
+                        prev_chunk=previous,
                         chunk=curr_chunk,
                         source=source,
                     )
@@ -120,6 +158,25 @@ class BaseChunker(ABC):
             logger.warning(f"Error when contextualizing chunks from `{source}`: {e}")
             return chunks
 
+    @staticmethod
+    def _chunk_metadata(metadata: dict, page_info: dict) -> dict:
+        """
+        Metadata of a chunk: the document's and the page it starts on. In
+        transcriptions, where each page is a speech segment (or a video
+        keyframe), the time ranges of its pages give the chunk its own time
+        range, in seconds.
+        """
+        chunk_metadata = {**metadata, "page": page_info["start_page"]}
+        segments = chunk_metadata.pop("segments", None)
+        if segments:
+            first = min(page_info["start_page"], len(segments))
+            last = min(page_info["end_page"], len(segments))
+            chunk_metadata["start_time"] = segments[first - 1][0]
+            chunk_metadata["end_time"] = max(
+                end for _, end in segments[first - 1 : last]
+            )
+        return chunk_metadata
+
     def _get_chunk_page_info(self, chunk_str: str, previous_page=1):
         """
         Determine the start and end pages for a text chunk containing [PAGE_N] separators.
@@ -158,6 +215,69 @@ class BaseChunker(ABC):
     async def split_document(self, doc: Document, task_id: str = None):
         pass
 
+    @abstractmethod
+    def _split(self, text: str) -> list[str]:
+        """Split a text into chunk strings."""
+
+    async def split_batch(
+        self,
+        doc: Document,
+        state: ChunkingState,
+        last: bool,
+        task_id: str = None,
+    ) -> list[Document]:
+        """
+        Chunk one page batch of a document streamed by its loader, the batches
+        being given in order with the same `state`.
+
+        The last chunk of a batch may be cut by the end of the batch: it is held
+        back and chunked again at the head of the next one, so that chunks (and
+        their overlap) come out as when chunking the whole document.
+        """
+        metadata = doc.metadata
+        source = metadata["source"]
+        text = (state.carry + doc.page_content).strip()
+        chunks = self._split(text) if text else []
+        state.carry = ""
+        if not last and chunks:
+            state.carry = chunks.pop() + "\n"
+        if not chunks:
+            return []
+
+        if state.first_chunks is None:
+            state.first_chunks = "\n".join(chunks[:4])
+        chunks_w_context = chunks
+        if self.contextual_retrieval:
+            chunks_w_context = await self._contextualize_chunks(
+                chunks,
+                source=source,
+                partition=metadata.get("partition"),
+                first_chunks=state.first_chunks,
+                prev_chunk=state.prev_chunk,
+            )
+        state.prev_chunk = chunks[-1]
+
+        filtered_chunks = []
+        for chunk, chunk_w_context in zip(chunks, chunks_w_context):
+            page_info = self._get_chunk_page_info(
+                chunk_str=chunk, previous_page=state.page
+            )
+            state.page = page_info["end_page"]
+
+            if len(chunk.strip()) > 3:
+                filtered_chunks.append(
+                    Document(
+                        page_content=chunk_w_context,
+                        metadata=self._chunk_metadata(metadata, page_info),
+                    )
+                )
+        logger.bind(
+            file_id=metadata.get("file_id"),
+            partition=metadata.get("partition"),
+            task_id=task_id,
+        ).debug("Page batch chunked", chunks=len(filtered_chunks), last=last)
+        return filtered_chunks
+
 
 class RecursiveSplitter(BaseChunker):
     """RecursiveSplitter splits documents into chunks using recursive character splitting."""
@@ -175,6 +295,9 @@ class RecursiveSplitter(BaseChunker):
             else len(x),
         )
 
+    def _split(self, text: str) -> list[str]:
+        return self.splitter.split_text(text)
+
     async def split_document(self, doc: Document, task_id: str = None):
         metadata = doc.metadata
         log = logger.bind(
@@ -190,7 +313,9 @@ class RecursiveSplitter(BaseChunker):
         chunks_w_context = chunks  # Default to original chunks if no contextualization
         if self.contextual_retrieval:
             log.info("Contextualizing chunks")
-            chunks_w_context = await self._contextualize_chunks(chunks, source=source)
+            chunks_w_context = await self._contextualize_chunks(
+                chunks, source=source, partition=metadata.get("partition")
+            )
 
         filtered_chunks = []
         prev_page_num = 1
@@ -198,7 +323,6 @@ class RecursiveSplitter(BaseChunker):
             page_info = self._get_chunk_page_info(
                 chunk_str=chunk, previous_page=prev_page_num
             )
-            start_page = page_info["start_page"]
             end_page = page_info["end_page"]
             prev_page_num = end_page
 
@@ -206,7 +330,7 @@ class RecursiveSplitter(BaseChunker):
                 filtered_chunks.append(
                     Document(
                         page_content=chunk_w_context,
-                        metadata={**metadata, "page": start_page},
+                        metadata=self._chunk_metadata(metadata, page_info),
                     )
                 )
         log.info("Document chunking completed")
@@ -235,6 +359,9 @@ class SemanticSplitter(BaseChunker):
             min_chunk_size=min_chunk_size,
         )
 
+    def _split(self, text: str) -> list[str]:
+        return self.splitter.split_text([text])
+
     async def split_document(self, doc: Document, task_id: str = None):
         metadata = doc.metadata
         log = logger.bind(
@@ -250,7 +377,9 @@ class SemanticSplitter(BaseChunker):
         chunks_w_context = chunks  # Default to original chunks if no contextualization
         if self.contextual_retrieval:
             log.info("Contextualizing chunks")
-            chunks_w_context = await self._contextualize_chunks(chunks, source=source)
+            chunks_w_context = await self._contextualize_chunks(
+                chunks, source=source, partition=metadata.get("partition")
+            )
 
         filtered_chunks = []
         prev_page_num = 1
@@ -258,7 +387,6 @@ class SemanticSplitter(BaseChunker):
             page_info = self._get_chunk_page_info(
                 chunk_str=chunk, previous_page=prev_page_num
             )
-            start_page = page_info["start_page"]
             end_page = page_info["end_page"]
             prev_page_num = end_page
 
@@ -266,7 +394,7 @@ class SemanticSplitter(BaseChunker):
                 filtered_chunks.append(
                     Document(
                         page_content=chunk_w_context,
-                        metadata={**metadata, "page": start_page},
+                        metadata=self._chunk_metadata(metadata, page_info),
                     )
                 )
         log.info("Document chunking completed")
@@ -361,6 +489,9 @@ class MarkDownSplitter(BaseChunker):
         splits = self.recurive_splitter.split_documents(md_splits_w_overlap)
         return [s.page_content for s in splits]
 
+    def _split(self, text: str) -> list[str]:
+        return self.split_text(text)
+
     async def split_document(self, doc: Document, task_id: str = None):
         metadata = doc.metadata
         log = logger.bind(
@@ -376,7 +507,9 @@ class MarkDownSplitter(BaseChunker):
         chunks_w_context = chunks  # Default to original chunks if no contextualization
         if self.contextual_retrieval:
             log.info("Contextualizing chunks")
-            chunks_w_context = await self._contextualize_chunks(chunks, source=source)
+            chunks_w_context = await self._contextualize_chunks(
+                chunks, source=source, partition=metadata.get("partition")
+            )
 
         filtered_chunks = []
         prev_page_num = 1
@@ -384,7 +517,6 @@ class MarkDownSplitter(BaseChunker):
             page_info = self._get_chunk_page_info(
                 chunk_str=chunk, previous_page=prev_page_num
             )
-            start_page = page_info["start_page"]
             end_page = page_info["end_page"]
             prev_page_num = end_page
 
@@ -392,7 +524,7 @@ class MarkDownSplitter(BaseChunker):
                 filtered_chunks.append(
                     Document(
                         page_content=chunk_w_context,
-                        metadata={**metadata, "page": start_page},
+                        metadata=self._chunk_metadata(metadata, page_info),
                     )
                 )
         log.info("Document chunking completed")
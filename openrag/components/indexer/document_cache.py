@@ -0,0 +1,273 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+import uuid
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Tuple
+
+import ray
+from config import load_config
+from langchain_core.documents.base import Document
+from omegaconf import OmegaConf
+
+config = load_config()
+DICT_MIMETYPES = dict(config.loader["mimetypes"])
+
+# Loader settings that only tune resources, not the produced markdown
+RESOURCE_KEYS = {
+    "marker_max_tasks_per_child",
+    "marker_pool_size",
+    "marker_max_processes",
+    "marker_min_processes",
+    "marker_num_gpus",
+    "marker_timeout",
+    "marker_split_min_pages",
+    "save_markdown",
+}
+# ... and sub-settings, by section
+RESOURCE_SUBKEYS = {
+    "image_encoding": {"workers"},
+    "page_streaming": {"prefetch"},
+    "transcription": {"cpu_threads", "num_gpus", "max_pending_segments"},
+}
+
+# Versions of the loaders' output, part of the cache key. Bump CACHE_VERSION
+# when a change to the code shared by the loaders (captioning, page markers...)
+# changes the markdown they produce, and the version of a loader when a change
+# to its own code does: the documents cached before are then parsed again.
+CACHE_VERSION = 1
+LOADER_OUTPUT_VERSIONS = {
+    "MarkItDownLoader": 2,  # embedded images captioned
+}
+
+
+def loader_name_for(config, path, metadata: Dict) -> Optional[str]:
+    """Name of the loader class the DocSerializer will pick for a file."""
+    file_loaders = config.loader["file_loaders"]
+    mimetype = metadata.get("mimetype", None)
+    if mimetype is None:
+        extension = Path(path).suffix
+    else:
+        extension = DICT_MIMETYPES.get(mimetype, "")
+    return file_loaders.get(extension.lstrip("."))
+
+
+def loader_config_hash(config, loader_name: str) -> str:
+    """
+    Fingerprint of everything that shapes a loader's output: its code version,
+    the loader settings, the captioning model and prompt.
+    """
+    loader_settings = {
+        k: v
+        for k, v in OmegaConf.to_container(config.loader, resolve=True).items()
+        if k not in RESOURCE_KEYS
+    }
+    for section, keys in RESOURCE_SUBKEYS.items():
+        if isinstance(loader_settings.get(section), dict):
+            loader_settings[section] = {
+                k: v for k, v in loader_settings[section].items() if k not in keys
+            }
+    prompt_path = Path(config.paths.prompts_dir) / config.prompt["image_describer"]
+    try:
+        prompt = prompt_path.read_text(encoding="utf-8")
+    except OSError:
+        prompt = str(prompt_path)
+    fingerprint = json.dumps(
+        {
+            "loader": loader_name,
+            "version": [CACHE_VERSION, LOADER_OUTPUT_VERSIONS.get(loader_name, 1)],
+            "settings": loader_settings,
+            "vlm": config.vlm.get("model"),
+            "prompt": prompt,
+        },
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(fingerprint.encode()).hexdigest()
+
+
+def make_cache_key(file_hash: str, loader_name: str, config_hash: str) -> str:
+    return hashlib.sha256(
+        f"{file_hash}:{loader_name}:{config_hash}".encode()
+    ).hexdigest()
+
+
+class CacheBackend(ABC):
+    """Byte store behind the DocumentCache. Implementations may block."""
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[bytes]:
+        pass
+
+    @abstractmethod
+    def put(self, key: str, data: bytes):
+        pass
+
+    @abstractmethod
+    def delete(self, key: str) -> int:
+        """Remove an entry, returning the number of bytes freed."""
+        pass
+
+    @abstractmethod
+    def entries(self) -> Iterator[Tuple[str, int, float]]:
+        """All `(key, size_in_bytes, last_access_time)` entries."""
+        pass
+
+
+class LocalDiskBackend(CacheBackend):
+    """One file per entry under `root`; the mtime records the last access."""
+
+    def __init__(self, root: str, **kwargs):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            return None
+        os.utime(path)
+        return data
+
+    def put(self, key: str, data: bytes):
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+        tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex}")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+
+    def delete(self, key: str) -> int:
+        path = self._path(key)
+        try:
+            size = path.stat().st_size
+            path.unlink()
+        except FileNotFoundError:
+            return 0
+        return size
+
+    def entries(self) -> Iterator[Tuple[str, int, float]]:
+        for path in self.root.glob("*/*.json"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            yield path.stem, stat.st_size, stat.st_mtime
+
+
+CACHE_BACKENDS = {"local": LocalDiskBackend}
+
+
+@ray.remote(max_concurrency=100)
+class DocumentCache:
+    """
+    Persistent cache of serialized documents (markdown with page markers and
+    captions), keyed by (file hash, loader class, loader config hash).
+
+    Least recently used entries are evicted once the cache exceeds
+    `document_cache.max_size_mb`.
+    """
+
+    def __init__(self):
+        from utils.logger import get_logger
+
+        self.config = load_config()
+        self.logger = get_logger()
+        cache_config = self.config.document_cache
+        self.enabled = cache_config.enable
+        self.max_size = int(cache_config.max_size_mb * 1024 * 1024)
+        root = (
+            cache_config.path
+            or Path(self.config.paths.state_dir) / "cache" / "serialized"
+        )
+
+        backend_cls = CACHE_BACKENDS.get(cache_config.backend)
+        if backend_cls is None:
+            raise ValueError(
+                f"Unknown document cache backend '{cache_config.backend}'. "
+                f"Available: {', '.join(CACHE_BACKENDS)}"
+            )
+        self.backend: CacheBackend = backend_cls(root=root)
+
+        # key -> (size, last access), to evict without listing the backend
+        self._index: Dict[str, Tuple[int, float]] = {
+            key: (size, atime) for key, size, atime in self.backend.entries()
+        }
+        self._size = sum(size for size, _ in self._index.values())
+        self._lock = asyncio.Lock()
+        self.hits = self.misses = self.puts = self.evictions = 0
+        self.logger.info(
+            "DocumentCache initialized.",
+            backend=cache_config.backend,
+            entries=len(self._index),
+            size_mb=round(self._size / 1024 / 1024, 2),
+        )
+
+    async def get(self, key: str) -> Optional[Document]:
+        if not self.enabled:
+            return None
+        data = await asyncio.to_thread(self.backend.get, key)
+        if data is None:
+            self.misses += 1
+            async with self._lock:
+                entry = self._index.pop(key, None)
+                if entry is not None:
+                    self._size -= entry[0]
+            return None
+        self.hits += 1
+        if key in self._index:
+            self._index[key] = (self._index[key][0], time.time())
+        entry = json.loads(data)
+        return Document(page_content=entry["page_content"], metadata=entry["metadata"])
+
+    async def put(self, key: str, doc: Document, exclude_keys=()):
+        """
+        Store a loader output. `exclude_keys` are the per-upload metadata fields
+        (file id, partition, ...), which are not part of it.
+        """
+        if not self.enabled:
+            return
+        metadata = {k: v for k, v in doc.metadata.items() if k not in exclude_keys}
+        data = json.dumps(
+            {"page_content": doc.page_content, "metadata": metadata}, default=str
+        ).encode()
+        if len(data) > self.max_size:
+            return
+        await asyncio.to_thread(self.backend.put, key, data)
+        async with self._lock:
+            previous = self._index.get(key)
+            self._size += len(data) - (previous[0] if previous else 0)
+            self._index[key] = (len(data), time.time())
+            self.puts += 1
+            await self._evict()
+
+    async def _evict(self):
+        if self._size <= self.max_size:
+            return
+        for key, _ in sorted(self._index.items(), key=lambda item: item[1][1]):
+            if self._size <= self.max_size:
+                break
+            freed = await asyncio.to_thread(self.backend.delete, key)
+            size, _ = self._index.pop(key)
+            self._size -= freed or size
+            self.evictions += 1
+
+    async def get_stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._index),
+            "size_bytes": self._size,
+            "max_size_bytes": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "puts": self.puts,
+            "evictions": self.evictions,
+        }
@@ -1,24 +1,40 @@
 import asyncio
+import concurrent.futures
 import gc
 import os
+import threading
+import time
 import traceback
+from collections import Counter, OrderedDict, deque
 from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from functools import partial
+from itertools import islice
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Union
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, Union
 
 import ray
 import torch
 from config import load_config
 from langchain_core.documents.base import Document
 from langchain_openai import OpenAIEmbeddings
+from omegaconf import OmegaConf
+from utils.metrics import file_type, metrics
 
+from .checkpoints import CheckpointStore, checkpoint_key
 from .chunker import BaseChunker, ChunkerFactory
+from .document_cache import loader_config_hash, loader_name_for, make_cache_key
+from .stages import IndexingJob, PipelineStage, StreamedFile
+from .task_store import TERMINAL_STATES
+from .vectordb.vectordb import CHUNK_METADATA_KEYS
 
 config = load_config()
 save_uploaded_files = os.environ.get("SAVE_UPLOADED_FILES", "true").lower() == "true"
 
-POOL_SIZE = config.ray.get("pool_size")
-MAX_TASKS_PER_WORKER = config.ray.get("max_tasks_per_worker")
+# seconds between purges of the checkpoints left by failed tasks
+CHECKPOINT_PURGE_INTERVAL = 3600
+# seconds before task states that failed to be written are written again
+TASK_STORE_RETRY_SECONDS = 5
 
 
 @ray.remote(
@@ -28,16 +44,25 @@ MAX_TASKS_PER_WORKER = config.ray.get("max_tasks_per_worker")
         "update": config.ray.indexer.concurrency_groups["update"],
         "search": config.ray.indexer.concurrency_groups["search"],
         "delete": config.ray.indexer.concurrency_groups["delete"],
-        "insert": config.ray.indexer.concurrency_groups["insert"],
-        "chunk": config.ray.indexer.concurrency_groups["chunk"],
+        "stats": config.ray.indexer.concurrency_groups["stats"],
+        "reindex": config.ray.indexer.concurrency_groups["reindex"],
     },
 )
 class Indexer:
     def __init__(self):
+        from utils.file_store import FileStore
         from utils.logger import get_logger
 
         self.config = load_config()
         self.logger = get_logger()
+        self.file_store = FileStore(self.config.paths.data_dir)
+
+        self.document_cache = ray.get_actor("DocumentCache", namespace="openrag")
+        self._loader_config_hashes: Dict[str, str] = {}
+        # cache key -> future resolved once its serialization attempt is over.
+        # Thread-safe futures: add_file and reindex_partition run in different
+        # concurrency groups, that is on different event loops.
+        self._serializing: Dict[str, concurrent.futures.Future] = {}
 
         self.embedder = OpenAIEmbeddings(
             model=self.config.embedder.get("model_name"),
@@ -60,26 +85,100 @@ class Indexer:
         self.enable_insertion = self.config.vectordb["enable"]
         self.handle = ray.get_actor("Indexer", namespace="openrag")
         self.serialize_timeout = self.config.ray.indexer.serialize_timeout
+        # long documents go down the stages in page batches, as they are parsed
+        self.page_streaming = bool(self.config.loader.page_streaming.batch_pages)
+
+        # Stages after serialization (which is handled by the SerializerQueue
+        # pool); their workers are started by the first add_file call, on the
+        # event loop of the default concurrency group.
+        self.pipeline_config = self.config.ray.indexer.pipeline
+        queue_size = self.pipeline_config.queue_size
+        self.stages: Dict[str, PipelineStage] = {
+            "chunk": PipelineStage(
+                "chunk",
+                self._chunk_stage,
+                workers=self.pipeline_config.chunk_workers,
+                queue_size=queue_size,
+                logger=self.logger,
+            ),
+            "embed": PipelineStage(
+                "embed",
+                self._embed_stage,
+                workers=self.pipeline_config.embed_workers,
+                queue_size=queue_size,
+                logger=self.logger,
+            ),
+            "insert": PipelineStage(
+                "insert",
+                self._insert_stage,
+                workers=self.pipeline_config.insert_workers,
+                queue_size=queue_size,
+                logger=self.logger,
+            ),
+        }
+        self._stages_started = False
+        self.max_reindex_rate = self.config.ray.indexer.reindex.max_chunks_per_second
+        self._reindexing: set[str] = set()
+
+        checkpoint_config = self.config.ray.indexer.checkpoints
+        self.checkpoints: Optional[CheckpointStore] = None
+        if checkpoint_config.enable:
+            self.checkpoints = CheckpointStore(
+                checkpoint_config.path
+                or Path(self.config.paths.state_dir) / "checkpoints",
+                max_age_hours=checkpoint_config.max_age_hours,
+            )
+        self._checkpoint_purger: Optional[asyncio.Task] = None
+
+        # add_file calls in progress: task_id -> (their event loop, their task)
+        self._running: Dict[str, Tuple[asyncio.AbstractEventLoop, asyncio.Task]] = {}
+        # tasks cancelled, possibly before their add_file call started
+        self._cancelled: set[str] = set()
         self.logger.info("Indexer actor initialized.")
 
+    def _start_stages(self):
+        """
+        Start the stage workers, on the event loop of the default concurrency
+        group. Ray runs each concurrency group on a loop of its own: the stages
+        must only be started (and fed) from the methods of the default group,
+        like add_file, or their jobs would be served by a loop nobody awaits.
+        """
+        if self._stages_started:
+            return
+        self._stages_started = True
+        for stage in self.stages.values():
+            stage.start()
+        if self.checkpoints is not None:
+            self._checkpoint_purger = asyncio.create_task(self._purge_checkpoints())
+        self.logger.info(
+            "Indexing stages started.",
+            **{name: stage.workers for name, stage in self.stages.items()},
+        )
+
     async def serialize(
         self,
         task_id: str,
         path: str,
         metadata: Optional[Dict] = {},
+        priority: str = "interactive",
     ) -> Document:
         import ray
         from ray.exceptions import TaskCancelledError
 
         # Kick off the remote task
         future = self.serializer_queue.submit_document.remote(
-            task_id, path, metadata=metadata
+            task_id, path, metadata=metadata, priority=priority
         )
 
         # Wait for it to complete, with timeout
-        ready, _ = await asyncio.to_thread(
-            ray.wait, [future], timeout=self.serialize_timeout
-        )
+        try:
+            ready, _ = await asyncio.to_thread(
+                ray.wait, [future], timeout=self.serialize_timeout
+            )
+        except asyncio.CancelledError:
+            # frees the serializer slot, or the place in its queue
+            ray.cancel(future, recursive=True)
+            raise
 
         if ready:
             try:
@@ -100,24 +199,323 @@ class Indexer:
                 f"Serialization task {task_id} timed out after {self.serialize_timeout} seconds"
             )
 
-    @ray.method(concurrency_group="chunk")
-    async def chunk(
-        self, doc: Document, file_path: str, task_id: str = None
-    ) -> List[Document]:
-        chunks = await self.chunker.split_document(doc, task_id)
-        return chunks
+    async def _serialize_streamed(
+        self,
+        task_id: str,
+        path: str,
+        metadata: Dict,
+        on_batch: Callable[[Document], Awaitable[None]],
+        priority: str = "interactive",
+    ) -> Document:
+        """
+        Serialize a file through the page batches of its loader, handing each
+        to `on_batch` as it comes. Returns the whole document.
+        """
+        from ray.exceptions import TaskCancelledError
+
+        batches = self.serializer_queue.submit_pages.remote(
+            task_id, path, metadata=metadata, priority=priority
+        )
+        parts = []
+        doc_metadata = metadata
+        try:
+            async with asyncio.timeout(self.serialize_timeout):
+                async for ref in batches:
+                    batch = await ref
+                    parts.append(batch.page_content)
+                    doc_metadata = batch.metadata
+                    await on_batch(batch)
+        except TimeoutError:
+            self.logger.warning(
+                f"Timeout: cancelling task {task_id} after {self.serialize_timeout}s"
+            )
+            ray.cancel(batches, recursive=True)
+            raise TimeoutError(
+                f"Serialization task {task_id} timed out after {self.serialize_timeout} seconds"
+            )
+        except asyncio.CancelledError:
+            # frees the serializer slot, or the place in its queue
+            ray.cancel(batches, recursive=True)
+            raise
+        except TaskCancelledError:
+            self.logger.warning(f"Task {task_id} was cancelled")
+            raise
+        except Exception as e:
+            self.logger.exception(f"Task {task_id} failed with error: {e}")
+            ray.cancel(batches, recursive=True)
+            raise
+        return Document(page_content="".join(parts).strip(), metadata=doc_metadata)
+
+    def _cache_key(self, path: str, metadata: Dict) -> Optional[str]:
+        """Document cache key of a file: (content hash, loader, loader config)."""
+        sha256 = metadata.get("sha256")
+        loader_name = loader_name_for(self.config, path, metadata)
+        if sha256 is None or loader_name is None:
+            return None
+        if loader_name not in self._loader_config_hashes:
+            self._loader_config_hashes[loader_name] = loader_config_hash(
+                self.config, loader_name
+            )
+        return make_cache_key(
+            sha256, loader_name, self._loader_config_hashes[loader_name]
+        )
+
+    async def _serialize_or_reuse(
+        self,
+        task_id: str,
+        path: str,
+        metadata: Dict,
+        log,
+        priority: str = "interactive",
+        on_batch: Optional[Callable[[Document], Awaitable[None]]] = None,
+    ) -> Document:
+        """
+        Serialize a file, unless the document cache holds the output of the same
+        loader, with the same settings, for the same content.
+
+        Uploads of a content that is being serialized wait for that serialization
+        instead of starting their own, so identical files are parsed only once.
+        With `on_batch`, the page batches of the loader are handed to it as they
+        are parsed; a document found in the cache is only returned.
+        """
+        serialize = self.serialize
+        if on_batch is not None:
+            serialize = partial(self._serialize_streamed, on_batch=on_batch)
+
+        key = self._cache_key(path, metadata)
+        if key is None:
+            return await serialize(task_id, path, metadata=metadata, priority=priority)
+
+        pending = self._serializing.get(key)
+        if pending is not None:
+            # shielded: a waiter cancelled must not cancel the shared future
+            await asyncio.shield(asyncio.wrap_future(pending))
+
+        cached = await self.document_cache.get.remote(key)
+        if cached is not None:
+            log.info("Serialized document found in cache.")
+            return Document(
+                page_content=cached.page_content,
+                metadata={**cached.metadata, **metadata},
+            )
+
+        done = concurrent.futures.Future()
+        self._serializing[key] = done
+        try:
+            doc = await serialize(task_id, path, metadata=metadata, priority=priority)
+            await self.document_cache.put.remote(key, doc, exclude_keys=set(metadata))
+            return doc
+        finally:
+            if self._serializing.get(key) is done:
+                del self._serializing[key]
+            done.set_result(None)
+
+    async def _purge_checkpoints(self):
+        while True:
+            try:
+                deleted = await asyncio.to_thread(self.checkpoints.purge)
+                if deleted:
+                    self.logger.info(
+                        "Purged stale indexing checkpoints.", deleted=deleted
+                    )
+            except Exception:
+                self.logger.exception("Failed to purge indexing checkpoints.")
+            await asyncio.sleep(CHECKPOINT_PURGE_INTERVAL)
+
+    async def _load_checkpoint(self, key: Optional[str], log) -> Dict[str, Any]:
+        if key is None:
+            return {}
+        try:
+            return await asyncio.to_thread(self.checkpoints.load, key) or {}
+        except Exception:
+            log.exception("Ignoring an unreadable indexing checkpoint.")
+            return {}
+
+    async def _save_checkpoint(self, job: IndexingJob, stage: str, **output):
+        """Best effort: a failed write only costs the ability to resume."""
+        if job.checkpoint is None:
+            return
+        try:
+            await asyncio.to_thread(
+                self.checkpoints.save, job.checkpoint, stage, **output
+            )
+        except Exception:
+            job.log.exception("Failed to checkpoint the indexing task.", stage=stage)
+
+    async def _clear_checkpoint(self, key: Optional[str]):
+        if key is None:
+            return
+        try:
+            await asyncio.to_thread(self.checkpoints.clear, key)
+        except Exception:
+            self.logger.exception("Failed to remove an indexing checkpoint.")
+
+    async def _chunk_stage(self, job: IndexingJob):
+        await self.task_state_manager.set_state.remote(job.task_id, "CHUNKING")
+        with metrics.timer("chunk", **job.labels):
+            if job.stream is None:
+                job.chunks = await self.chunker.split_document(job.doc, job.task_id)
+            else:
+                job.chunks = await job.stream.split(self.chunker, job)
+        job.doc = None  # the chunks carry everything downstream stages need
+        metrics.inc("openrag_chunks_total", len(job.chunks), **job.labels)
+        chunks = len(job.chunks)
+        if job.stream is not None:
+            job.stream.chunks += chunks
+            chunks = job.stream.chunks
+        await self.task_state_manager.set_progress.remote(job.task_id, chunks=chunks)
+
+        if not (self.enable_insertion and job.chunks):
+            job.log.info(
+                f"Vectordb insertion skipped (enable_insertion={self.enable_insertion})."
+            )
+            job.future.set_result(True)
+            return
+        await self._save_checkpoint(job, "chunked", chunks=job.chunks)
+        await self.stages["embed"].put(job)
+
+    async def _embed_stage(self, job: IndexingJob):
+        await self.task_state_manager.set_state.remote(job.task_id, "EMBEDDING")
+        with metrics.timer("embed", **job.labels):
+            job.embeddings = await self.embedder.aembed_documents(
+                [chunk.page_content for chunk in job.chunks]
+            )
+        embedded = len(job.embeddings)
+        if job.stream is not None:
+            job.stream.embedded += embedded
+            embedded = job.stream.embedded
+        await self.task_state_manager.set_progress.remote(
+            job.task_id, chunks_embedded=embedded
+        )
+        await self._save_checkpoint(
+            job, "embedded", chunks=job.chunks, embeddings=job.embeddings
+        )
+        await self.stages["insert"].put(job)
+
+    async def _insert_stage(self, job: IndexingJob):
+        await self.task_state_manager.set_state.remote(job.task_id, "INSERTING")
+        insert = asyncio.ensure_future(
+            self.vectordb.async_add_documents.remote(
+                job.chunks,
+                embeddings=job.embeddings,
+                # a streamed file is registered once all its batches are in
+                register=job.stream is None,
+            )
+        )
+        try:
+            await asyncio.shield(insert)
+        except asyncio.CancelledError:
+            # let the write land, then take it back
+            await asyncio.gather(insert, return_exceptions=True)
+            await self._remove_partial_insert(job)
+            raise
+        if job.stream is None:
+            job.log.info(f"Document {job.path} indexed successfully")
+        else:
+            if job.stream.file_metadata is None:
+                job.stream.file_metadata = {
+                    k: v
+                    for k, v in job.chunks[0].metadata.items()
+                    if k not in CHUNK_METADATA_KEYS
+                }
+            job.log.debug("Page batch indexed", batch=job.batch)
+            job.chunks, job.embeddings = [], None
+        job.future.set_result(True)
+
+    async def _remove_partial_insert(self, job: IndexingJob):
+        file_id = job.metadata.get("file_id")
+        if job.stream is not None:
+            try:
+                await self.vectordb.discard_file_chunks.remote(file_id, job.partition)
+                job.log.info("Removed the chunks of the interrupted file.")
+            except Exception:
+                job.log.exception(
+                    "Failed to remove the chunks of the interrupted file."
+                )
+            return
+        try:
+            points = await self.vectordb.get_file_points.remote(file_id, job.partition)
+            if points:
+                await self.vectordb.delete_file_points.remote(
+                    points, file_id, job.partition
+                )
+                job.log.info("Removed the chunks of the cancelled file.")
+        except Exception:
+            job.log.exception("Failed to remove the chunks of the cancelled file.")
+
+    async def _on_batch(self, job: IndexingJob, stream: StreamedFile, batch: Document):
+        """
+        Send the previous page batch down the stages: a batch is held until the
+        next one comes, so that a document parsed in one batch is indexed whole.
+        """
+        error = stream.failure()
+        if error is not None:
+            raise error
+        if stream.pending is not None:
+            await self._put_batch(job, stream, stream.pending, last=False)
+        stream.pending = batch
+
+    async def _put_batch(
+        self, job: IndexingJob, stream: StreamedFile, batch: Document, last: bool
+    ):
+        job.stream = stream
+        batch_job = IndexingJob(
+            task_id=job.task_id,
+            path=job.path,
+            metadata=job.metadata,
+            partition=job.partition,
+            log=job.log,
+            future=asyncio.get_running_loop().create_future(),
+            doc=batch,
+            labels=job.labels,
+            stream=stream,
+            batch=len(stream.futures),
+            last_batch=last,
+        )
+        stream.futures.append(batch_job.future)
+        await self.stages["chunk"].put(batch_job)
+
+    async def _finish_stream(self, job: IndexingJob, stream: StreamedFile):
+        """Send the last page batch, wait for all of them, then register the file."""
+        await self._put_batch(job, stream, stream.pending, last=True)
+        stream.pending = None
+        await asyncio.gather(*stream.futures)
+        if stream.file_metadata is not None:
+            await self.vectordb.register_file.remote(stream.file_metadata)
+        job.log.info(
+            f"Document {job.path} indexed successfully", batches=len(stream.futures)
+        )
+        job.future.set_result(True)
+
+    async def _abort_stream(self, job: IndexingJob, stream: StreamedFile):
+        """Stop the page batches still in the stages, and remove the ones inserted."""
+        if not stream.futures:
+            return
+        for future in stream.futures:
+            future.cancel()
+        if self.enable_insertion:
+            await self._remove_partial_insert(job)
 
     async def add_file(
         self,
         path: Union[str, List[str]],
         metadata: Optional[Dict] = {},
         partition: Optional[str] = None,
+        priority: str = "interactive",
     ):
         task_id = ray.get_runtime_context().get_task_id()
         file_id = metadata.get("file_id", None)
         log = self.logger.bind(file_id=file_id, partition=partition, task_id=task_id)
         log.info("Queued file for indexing.")
+        self._start_stages()
+        labels = {"file_type": file_type(path, metadata), "partition": partition}
+        job = None
+        checkpoint = None
+        stream = None
+        self._running[task_id] = (asyncio.get_running_loop(), asyncio.current_task())
         try:
+            if task_id in self._cancelled:
+                raise asyncio.CancelledError
             await self.task_state_manager.set_state.remote(task_id, "QUEUED")
 
             # Set task details
@@ -129,59 +527,180 @@ class Indexer:
                 task_id,
                 file_id=metadata.get("file_id"),
                 partition=partition,
+                priority=priority,
                 metadata=user_metadata,
             )
 
             # Check/normalize partition
             partition = self._check_partition_str(partition)
             metadata = {**metadata, "partition": partition}
+            labels["partition"] = partition
 
-            # Serialize
-            doc = await self.serialize(task_id, path, metadata=metadata)
+            # A retried or resubmitted upload resumes after its last
+            # checkpointed stage
+            if self.checkpoints is not None:
+                checkpoint = checkpoint_key(metadata)
+            resumed = await self._load_checkpoint(checkpoint, log)
+            stage = resumed.get("stage")
+            if stage is not None:
+                log.info("Resuming indexing from checkpoint.", stage=stage)
 
-            # Chunk
-            await self.task_state_manager.set_state.remote(task_id, "CHUNKING")
-            chunks = await self.handle.chunk.remote(doc, str(path), task_id)
+            labels["loader"] = loader_name_for(self.config, path, metadata)
+            job = IndexingJob(
+                task_id=task_id,
+                path=str(path),
+                metadata=metadata,
+                partition=partition,
+                log=log,
+                future=asyncio.get_running_loop().create_future(),
+                doc=resumed.get("doc"),
+                chunks=resumed.get("chunks", []),
+                embeddings=resumed.get("embeddings"),
+                labels=labels,
+                checkpoint=checkpoint,
+            )
 
-            if self.enable_insertion and chunks:
-                await self.task_state_manager.set_state.remote(task_id, "INSERTING")
-                await self.handle.insert_documents.remote(chunks)
-                log.info(f"Document {path} indexed successfully")
-            else:
-                log.info(
-                    f"Vectordb insertion skipped (enable_insertion={self.enable_insertion})."
+            if stage is None:
+                # Serialize: the SerializerQueue pool is the first stage
+                on_batch = None
+                if self.page_streaming:
+                    stream = StreamedFile()
+                    on_batch = partial(self._on_batch, job, stream)
+                job.doc = await self._serialize_or_reuse(
+                    task_id, path, metadata, log, priority=priority, on_batch=on_batch
                 )
+                if stream is not None and not stream.futures:
+                    stream = None  # parsed in one batch: indexed as usual
+                if stream is None:
+                    await self._save_checkpoint(job, "serialized", doc=job.doc)
+
+            # Hand over to the chunk -> embed -> insert stages
+            if stream is not None:
+                # the first batches are already on their way
+                job.doc = None
+                await self._finish_stream(job, stream)
+            elif stage == "embedded" and await self.vectordb.file_exists.remote(
+                metadata.get("file_id"), partition
+            ):
+                # the insert went through before the task was interrupted
+                job.future.set_result(True)
+            elif stage == "embedded":
+                await self.stages["insert"].put(job)
+            elif stage == "chunked":
+                await self.stages["embed"].put(job)
+            else:
+                await self.stages["chunk"].put(job)
+            await job.future
 
             # Mark task as completed
             await self.task_state_manager.set_state.remote(task_id, "COMPLETED")
+            metrics.inc("openrag_files_total", status="completed", **labels)
+            await self._clear_checkpoint(checkpoint)
+
+        except asyncio.CancelledError:
+            if task_id not in self._cancelled:
+                raise
+            log.info(f"Task {task_id} cancelled")
+            if job is not None:
+                # stops the stage working on it, and skips the next ones
+                job.future.cancel()
+            if stream is not None:
+                await self._abort_stream(job, stream)
+            await self.task_state_manager.set_state.remote(task_id, "CANCELLED")
+            metrics.inc("openrag_files_total", status="cancelled", **labels)
+            await self._clear_checkpoint(checkpoint)
+            return False
 
         except Exception as e:
             log.exception(f"Task {task_id} failed in add_file")
+            if stream is not None:
+                await self._abort_stream(job, stream)
             tb = "".join(traceback.format_exception(type(e), e, e.__traceback__))
             await self.task_state_manager.set_state.remote(task_id, "FAILED")
             await self.task_state_manager.set_error.remote(task_id, tb)
+            metrics.inc("openrag_files_total", status="failed", **labels)
             raise
 
         finally:
+            self._running.pop(task_id, None)
+            self._cancelled.discard(task_id)
             if torch.cuda.is_available():
                 gc.collect()
                 torch.cuda.empty_cache()
                 torch.cuda.ipc_collect()
             try:
-                # Cleanup input file
-                if not save_uploaded_files:
-                    Path(path).unlink(missing_ok=True)
-                    log.debug(f"Deleted input file: {path}")
+                # Release the stored upload: the content itself goes with its
+                # last reference, as other partitions may share it
+                if not save_uploaded_files and file_id is not None:
+                    await asyncio.to_thread(self.file_store.release, partition, file_id)
+                    log.debug(f"Released input file: {path}")
             except Exception as cleanup_err:
-                log.warning(f"Failed to delete input file {path}: {cleanup_err}")
+                log.warning(f"Failed to release input file {path}: {cleanup_err}")
         return True
 
-    @ray.method(concurrency_group="insert")
-    async def insert_documents(self, chunks):
-        await self.vectordb.async_add_documents.remote(chunks)
+    @ray.method(concurrency_group="delete")
+    async def cancel_tasks(self, task_ids: List[str]) -> List[str]:
+        """
+        Cancel indexing tasks, wherever they are: waiting for the serializer
+        (their place is given up), being parsed (the loader, its VLM calls and
+        its Marker process are stopped), or in a later stage (chunks inserted so
+        far are removed). Returns the ids of the tasks cancelled; finished
+        tasks and reindexing jobs are left alone.
+        """
+        cancelled = []
+        for task_id in task_ids:
+            state = await self.task_state_manager.get_state.remote(task_id)
+            if state is None or state in TERMINAL_STATES or state == "REINDEXING":
+                continue
+            cancelled.append(task_id)
+            if task_id in self._cancelled:
+                continue
+            # add_file checks the flag once registered, and we check the
+            # registry once flagged: either side sees the other
+            self._cancelled.add(task_id)
+            running = self._running.get(task_id)
+            if running is not None:
+                loop, task = running
+                loop.call_soon_threadsafe(task.cancel)
+        if cancelled:
+            self.logger.info("Cancelled indexing tasks.", count=len(cancelled))
+        return cancelled
+
+    @ray.method(concurrency_group="stats")
+    async def get_pipeline_stats(self) -> Dict[str, Dict[str, int]]:
+        """
+        Per-stage worker and queue depth figures, in pipeline order (all zeros
+        until the first file is added).
+        """
+        stats = {"serialize": await self.serializer_queue.get_stats.remote()}
+        stats.update({name: stage.stats() for name, stage in self.stages.items()})
+        return stats
+
+    @ray.method(concurrency_group="stats")
+    async def is_saturated(self) -> bool:
+        """
+        Whether new uploads should be refused for now.
+
+        True when the serialization backlog reached `max_queued_files`, or when
+        serialized documents are piling up in front of a full chunk stage
+        (i.e. a downstream stage is the bottleneck).
+        """
+        serializer_stats = await self.serializer_queue.get_stats.remote()
+        if serializer_stats["queued"] >= self.pipeline_config.max_queued_files:
+            return True
+        chunk_stats = self.stages["chunk"].stats()
+        return chunk_stats["waiting"] >= chunk_stats["capacity"]
 
     @ray.method(concurrency_group="delete")
-    async def delete_file(self, file_id: str, partition: str) -> bool:
+    async def delete_file(
+        self, file_id: str, partition: str, keep_source: bool = False
+    ) -> bool:
+        """
+        Remove a file from a partition.
+
+        Its reference to the stored upload is released too, unless `keep_source`
+        is set (the file is being re-indexed from the same source).
+        """
         log = self.logger.bind(file_id=file_id, partition=partition)
 
         if not self.enable_insertion:
@@ -195,6 +714,8 @@ class Indexer:
                 return False
 
             await self.vectordb.delete_file_points.remote(points, file_id, partition)
+            if not keep_source:
+                await asyncio.to_thread(self.file_store.release, partition, file_id)
 
             log.info("Deleted file from partition.")
             return True
@@ -202,6 +723,156 @@ class Indexer:
             log.exception("Error in delete_file")
             raise
 
+    @ray.method(concurrency_group="stats")
+    async def is_reindexing(self, partition: str) -> bool:
+        return partition in self._reindexing
+
+    @ray.method(concurrency_group="reindex")
+    async def reindex_partition(
+        self, partition: str, chunker_params: Optional[Dict] = None
+    ) -> Dict[str, int]:
+        """
+        Re-chunk and re-embed every file of a partition into a shadow partition,
+        then switch reads over to it at once.
+
+        Documents come from the document cache (re-serialized from the stored
+        source on a miss), so no OCR or captioning is paid again. `chunker_params`
+        override the `chunker` config for this job. The throughput is capped at
+        `ray.indexer.reindex.max_chunks_per_second`; progress and ETA are
+        published in the task details.
+        """
+        task_id = ray.get_runtime_context().get_task_id()
+        log = self.logger.bind(partition=partition, task_id=task_id)
+        if partition in self._reindexing:
+            raise ValueError(f"Partition `{partition}` is already being reindexed")
+        self._reindexing.add(partition)
+
+        chunker = self.chunker
+        if chunker_params:
+            chunker = ChunkerFactory.create_chunker(
+                OmegaConf.merge(self.config, {"chunker": chunker_params}),
+                embedder=self.embedder,
+            )
+
+        await self.task_state_manager.set_state.remote(task_id, "REINDEXING")
+        await self.task_state_manager.set_details.remote(
+            task_id,
+            file_id=None,
+            partition=partition,
+            priority="bulk",
+            metadata={"chunker": chunker_params or {}},
+        )
+        shadow = None
+        # Skipped files are left to the cutover, which carries their chunks over
+        done: List[str] = []
+        skipped: List[str] = []
+        chunks_written = 0
+        started = time.monotonic()
+        try:
+            shadow = await self.vectordb.create_shadow_partition.remote(partition)
+            log.info("Reindex started.", shadow=shadow)
+
+            # Files added meanwhile show up in the next listing
+            while True:
+                files = await self.vectordb.list_partition_files.remote(partition)
+                todo = [
+                    file_id
+                    for file_id in files
+                    if file_id not in done and file_id not in skipped
+                ]
+                if not todo:
+                    break
+                total = len(done) + len(skipped) + len(todo)
+                for file_id in todo:
+                    written = await self._reindex_file(
+                        task_id, files[file_id], shadow, chunker, log
+                    )
+                    if written is None:
+                        skipped.append(file_id)
+                    else:
+                        chunks_written += written
+                        done.append(file_id)
+                    await self._throttle_reindex(chunks_written, started)
+
+                    processed = len(done) + len(skipped)
+                    elapsed = time.monotonic() - started
+                    await self.task_state_manager.set_progress.remote(
+                        task_id,
+                        done=processed,
+                        total=total,
+                        skipped=len(skipped),
+                        chunks=chunks_written,
+                        eta_seconds=round(elapsed / processed * (total - processed)),
+                    )
+
+            result = await self.vectordb.cutover_partition.remote(partition, done)
+            await self.task_state_manager.set_state.remote(task_id, "COMPLETED")
+            log.info(
+                "Reindex completed.",
+                files=len(done),
+                skipped=len(skipped),
+                chunks=chunks_written,
+                **result,
+            )
+            return {
+                "files": len(done),
+                "skipped": len(skipped),
+                "chunks": chunks_written,
+            }
+
+        except Exception as e:
+            log.exception("Reindex failed")
+            if shadow is not None:
+                await self.vectordb.drop_shadow_partition.remote(partition)
+            tb = "".join(traceback.format_exception(type(e), e, e.__traceback__))
+            await self.task_state_manager.set_state.remote(task_id, "FAILED")
+            await self.task_state_manager.set_error.remote(task_id, tb)
+            raise
+        finally:
+            self._reindexing.discard(partition)
+
+    async def _reindex_file(
+        self,
+        task_id: str,
+        metadata: Dict,
+        shadow: str,
+        chunker: BaseChunker,
+        log,
+    ) -> Optional[int]:
+        """Chunk, embed and write one file into the shadow partition; None if skipped."""
+        path = metadata.get("source")
+        key = self._cache_key(path, metadata) if path else None
+        doc = await self.document_cache.get.remote(key) if key else None
+        if doc is not None:
+            doc.metadata = {**doc.metadata, **metadata}
+        elif path and Path(path).exists():
+            doc = await self._serialize_or_reuse(
+                task_id, path, metadata, log, priority="bulk"
+            )
+        else:
+            log.warning(
+                "No serialized output nor source for file, keeping it out of the reindex.",
+                file_id=metadata.get("file_id"),
+            )
+            return None
+
+        doc.metadata["partition"] = shadow
+        chunks = await chunker.split_document(doc, task_id)
+        if not chunks:
+            return 0
+        embeddings = await self.embedder.aembed_documents(
+            [chunk.page_content for chunk in chunks]
+        )
+        await self.vectordb.add_shadow_chunks.remote(chunks, embeddings)
+        return len(chunks)
+
+    async def _throttle_reindex(self, chunks_written: int, started: float):
+        if self.max_reindex_rate <= 0:
+            return
+        ahead = chunks_written / self.max_reindex_rate - (time.monotonic() - started)
+        if ahead > 0:
+            await asyncio.sleep(ahead)
+
     @ray.method(concurrency_group="update")
     async def update_file_metadata(self, file_id: str, metadata: Dict, partition: str):
         log = self.logger.bind(file_id=file_id, partition=partition)
@@ -217,7 +888,7 @@ class Indexer:
             for doc in docs:
                 doc.metadata.update(metadata)
 
-            await self.delete_file(file_id, partition)
+            await self.delete_file(file_id, partition, keep_source=True)
             await self.vectordb.async_add_documents.remote(docs)
 
             log.info("Metadata updated for file.")
@@ -265,88 +936,385 @@ class Indexer:
         raise ValueError("Partition must be a string or a list of strings.")
 
 
+def _wake(waiter: asyncio.Future):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
 @dataclass
 class TaskInfo:
     state: Optional[str] = None
     error: Optional[str] = None
     details: Dict[str, Any] = field(default_factory=dict)
+    batch_id: Optional[str] = None
 
 
-@ray.remote(concurrency_groups={"set": 1000, "get": 1000, "queue_info": 1000})
+@ray.remote(
+    concurrency_groups={"set": 1000, "get": 1000, "queue_info": 1000, "events": 1000}
+)
 class TaskStateManager:
+    """
+    State, details and errors of the indexing tasks.
+
+    Calls return once the in-memory state is updated: changes are written to
+    the task store (`task_state`) behind them, in order, by a single writer,
+    and the changes made while a write is in progress are coalesced into the
+    next one, so the indexing stages never wait on the database. Only active
+    tasks, plus the `recent_size` last finished ones, are kept in memory; older
+    tasks are read from the store, and finished tasks are purged from it past
+    their retention. Tasks a previous run left unfinished are marked failed at
+    startup.
+
+    Writers all run in the "set" concurrency group, on one event loop, and
+    update a single task without awaiting in between: no lock is needed, and
+    readers never wait for writers. Task counts per state are maintained on
+    each transition, so they are read in constant time.
+
+    State and progress changes are also appended to a bounded event log with a
+    sequence number, which `get_events` long-polls from a cursor. The last log
+    lines of each task, sent by the `TaskLogSink` of every process, are kept
+    the same way.
+    """
+
     def __init__(self):
+        from concurrent.futures import ThreadPoolExecutor
+
+        from utils.logger import get_logger
+
+        from .task_store import TaskStore, task_store_url
+
+        self.config = load_config()
+        self.logger = get_logger()
+        self.store = TaskStore(task_store_url(self.config))
+        # a single writer keeps the writes of a task in call order
+        self._writer = ThreadPoolExecutor(max_workers=1)
+        # tasks changed since the last write, written by the flusher
+        self._dirty: Dict[str, TaskInfo] = {}
+        self._flusher: Optional[asyncio.Task] = None
+        self.recent_size = self.config.task_state.recent_size
+        self.retention = self.config.task_state.retention
+
+        # tasks left unfinished by a previous run will not make progress anymore
+        interrupted = self.store.fail_active("Interrupted by a restart")
         self.tasks: Dict[str, TaskInfo] = {}
-        self.lock = asyncio.Lock()
+        self.recent: OrderedDict[str, TaskInfo] = OrderedDict()
+        self.state_counts = Counter(self.store.count_by_state())
+        self.state_counts.pop(None, None)
+        self._purger: Optional[asyncio.Task] = None
+
+        # event log, shared with the "events" group which runs on another loop
+        self._events: deque = deque(maxlen=self.config.task_state.event_log_size)
+        self._seq = 0
+        self._event_waiters: List[asyncio.Future] = []
+        self._events_lock = threading.Lock()
+
+        # task_id -> (number of lines received, last lines), least recent first
+        log_config = self.config.task_state.logs
+        self.log_max_lines = log_config.max_lines
+        self.log_max_tasks = log_config.max_tasks
+        self._logs: OrderedDict[str, Tuple[int, deque]] = OrderedDict()
+        self._log_waiters: Dict[str, List[asyncio.Future]] = {}
+        self.logger.info("TaskStateManager initialized.", interrupted_tasks=interrupted)
+
+    def _ensure_purger(self):
+        if self._purger is None or self._purger.done():
+            self._purger = asyncio.create_task(self._purge_loop())
+
+    async def _purge_loop(self):
+        while True:
+            now = datetime.now()
+            try:
+                deleted = await asyncio.get_running_loop().run_in_executor(
+                    self._writer,
+                    partial(
+                        self.store.purge,
+                        completed_before=now
+                        - timedelta(hours=self.retention.completed_hours),
+                        failed_before=now
+                        - timedelta(hours=self.retention.failed_hours),
+                        max_finished=self.retention.max_finished_tasks,
+                    ),
+                )
+                if deleted:
+                    self.state_counts.subtract(deleted)
+                    self.logger.info("Purged finished tasks.", deleted=deleted)
+            except Exception:
+                self.logger.exception("Failed to purge finished tasks.")
+            await asyncio.sleep(self.retention.purge_interval_seconds)
+
+    def _lookup(self, task_id: str) -> Optional[TaskInfo]:
+        return (
+            self.tasks.get(task_id)
+            or self.recent.get(task_id)
+            or self._dirty.get(task_id)
+        )
+
+    def _ensure_task(self, task_id: str) -> TaskInfo:
+        info = self._lookup(task_id)
+        if info is None:
+            info = self.tasks[task_id] = TaskInfo()
+        return info
+
+    def _transition(self, info: TaskInfo, state: str):
+        if info.state is not None:
+            self.state_counts[info.state] -= 1
+        self.state_counts[state] += 1
+        info.state = state
+
+    def _save(self, task_id: str, info: TaskInfo):
+        """
+        Schedule the write of a task, and move it out of the active set once
+        finished. Must not be preceded by an await since the task was updated.
+        """
+        if info.state in TERMINAL_STATES and task_id in self.tasks:
+            self.recent[task_id] = self.tasks.pop(task_id)
+            while len(self.recent) > self.recent_size:
+                self.recent.popitem(last=False)
+        self._dirty[task_id] = info
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush())
 
-    async def _ensure_task(self, task_id: str) -> TaskInfo:
-        """Helper to get-or-create the TaskInfo object under lock."""
-        if task_id not in self.tasks:
-            self.tasks[task_id] = TaskInfo()
-        return self.tasks[task_id]
+    async def _flush(self):
+        """Write the tasks changed since the last write, until none is left."""
+        loop = asyncio.get_running_loop()
+        while self._dirty:
+            batch, self._dirty = self._dirty, {}
+            rows = [
+                (task_id, info.state, info.error, info.details, info.batch_id)
+                for task_id, info in batch.items()
+            ]
+            try:
+                await loop.run_in_executor(self._writer, self.store.save_many, rows)
+            except Exception:
+                self.logger.exception("Failed to save task states.", tasks=len(rows))
+                # written again with the changes made meanwhile
+                self._dirty = {**batch, **self._dirty}
+                await asyncio.sleep(TASK_STORE_RETRY_SECONDS)
+
+    def _publish(self, task_id: str, info: TaskInfo):
+        with self._events_lock:
+            self._seq += 1
+            self._events.append(
+                {
+                    "seq": self._seq,
+                    "task_id": task_id,
+                    "state": info.state,
+                    "partition": info.details.get("partition"),
+                    "file_id": info.details.get("file_id"),
+                    "batch_id": info.batch_id,
+                    "progress": info.details.get("progress"),
+                    "time": time.time(),
+                }
+            )
+            waiters, self._event_waiters = self._event_waiters, []
+        for waiter in waiters:
+            waiter.get_loop().call_soon_threadsafe(_wake, waiter)
+
+    async def _stored(self, task_id: str) -> Optional[dict]:
+        info = self._lookup(task_id)
+        if info is not None:
+            return {"state": info.state, "error": info.error, "details": info.details}
+        return await asyncio.to_thread(self.store.get, task_id)
 
     @ray.method(concurrency_group="set")
     async def set_state(self, task_id: str, state: str):
-        async with self.lock:
-            info = await self._ensure_task(task_id)
-            info.state = state
+        self._ensure_purger()
+        info = self._ensure_task(task_id)
+        if info.state == "CANCELLED":
+            # late updates from the work being torn down
+            return
+        self._transition(info, state)
+        self._publish(task_id, info)
+        self._save(task_id, info)
 
     @ray.method(concurrency_group="set")
     async def set_error(self, task_id: str, tb_str: str):
-        async with self.lock:
-            info = await self._ensure_task(task_id)
-            info.error = tb_str
+        info = self._ensure_task(task_id)
+        info.error = tb_str
+        self._save(task_id, info)
 
     @ray.method(concurrency_group="set")
     async def set_details(
-        self, task_id: str, *, file_id: str, partition: int, metadata: dict
+        self,
+        task_id: str,
+        *,
+        file_id: str,
+        partition: int,
+        metadata: dict,
+        priority: str = "interactive",
     ):
-        async with self.lock:
-            info = await self._ensure_task(task_id)
-            info.details = {
-                "file_id": file_id,
-                "partition": partition,
-                "metadata": metadata,
-            }
+        info = self._ensure_task(task_id)
+        info.details = {
+            "file_id": file_id,
+            "partition": partition,
+            "priority": priority,
+            "metadata": metadata,
+        }
+        self._save(task_id, info)
+
+    @ray.method(concurrency_group="set")
+    async def set_progress(self, task_id: str, **progress):
+        """
+        Record the progress of a task (pages parsed, chunks embedded, ...), shown
+        in its details. Values are merged with the ones already reported.
+        """
+        info = self._ensure_task(task_id)
+        info.details = {
+            **info.details,
+            "progress": {**info.details.get("progress", {}), **progress},
+        }
+        self._publish(task_id, info)
+        self._save(task_id, info)
 
     @ray.method(concurrency_group="get")
     async def get_state(self, task_id: str) -> Optional[str]:
-        async with self.lock:
-            info = self.tasks.get(task_id)
-            return info.state if info else None
+        record = await self._stored(task_id)
+        return record["state"] if record else None
 
     @ray.method(concurrency_group="get")
     async def get_error(self, task_id: str) -> Optional[str]:
-        async with self.lock:
-            info = self.tasks.get(task_id)
-            return info.error if info else None
+        record = await self._stored(task_id)
+        return record["error"] if record else None
 
     @ray.method(concurrency_group="get")
     async def get_details(self, task_id: str) -> Optional[dict]:
-        async with self.lock:
-            info = self.tasks.get(task_id)
-            return info.details if info else None
+        record = await self._stored(task_id)
+        return record["details"] if record else None
 
-    @ray.method(concurrency_group="queue_info")
-    async def get_all_states(self) -> Dict[str, str]:
-        async with self.lock:
-            return {tid: info.state for tid, info in self.tasks.items()}
+    @ray.method(concurrency_group="set")
+    async def register_batch(self, batch_id: str, task_ids: List[str]):
+        for task_id in task_ids:
+            info = self._ensure_task(task_id)
+            info.batch_id = batch_id
+            if info.state is None:
+                self._transition(info, "QUEUED")
+            self._publish(task_id, info)
+        await asyncio.get_running_loop().run_in_executor(
+            self._writer, self.store.add_batch, batch_id, list(task_ids)
+        )
+
+    @ray.method(concurrency_group="get")
+    async def get_active_tasks(
+        self, batch_id: Optional[str] = None, partition: Optional[str] = None
+    ) -> List[str]:
+        """Ids of the tasks not finished yet, of a batch and/or a partition."""
+        return [
+            task_id
+            for task_id, info in list(self.tasks.items())
+            if (batch_id is None or info.batch_id == batch_id)
+            and (partition is None or info.details.get("partition") == partition)
+        ]
+
+    @ray.method(concurrency_group="get")
+    async def get_batch_progress(self, batch_id: str) -> Optional[dict]:
+        return await asyncio.to_thread(self.store.batch_progress, batch_id)
+
+    @ray.method(concurrency_group="events")
+    async def get_events(
+        self, after: Optional[int] = None, timeout: float = 15.0
+    ) -> Dict[str, Any]:
+        """
+        Events with a sequence number above `after`, waiting up to `timeout`
+        seconds for one. Returns them with the last sequence number, the cursor
+        of the next call; `lost` is set when events past `after` already left
+        the log. Without `after`, returns the current cursor at once.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._events_lock:
+                seq = self._seq
+                if after is None:
+                    return {"seq": seq, "events": [], "lost": False}
+                if seq > after or time.monotonic() >= deadline:
+                    first = self._events[0]["seq"] if self._events else seq + 1
+                    start = max(after + 1 - first, 0)
+                    return {
+                        "seq": seq,
+                        "events": list(islice(self._events, start, None)),
+                        "lost": after + 1 < first and seq > after,
+                    }
+                waiter = asyncio.get_running_loop().create_future()
+                self._event_waiters.append(waiter)
+            try:
+                await asyncio.wait_for(waiter, deadline - time.monotonic())
+            except asyncio.TimeoutError:
+                pass
+
+    @ray.method(concurrency_group="set")
+    async def append_logs(self, records: List[Tuple[str, str]]):
+        """Append `(task_id, line)` records to the log buffers of their tasks."""
+        woken = []
+        with self._events_lock:
+            for task_id, line in records:
+                count, lines = self._logs.pop(task_id, (0, None))
+                if lines is None:
+                    lines = deque(maxlen=self.log_max_lines)
+                lines.append(line)
+                self._logs[task_id] = (count + 1, lines)
+                woken.extend(self._log_waiters.pop(task_id, []))
+            while len(self._logs) > self.log_max_tasks:
+                self._logs.popitem(last=False)
+        for waiter in woken:
+            waiter.get_loop().call_soon_threadsafe(_wake, waiter)
+
+    @ray.method(concurrency_group="events")
+    async def get_logs(
+        self,
+        task_id: str,
+        max_lines: int = 100,
+        after: Optional[int] = None,
+        timeout: float = 0.0,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Last `max_lines` log lines of a task, or the ones after line number
+        `after`, waiting up to `timeout` seconds for one. Returns them with the
+        cursor of the next call, or None if the task has no buffered logs.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._events_lock:
+                count, lines = self._logs.get(task_id, (0, None))
+                if after is None:
+                    if lines is None:
+                        return None
+                    return {"cursor": count, "lines": list(lines)[-max_lines:]}
+                if count > after or time.monotonic() >= deadline:
+                    missing = max(count - after, 0)
+                    kept = list(lines or ())
+                    new = kept[len(kept) - min(missing, len(kept)) :]
+                    if len(new) > max_lines:
+                        count -= len(new) - max_lines
+                        new = new[:max_lines]
+                    return {"cursor": count, "lines": new}
+                waiter = asyncio.get_running_loop().create_future()
+                self._log_waiters.setdefault(task_id, []).append(waiter)
+            try:
+                await asyncio.wait_for(waiter, deadline - time.monotonic())
+            except asyncio.TimeoutError:
+                with self._events_lock:
+                    waiters = self._log_waiters.get(task_id, [])
+                    if waiter in waiters:
+                        waiters.remove(waiter)
+                    if not waiters:
+                        self._log_waiters.pop(task_id, None)
 
     @ray.method(concurrency_group="queue_info")
-    async def get_all_info(self) -> Dict[str, dict]:
-        async with self.lock:
-            return {
-                task_id: {
-                    "state": info.state,
-                    "error": info.error,
-                    "details": info.details,
-                }
-                for task_id, info in self.tasks.items()
-            }
+    async def get_state_counts(self) -> Dict[str, int]:
+        """Number of stored tasks per state."""
+        return {state: count for state, count in self.state_counts.items() if count}
 
     @ray.method(concurrency_group="queue_info")
-    async def get_pool_info(self) -> Dict[str, int]:
-        return {
-            "pool_size": POOL_SIZE,
-            "max_tasks_per_worker": MAX_TASKS_PER_WORKER,
-            "total_capacity": POOL_SIZE * MAX_TASKS_PER_WORKER,
-        }
+    async def list_tasks(
+        self,
+        states: Optional[List[str]] = None,
+        partition: Optional[str] = None,
+        file_id: Optional[str] = None,
+        batch_id: Optional[str] = None,
+        limit: int = 100,
+        offset: int = 0,
+    ) -> Dict[str, Any]:
+        """A page of tasks, most recent first, with the number of matching tasks."""
+        total, tasks = await asyncio.to_thread(
+            self.store.list, states, partition, file_id, batch_id, limit, offset
+        )
+        return {"total": total, "tasks": tasks}
@@ -15,8 +15,9 @@ class CustomHTMLLoader(BaseLoader):
         loader = UnstructuredHTMLLoader(file_path=str(path), autodetect_encoding=True)
         doc = await loader.aload()
 
-        s = ""
-        for page_num, segment in enumerate(doc, start=1):
-            s += segment.page_content.strip() + f"\n[PAGE_{page_num}]\n"
+        s = "".join(
+            f"{segment.page_content.strip()}\n[PAGE_{page_num}]\n"
+            for page_num, segment in enumerate(doc, start=1)
+        )
 
         return Document(page_content=s, metadata=metadata)
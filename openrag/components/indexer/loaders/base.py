@@ -1,17 +1,27 @@
 import asyncio
-import base64
 import re
 from abc import ABC, abstractmethod
-from io import BytesIO
 from pathlib import Path
-from typing import Dict, Optional, Union
+from typing import AsyncIterator, Dict, List, Optional, Union
 
+import openai
+import ray
 from langchain_core.documents.base import Document
 from langchain_core.messages import HumanMessage
 from langchain_openai import ChatOpenAI
 from utils.logger import get_logger
+from utils.metrics import metrics
 
 from ...utils import load_config, load_sys_template, vlmSemaphore
+from ..caption_cache import dhash, image_digest, prompt_key
+from .images import (
+    BATCH_INSTRUCTIONS,
+    CaptionBatcher,
+    ImageEncoder,
+    ImageFilter,
+    image_tokens,
+    split_answers,
+)
 
 logger = get_logger()
 
@@ -19,6 +29,15 @@ config = load_config()
 prompts_dir = Path(config.paths.prompts_dir)
 img_desc_prompt_path = prompts_dir / config.prompt["image_describer"]
 IMAGE_DESCRIPTION_PROMPT = load_sys_template(img_desc_prompt_path)
+CAPTION_PROMPT_KEY = prompt_key(IMAGE_DESCRIPTION_PROMPT, config.vlm.get("model"))
+
+# image digest -> caption being made in this process, for identical images
+_captions_in_flight: Dict[str, asyncio.Future] = {}
+
+
+def _image_keys(image, near_matches: bool):
+    """Digest of an image, and its dHash when the caption cache matches near duplicates."""
+    return image_digest(image), dhash(image) if near_matches else None
 
 
 class BaseLoader(ABC):
@@ -35,8 +54,26 @@ class BaseLoader(ABC):
         settings.update(model_settings)
 
         self.vlm_endpoint = ChatOpenAI(**settings).with_retry(stop_after_attempt=2)
-        self.min_width_pixels = 0  # minimum width in pixels
-        self.min_height_pixels = 0  # minimum height in pixels
+        self.image_filter = ImageFilter(self.config.loader.get("image_filter", {}))
+        self.image_encoder = ImageEncoder(self.config.loader.get("image_encoding", {}))
+        self._caption_cache = None
+
+        batching = self.config.loader.get("caption_batching", {})
+        self.patch_size = batching.get("patch_size", 28)
+        self.max_image_tokens = batching.get("max_image_tokens", 0)
+        self.caption_batcher = None
+        max_images = batching.get("max_images", 1)
+        if max_images > 1:
+            # answering for several images takes longer
+            self.vlm_batch_endpoint = ChatOpenAI(
+                **{**settings, "timeout": settings["timeout"] * max_images}
+            ).with_retry(stop_after_attempt=2)
+            self.caption_batcher = CaptionBatcher(
+                self._describe_batch,
+                max_images=max_images,
+                token_budget=batching.get("token_budget", 0),
+                wait_seconds=batching.get("wait_seconds", 0.1),
+            )
 
     @abstractmethod
     async def aload_document(
@@ -46,12 +83,46 @@ class BaseLoader(ABC):
     ):
         pass
 
+    async def aload_pages(
+        self,
+        file_path: Union[str, Path],
+        metadata: Optional[Dict] = None,
+        save_markdown: bool = False,
+    ) -> AsyncIterator[Document]:
+        """
+        The document in batches of consecutive pages, in order, each yielded as
+        soon as it is converted; together they make the `aload_document`
+        output. Loaders that cannot convert part of a file yield it whole.
+        """
+        yield await self.aload_document(
+            file_path=file_path, metadata=metadata, save_markdown=save_markdown
+        )
+
+    def reset(self):  # noqa: B027 (optional hook)
+        """
+        Release what a document left behind, once it is serialized (or failed).
+
+        Loaders are kept warm by the DocSerializer and serve several documents,
+        possibly at the same time: no per-document state may live on the
+        instance, and this hook must not disturb documents still in progress.
+        """
+
     def save_document(self, doc: Document, path: str):
         path = re.sub(r"\..*", ".md", path)
         with open(path, "w", encoding="utf-8") as f:
             f.write(doc.page_content)
         logger.debug(f"Document saved to {path}")
 
+    @property
+    def caption_cache(self):
+        if self._caption_cache is None and config.caption_cache.enable:
+            try:
+                self._caption_cache = ray.get_actor("CaptionCache", namespace="openrag")
+            except ValueError:
+                logger.warning("CaptionCache actor not found, captions are not cached")
+                self._caption_cache = False
+        return self._caption_cache or None
+
     async def get_image_description(
         self, image, semaphore: asyncio.Semaphore = vlmSemaphore
     ):
@@ -63,33 +134,153 @@ class BaseLoader(ABC):
             Returns:
             str: Description of the image
         """
-        async with semaphore:
-            width, height = image.size
-
-            buffered = BytesIO()
-            image.save(buffered, format="PNG")
-            img_b64 = base64.b64encode(buffered.getvalue()).decode()
-            image_description = ""
-
-            message = HumanMessage(
-                content=[
-                    {
-                        "type": "image_url",
-                        "image_url": {
-                            "url": f"data:image/png;base64,{img_b64}"  # f"{picture.image.uri.path}" #
-                        },
-                    },
-                    {"type": "text", "text": IMAGE_DESCRIPTION_PROMPT},
-                ]
+        image_description = ""
+        reason = await asyncio.to_thread(self.image_filter.reject_reason, image)
+        if reason is None:
+            image_description = await self._caption(image, semaphore)
+        else:
+            metrics.inc(
+                "openrag_images_skipped_total",
+                loader=type(self).__name__,
+                reason=reason,
             )
+
+        # Convert image path to markdown format and combine with description
+        desc = f"""\n<image_description>\n{image_description}\n</image_description>\n"""
+        return desc
+
+    async def _caption(self, image, semaphore: asyncio.Semaphore) -> str:
+        """
+        Caption of an image, from the caption cache when the same image (or,
+        if enabled, a near duplicate) was captioned already. Identical images
+        captioned at the same time in this process wait for the first one
+        instead of calling the VLM too.
+        """
+        cache = self.caption_cache
+        digest, phash = await asyncio.to_thread(
+            _image_keys, image, config.caption_cache.max_distance > 0
+        )
+        pending = _captions_in_flight.get(digest)
+        if pending is not None:
+            await asyncio.wait([pending])
+            if not pending.cancelled() and pending.exception() is None:
+                return pending.result()
+
+        done = asyncio.get_running_loop().create_future()
+        _captions_in_flight[digest] = done
+        try:
+            loader = type(self).__name__
+            caption = None
+            if cache is not None:
+                try:
+                    caption = await cache.get.remote(digest, phash, CAPTION_PROMPT_KEY)
+                except Exception:
+                    logger.exception("Caption cache lookup failed")
+                metrics.inc(
+                    "openrag_caption_cache_total",
+                    loader=loader,
+                    result="miss" if caption is None else "hit",
+                )
+            if caption is None:
+                if self.caption_batcher is not None and semaphore is vlmSemaphore:
+                    tokens = image_tokens(
+                        self.image_encoder.size(image),
+                        self.patch_size,
+                        self.max_image_tokens,
+                    )
+                    caption = await self.caption_batcher.describe(image, tokens)
+                else:
+                    caption = await self._describe(image, semaphore)
+                if caption and cache is not None:  # failures are not cached
+                    try:
+                        await cache.put.remote(
+                            digest, phash, CAPTION_PROMPT_KEY, caption
+                        )
+                    except Exception:
+                        logger.exception("Caption cache update failed")
+            done.set_result(caption)
+            return caption
+        except BaseException:
+            done.cancel()
+            raise
+        finally:
+            if _captions_in_flight.get(digest) is done:
+                del _captions_in_flight[digest]
+
+    async def _image_content(self, image, loader: str) -> dict:
+        """Message part of an image, downscaled and compressed as configured."""
+        url, size = await self.image_encoder.data_url(image)
+        metrics.inc("openrag_image_payload_bytes_total", size, loader=loader)
+        return {"type": "image_url", "image_url": {"url": url}}
+
+    async def _describe(self, image, semaphore: asyncio.Semaphore) -> str:
+        """Caption of an image by the VLM, empty on error."""
+        loader = type(self).__name__
+        message = HumanMessage(
+            content=[
+                await self._image_content(image, loader),
+                {"type": "text", "text": IMAGE_DESCRIPTION_PROMPT},
+            ]
+        )
+        async with semaphore:
             try:
-                if width > self.min_width_pixels and height > self.min_height_pixels:
+                metrics.inc("openrag_images_total", loader=loader)
+                metrics.inc("openrag_vlm_requests_total", loader=loader)
+                with metrics.timer("caption", loader=loader):
                     response = await self.vlm_endpoint.ainvoke([message])
-                    image_description = response.content
+                return response.content
 
             except Exception:
                 logger.exception("Error while generating image description")
+                return ""
 
-            # Convert image path to markdown format and combine with description
-            desc = f"""\n<image_description>\n{image_description}\n</image_description>\n"""
-            return desc
+    async def _describe_batch(self, images: List) -> List[str]:
+        """
+        Captions of several images from one VLM request. The images the answer
+        leaves out, or all of them if the request fails, are captioned one by one.
+        """
+        if len(images) == 1 or self.caption_batcher is None:
+            return await asyncio.gather(
+                *(self._describe(i, vlmSemaphore) for i in images)
+            )
+
+        loader = type(self).__name__
+        answers: List[Optional[str]] = [None] * len(images)
+        parts = await asyncio.gather(*(self._image_content(i, loader) for i in images))
+        content = []
+        for number, part in enumerate(parts, start=1):
+            content.append({"type": "text", "text": f"[IMAGE {number}]"})
+            content.append(part)
+        prompt = IMAGE_DESCRIPTION_PROMPT + BATCH_INSTRUCTIONS.format(count=len(images))
+        content.append({"type": "text", "text": prompt})
+
+        async with vlmSemaphore:
+            try:
+                metrics.inc("openrag_images_total", len(images), loader=loader)
+                metrics.inc("openrag_vlm_requests_total", loader=loader)
+                with metrics.timer("caption", loader=loader):
+                    response = await self.vlm_batch_endpoint.ainvoke(
+                        [HumanMessage(content=content)]
+                    )
+                answers = split_answers(response.content, len(images))
+            except openai.BadRequestError:
+                # e.g. a vLLM server started with --limit-mm-per-prompt image=1
+                logger.warning(
+                    "The VLM rejected a multi-image request, captioning images one by one"
+                )
+                self.caption_batcher = None
+            except Exception:
+                logger.exception("Error while generating image descriptions")
+
+        missing = [i for i, answer in enumerate(answers) if answer is None]
+        if missing:
+            if len(missing) < len(images):
+                logger.debug(
+                    "Multi-image caption answer incomplete", missing=len(missing)
+                )
+            captions = await asyncio.gather(
+                *(self._describe(images[i], vlmSemaphore) for i in missing)
+            )
+            for i, caption in zip(missing, captions):
+                answers[i] = caption
+        return answers
@@ -0,0 +1,218 @@
+import asyncio
+import base64
+import math
+import re
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from PIL import Image
+
+# side of the thumbnail the entropy of an image is measured on
+ENTROPY_THUMBNAIL = 128
+
+BATCH_INSTRUCTIONS = """
+
+You are given {count} images, each announced by its marker [IMAGE k], k from 1 to {count}. \
+Follow the instructions above for each image separately. Answer with one section per image, \
+in order, each starting on its own line with the marker of its image, such as [IMAGE 1], \
+and write nothing before the first marker."""
+
+ANSWER_MARKER = re.compile(r"^[ \t#*]*\[IMAGE (\d+)\][ \t*:]*", re.MULTILINE)
+
+
+def _entropy(image: Image.Image) -> float:
+    """Entropy (bits) of the grayscale histogram, transparent areas seen as white."""
+    thumbnail = image.copy()
+    thumbnail.thumbnail((ENTROPY_THUMBNAIL, ENTROPY_THUMBNAIL))
+    if thumbnail.mode in ("RGBA", "LA", "PA") or "transparency" in thumbnail.info:
+        background = Image.new("RGBA", thumbnail.size, "white")
+        thumbnail = Image.alpha_composite(background, thumbnail.convert("RGBA"))
+    return thumbnail.convert("L").entropy()
+
+
+class ImageFilter:
+    """
+    Leaves out the images not worth a VLM request: icons, bullets and spacers
+    (too small), rules and borders (too elongated), and blank or solid colour
+    areas (too little entropy). A line of text still has ~0.5 bits.
+    """
+
+    def __init__(self, settings):
+        self.min_width = settings.get("min_width", 0)
+        self.min_height = settings.get("min_height", 0)
+        self.max_aspect_ratio = settings.get("max_aspect_ratio", 0)
+        self.min_entropy = settings.get("min_entropy", 0)
+
+    def reject_reason(self, image: Image.Image) -> Optional[str]:
+        """Why an image should not be captioned, None if it should. Blocks on large images."""
+        width, height = image.size
+        if width < self.min_width or height < self.min_height or not width * height:
+            return "size"
+        if self.max_aspect_ratio and max(width, height) > self.max_aspect_ratio * min(
+            width, height
+        ):
+            return "aspect_ratio"
+        if self.min_entropy and _entropy(image) < self.min_entropy:
+            return "entropy"
+        return None
+
+
+def image_tokens(size: Tuple[int, int], patch_size: int, max_tokens: int) -> int:
+    """Estimated prompt tokens of an image for a VLM tiling it in patch_size patches."""
+    width, height = size
+    tokens = math.ceil(width / patch_size) * math.ceil(height / patch_size)
+    return min(tokens, max_tokens) if max_tokens else tokens
+
+
+def _flatten(image: Image.Image) -> Image.Image:
+    """RGB copy of an image, transparent areas white, for formats without alpha."""
+    if image.mode == "RGB":
+        return image
+    if image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info:
+        background = Image.new("RGBA", image.size, "white")
+        return Image.alpha_composite(background, image.convert("RGBA")).convert("RGB")
+    return image.convert("RGB")
+
+
+class ImageEncoder:
+    """
+    Data URLs of images for the VLM: downscaled to `max_dimension` and
+    compressed to JPEG or WebP at `quality`, in a thread pool. The URL of an
+    image is kept as long as the image lives, so a retried or re-batched
+    caption request does not encode it again.
+    """
+
+    FORMATS = {"jpeg": "JPEG", "jpg": "JPEG", "webp": "WEBP", "png": "PNG"}
+
+    def __init__(self, settings):
+        self.max_dimension = settings.get("max_dimension", 0)
+        image_format = str(settings.get("format", "png")).lower()
+        if image_format not in self.FORMATS:
+            raise ValueError(f"Unsupported image encoding format: {image_format}")
+        self.format = self.FORMATS[image_format]
+        self.quality = settings.get("quality", 85)
+        self._pool = ThreadPoolExecutor(
+            max_workers=settings.get("workers", 4), thread_name_prefix="image-encoder"
+        )
+        # id(image) -> (weak reference to the image, data URL)
+        self._encoded: Dict[int, tuple] = {}
+
+    def size(self, image: Image.Image) -> Tuple[int, int]:
+        """Size of the image as sent to the VLM."""
+        width, height = image.size
+        longest = max(width, height)
+        if not self.max_dimension or longest <= self.max_dimension:
+            return width, height
+        scale = self.max_dimension / longest
+        return max(round(width * scale), 1), max(round(height * scale), 1)
+
+    def _encode(self, image: Image.Image) -> Tuple[str, int]:
+        size = self.size(image)
+        if size != image.size:
+            image = image.resize(size, Image.Resampling.LANCZOS, reducing_gap=3.0)
+        if self.format == "JPEG":
+            image = _flatten(image)
+        elif image.mode not in ("RGB", "RGBA", "L", "LA"):
+            image = image.convert("RGBA")
+        buffered = BytesIO()
+        if self.format == "PNG":
+            image.save(buffered, format="PNG")
+        else:
+            image.save(buffered, format=self.format, quality=self.quality)
+        payload = base64.b64encode(buffered.getvalue()).decode()
+        return f"data:image/{self.format.lower()};base64,{payload}", len(payload)
+
+    async def data_url(self, image: Image.Image) -> Tuple[str, int]:
+        """Data URL of an image and the size of its base64 payload."""
+        key = id(image)
+        entry = self._encoded.get(key)
+        if entry is not None and entry[0]() is image:
+            return entry[1]
+        encoded = await asyncio.get_running_loop().run_in_executor(
+            self._pool, self._encode, image
+        )
+
+        def forget(ref, key=key):
+            if self._encoded.get(key, (None,))[0] is ref:
+                del self._encoded[key]
+
+        self._encoded[key] = (weakref.ref(image, forget), encoded)
+        return encoded
+
+
+def split_answers(text: str, count: int) -> List[Optional[str]]:
+    """Per image answers of a multi-image request, None for the images left unanswered."""
+    answers: List[Optional[str]] = [None] * count
+    markers = list(ANSWER_MARKER.finditer(text))
+    for marker, following in zip(markers, markers[1:] + [None]):
+        index = int(marker.group(1)) - 1
+        end = following.start() if following else len(text)
+        answer = text[marker.end() : end].strip()
+        if 0 <= index < count and answer and answers[index] is None:
+            answers[index] = answer
+    return answers
+
+
+class CaptionBatcher:
+    """
+    Packs the images captioned at the same time into multi-image VLM requests.
+
+    Images wait at most `wait_seconds` for companions; a batch is sent as soon
+    as it holds `max_images` images or `token_budget` estimated image tokens.
+    An image larger than the budget is sent alone.
+    """
+
+    def __init__(
+        self,
+        send: Callable[[List[Image.Image]], Awaitable[List[str]]],
+        max_images: int,
+        token_budget: int,
+        wait_seconds: float,
+    ):
+        self._send = send
+        self.max_images = max(max_images, 1)
+        self.token_budget = token_budget
+        self.wait_seconds = wait_seconds
+        self._pending: List[tuple] = []
+        self._tokens = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._running: Set[asyncio.Task] = set()
+
+    async def describe(self, image: Image.Image, tokens: int) -> str:
+        future = asyncio.get_running_loop().create_future()
+        if self._pending and self._tokens + tokens > self.token_budget:
+            self._flush()
+        self._pending.append((image, future))
+        self._tokens += tokens
+        if len(self._pending) >= self.max_images or self._tokens >= self.token_budget:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(
+                self.wait_seconds, self._flush
+            )
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending, self._tokens = self._pending, [], 0
+        if batch:
+            task = asyncio.create_task(self._run(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run(self, batch: List[tuple]):
+        futures = [future for _, future in batch]
+        try:
+            captions = await self._send([image for image, _ in batch])
+        except Exception as e:
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for future, caption in zip(futures, captions):
+            if not future.done():  # its caller may be gone
+                future.set_result(caption)
@@ -8,9 +8,13 @@ from tqdm.asyncio import tqdm
 from utils.logger import get_logger
 
 from .base import BaseLoader
+from .substitution import substitute_in_order
 
 logger = get_logger()
 
+# images as MarkItDown writes them, data URIs cut short: ![alt](data:image/png;base64...)
+EMBEDDED_IMAGE = re.compile(r"!\[[^!]*(\n){0,2}[^!]*\]\(data:image/.{0,6};base64...\)")
+
 
 class MarkItDownLoader(BaseLoader):
     def __init__(self, **kwargs):
@@ -23,13 +27,7 @@ class MarkItDownLoader(BaseLoader):
         if self.config["loader"]["image_captioning"]:
             images = self.get_images_from_zip(file_path)
             captions = await self.get_captions(images)
-            for caption in captions:
-                result = re.sub(
-                    r"!\[[^!]*(\n){0,2}[^!]*\]\(data:image/.{0-6};base64...\)",
-                    caption.replace("\\", "/"),
-                    string=result,
-                    count=1,
-                )
+            result = substitute_in_order(result, EMBEDDED_IMAGE, captions)
         else:
             logger.info("Image captioning disabled. Ignoring images.")
 
@@ -74,11 +72,4 @@ class MarkItDownLoader(BaseLoader):
 
         images = self.get_images_from_zip(file_path)
         captions = await self.get_captions(images)
-        for caption in captions:
-            result = re.sub(
-                r"!\[[^!]*(\n){0,2}[^!]*\]\(data:image/.{0-6};base64...\)",
-                caption.replace("\\", "/"),
-                string=result,
-                count=1,
-            )
-        return result
+        return substitute_in_order(result, EMBEDDED_IMAGE, captions)
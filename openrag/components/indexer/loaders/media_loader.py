@@ -1,34 +1,480 @@
-import os
+import asyncio
+import re
+import time
+from collections import deque
+from io import BytesIO
 from pathlib import Path
+from typing import AsyncIterator, Deque, Dict, List, Optional, Tuple
 
+import numpy as np
+import ray
 import torch
-import whisper
-from components.utils import SingletonMeta
+from config import load_config
 from langchain_core.documents.base import Document
-from pydub import AudioSegment
+from PIL import Image
 from utils.logger import get_logger
+from utils.metrics import metrics
 
+from ..actor_pool import ActorPool
 from .base import BaseLoader
 
 logger = get_logger()
-
-torch.backends.cuda.matmul.allow_tf32 = True
-torch.backends.cudnn.allow_tf32 = True
+config = load_config()
 
 MEDIA_FORMATS = [".wav", ".mp3", ".mp4", ".ogg", ".flv", ".wma", ".aac"]
+VIDEO_FORMATS = [".mp4", ".flv"]
+
+SAMPLE_RATE = 16000  # what Whisper models take: 16 kHz mono float32
+FRAME_MS = 30  # voice activity is decided per frame
+READ_SECONDS = 5  # decoded audio read from ffmpeg at a time
+LONG_SILENCE_SECONDS = 2.0  # always ends a segment, however short
+
+PNG_END = b"IEND\xaeB`\x82"  # closes each frame of an image2pipe PNG stream
+FRAME_TIME = re.compile(rb"pts_time:\s*(-?[\d.]+)")
+THUMBNAIL_WIDTH = 64  # keyframes are compared as grayscale thumbnails this wide
+PIXEL_DELTA = 24  # gray levels over which a thumbnail pixel counts as changed
+
+TRANSCRIPTION = config.loader.get("transcription", {})
+if torch.cuda.is_available():
+    TRANSCRIBER_NUM_GPUS = TRANSCRIPTION.get("num_gpus", 0.01)
+else:  # On CPU
+    TRANSCRIBER_NUM_GPUS = 0
+
+
+def thumbnail(frame: Image.Image) -> np.ndarray:
+    height = max(1, round(THUMBNAIL_WIDTH * frame.height / frame.width))
+    resized = frame.convert("L").resize((THUMBNAIL_WIDTH, height), Image.BILINEAR)
+    return np.asarray(resized, dtype=np.int16)
+
+
+def changed_pixels(first: np.ndarray, second: np.ndarray) -> float:
+    """
+    Fraction of the pixels of two thumbnails that differ noticeably: none
+    for a re-encoded frame, a few for a moving cursor, and well above that
+    for two slides of the same template with different text.
+    """
+    if first.shape != second.shape:
+        return 1.0
+    return float(np.mean(np.abs(first - second) > PIXEL_DELTA))
+
+
+class SpeechSegmenter:
+    """
+    Cuts a stream of 16 kHz mono samples into speech segments by frame
+    energy. Pauses end a segment once it is `min_segment_seconds` long (so
+    Whisper gets context), long silences always do, and a segment reaching
+    `max_segment_seconds` (Whisper's 30 s window) is cut at its last pause,
+    or right there if it has none.
+    """
+
+    def __init__(self, settings):
+        self.threshold_db = settings.get("threshold_db", -45)
+        self.frame = SAMPLE_RATE * FRAME_MS // 1000
+        self.min_silence = int(settings.get("min_silence_ms", 500) * SAMPLE_RATE / 1000)
+        self.min_segment = int(settings.get("min_segment_seconds", 10) * SAMPLE_RATE)
+        self.max_segment = int(settings.get("max_segment_seconds", 30) * SAMPLE_RATE)
+        self.padding = int(settings.get("padding_ms", 200) * SAMPLE_RATE / 1000)
+        self.long_silence = int(LONG_SILENCE_SECONDS * SAMPLE_RATE)
+
+        self._buffer = np.zeros(0, dtype=np.float32)
+        self._buffer_start = 0  # stream position of the first buffered sample
+        self._position = 0  # stream position of the next frame
+        self._start: Optional[int] = None  # of the open segment
+        self._speech_end = 0  # end of the last speech frame
+        self._silence = 0  # samples of silence since then
+        # middle of the last pause of the open segment
+        self._pause: Optional[int] = None
+
+    def _is_speech(self, frame: np.ndarray) -> bool:
+        rms = np.sqrt(np.mean(np.square(frame), dtype=np.float64))
+        return 20 * np.log10(max(rms, 1e-10)) > self.threshold_db
 
+    def _emit(self, end: int) -> Tuple[float, np.ndarray]:
+        segment = self._buffer[
+            self._start - self._buffer_start : end - self._buffer_start
+        ]
+        start = self._start
+        self._buffer = self._buffer[end - self._buffer_start :]
+        self._buffer_start = end
+        return start / SAMPLE_RATE, segment
 
-class AudioTranscriber(metaclass=SingletonMeta):
-    def __init__(self, device="cpu", compute_type="float32", model_name="base"):
-        self.model = whisper.load_model(name=model_name, device=device)
+    def feed(self, samples: np.ndarray) -> List[Tuple[float, np.ndarray]]:
+        """Segments (start in seconds, samples) completed by the given samples."""
+        self._buffer = np.concatenate([self._buffer, samples])
+        segments = []
+        buffered_end = self._buffer_start + len(self._buffer)
+        while self._position + self.frame <= buffered_end:
+            offset = self._position - self._buffer_start
+            speech = self._is_speech(self._buffer[offset : offset + self.frame])
+            self._position += self.frame
+
+            if self._start is None:
+                if speech:
+                    self._start = max(
+                        self._position - self.frame - self.padding, self._buffer_start
+                    )
+                    self._speech_end, self._silence = self._position, 0
+                    self._pause = None
+                else:  # only keep what may pad the next segment
+                    keep_from = max(self._position - self.padding, self._buffer_start)
+                    self._buffer = self._buffer[keep_from - self._buffer_start :]
+                    self._buffer_start = keep_from
+                continue
+
+            if speech:
+                if self._silence >= self.frame:
+                    self._pause = self._speech_end + self._silence // 2
+                self._speech_end, self._silence = self._position, 0
+            else:
+                self._silence += self.frame
+
+            length = self._speech_end - self._start
+            if self._silence >= self.long_silence or (
+                self._silence >= self.min_silence and length >= self.min_segment
+            ):
+                segments.append(
+                    self._emit(min(self._speech_end + self.padding, self._position))
+                )
+                self._start = None
+            elif self._position - self._start >= self.max_segment:
+                cut = self._pause if self._pause is not None else self._position
+                segments.append(self._emit(cut))
+                self._start, self._pause = cut, None
+        return segments
+
+    def flush(self) -> List[Tuple[float, np.ndarray]]:
+        """The segment left open at the end of the stream."""
+        if self._start is None:
+            return []
+        segment = self._emit(
+            min(self._speech_end + self.padding, self._buffer_start + len(self._buffer))
+        )
+        self._start = None
+        return [segment]
+
+
+@ray.remote(num_gpus=TRANSCRIBER_NUM_GPUS)
+class TranscriptionWorker:
+    """
+    Holds one speech recognition model: openai-whisper, or faster-whisper
+    (CTranslate2) for a lighter, quantized (e.g. int8 on CPU) engine.
+    """
+
+    def __init__(self):
+        from config import load_config
+        from utils.logger import get_logger
+
+        self.logger = get_logger()
+        self.config = load_config()
+        settings = self.config.loader.get("transcription", {})
+        model_name = self.config.loader["audio_model"]
+        self.engine = settings.get("engine", "whisper")
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+
+        if self.engine == "faster_whisper":
+            try:
+                from faster_whisper import WhisperModel
+            except ImportError as e:
+                raise ImportError(
+                    "TRANSCRIPTION_ENGINE=faster_whisper needs the faster-whisper package"
+                ) from e
+            self.model = WhisperModel(
+                model_name,
+                device=device,
+                compute_type=settings.get("compute_type", "int8"),
+                cpu_threads=settings.get("cpu_threads", 4),
+            )
+        else:
+            import whisper
+
+            torch.backends.cuda.matmul.allow_tf32 = True
+            torch.backends.cudnn.allow_tf32 = True
+            self.model = whisper.load_model(name=model_name, device=device)
+        self.fp16 = device == "cuda"
+        self.logger.info(
+            "Transcription model loaded", engine=self.engine, model=model_name
+        )
+
+    def transcribe(self, audio: np.ndarray, language: Optional[str] = None) -> Dict:
+        """Text of a speech segment, and its language."""
+        with metrics.timer("transcribe", loader="VideoAudioLoader"):
+            if self.engine == "faster_whisper":
+                segments, info = self.model.transcribe(
+                    audio, language=language, vad_filter=False
+                )
+                text = " ".join(segment.text.strip() for segment in segments)
+                return {"text": text.strip(), "language": info.language}
+            result = self.model.transcribe(audio, language=language, fp16=self.fp16)
+            return {"text": result["text"].strip(), "language": result["language"]}
+
+
+@ray.remote
+class TranscriptionPool:
+    """Spreads speech segments over a pool of TranscriptionWorkers, one segment each at a time."""
+
+    def __init__(self):
+        from config import load_config
+        from utils.logger import get_logger
+
+        self.logger = get_logger()
+        self.config = load_config()
+        self.pool = ActorPool.from_config(
+            "transcriber",
+            TranscriptionWorker,
+            slots_per_actor=1,
+            pools_config=self.config.ray.actor_pools,
+            logger=self.logger,
+        )
+        self.logger.info(
+            f"Transcription pool: {self.pool.min_actors}-{self.pool.max_actors} actors"
+        )
+
+    async def transcribe(
+        self, audio: List[ray.ObjectRef], language: Optional[str] = None
+    ) -> Dict:
+        """
+        Transcribe a segment. `audio` holds a reference to its samples, handed
+        over to the worker without a copy through this actor.
+        """
+        worker = await self.pool.acquire()
+        failed = False
+        ref = worker.transcribe.remote(audio[0], language)
+        try:
+            return await ref
+        except asyncio.CancelledError:
+            ray.cancel(ref)
+            raise
+        except Exception as e:
+            failed = isinstance(e, ray.exceptions.RayActorError)
+            self.logger.exception(
+                "Error transcribing with TranscriptionWorker", error=str(e)
+            )
+            raise
+        finally:
+            self.pool.release(worker, failed=failed)
+
+    async def get_stats(self) -> Dict:
+        return self.pool.stats()
 
 
 class VideoAudioLoader(BaseLoader):
+    """
+    Transcribes audio and video files: ffmpeg decodes them as a stream, cut
+    into speech segments transcribed in parallel by the TranscriptionPool.
+    Each segment is followed by a [PAGE_N] marker and its time range is kept
+    in the `segments` metadata, from which chunks get their time range.
+
+    With `transcription.video.enable`, the distinct scenes of videos are
+    captioned too, and their captions placed between the segments by time.
+    """
+
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
-        device = "cuda" if torch.cuda.is_available() else "cpu"
-        model = kwargs.get("config").loader["audio_model"]
-        self.transcriber = AudioTranscriber(device=device, model_name=model)
+        self.settings = self.config.loader.get("transcription", {})
+        self.language = self.settings.get("language")
+        self.max_pending = self.settings.get("max_pending_segments", 16)
+        self.pool = ray.get_actor("TranscriptionPool", namespace="openrag")
+        video = self.settings.get("video", {})
+        self.video = video if video.get("enable", False) else None
+
+    async def _decode(self, path: Path) -> AsyncIterator[np.ndarray]:
+        """16 kHz mono float32 samples of the audio track, as ffmpeg decodes them."""
+        process = await asyncio.create_subprocess_exec(
+            "ffmpeg",
+            "-nostdin",
+            "-v",
+            "error",
+            "-i",
+            str(path),
+            "-map",
+            "0:a:0?",
+            "-ac",
+            "1",
+            "-ar",
+            str(SAMPLE_RATE),
+            "-f",
+            "s16le",
+            "-",
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        errors = asyncio.create_task(process.stderr.read())
+        try:
+            leftover = b""
+            while True:
+                data = await process.stdout.read(READ_SECONDS * SAMPLE_RATE * 2)
+                if not data:
+                    break
+                data = leftover + data
+                usable = len(data) - len(data) % 2
+                leftover = data[usable:]
+                yield (
+                    np.frombuffer(data[:usable], np.int16).astype(np.float32) / 32768.0
+                )
+            if await process.wait() != 0:
+                message = (await errors).decode(errors="replace").strip()
+                if "does not contain any stream" in message:
+                    return  # no audio track
+                raise RuntimeError(f"ffmpeg could not decode {path.name}: {message}")
+        finally:
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+            errors.cancel()
+
+    async def _frames(self, path: Path) -> AsyncIterator[Tuple[float, Image.Image]]:
+        """
+        (time, frame) of the scene changes of the video track, and of its first
+        frame, scaled to the configured width, as ffmpeg finds them.
+        """
+        threshold = self.video.get("scene_threshold", 0.3)
+        width = self.video.get("width", 960)
+        # fast seeking past everything but the keyframes (I-frames) of the codec
+        skip = (
+            ["-skip_frame", "nokey"] if self.video.get("keyframes_only", True) else []
+        )
+        process = await asyncio.create_subprocess_exec(
+            "ffmpeg",
+            "-nostdin",
+            "-v",
+            "info",
+            "-nostats",
+            *skip,
+            "-i",
+            str(path),
+            "-map",
+            "0:v:0?",
+            "-vf",
+            f"scale='min({width},iw)':-2,select='eq(n,0)+gt(scene,{threshold})',showinfo",
+            "-fps_mode",
+            "vfr",
+            "-c:v",
+            "png",
+            "-f",
+            "image2pipe",
+            "-",
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        times: asyncio.Queue = asyncio.Queue()
+        last_lines: Deque[bytes] = deque(maxlen=3)
+
+        async def read_log():
+            # showinfo logs each selected frame, before it is encoded
+            try:
+                async for line in process.stderr:
+                    match = FRAME_TIME.search(line)
+                    if match:
+                        times.put_nowait(float(match.group(1)))
+                    else:
+                        last_lines.append(line.strip())
+            finally:
+                times.put_nowait(None)
+
+        log = asyncio.create_task(read_log())
+        try:
+            buffer, last_time = b"", 0.0
+            while True:
+                data = await process.stdout.read(1 << 20)
+                if not data:
+                    break
+                buffer += data
+                while (end := buffer.find(PNG_END)) != -1:
+                    png, buffer = (
+                        buffer[: end + len(PNG_END)],
+                        buffer[end + len(PNG_END) :],
+                    )
+                    at = await times.get()
+                    if at is None:  # the log ended first, keep the end marker
+                        times.put_nowait(None)
+                    else:
+                        last_time = at
+                    yield max(last_time, 0.0), Image.open(BytesIO(png))
+            await log
+            if await process.wait() != 0:
+                message = b" ".join(last_lines).decode(errors="replace")
+                if "does not contain any stream" in message:
+                    return  # no video track
+                raise RuntimeError(
+                    f"ffmpeg could not read the video of {path.name}: {message}"
+                )
+        finally:
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+            log.cancel()
+
+    async def _keyframes(self, path: Path) -> List[Tuple[float, str]]:
+        """
+        (time, caption) of the distinct scenes of a video. Frames too close in
+        time to the last kept one (at most `max_per_minute` are kept), blank
+        ones and near duplicates of a kept one (slides shown again) are not
+        captioned. Best effort: a failure leaves the transcript alone.
+        """
+        interval = 60 / self.video.get("max_per_minute", 6)
+        max_difference = self.video.get("max_difference", 0.002)
+        kept: List[np.ndarray] = []
+        last = None
+        captions = []
+        try:
+            async for at, frame in self._frames(path):
+                if last is not None and at - last < interval:
+                    continue
+                reason = await asyncio.to_thread(self.image_filter.reject_reason, frame)
+                if reason is not None:
+                    continue
+                small = await asyncio.to_thread(thumbnail, frame)
+                if any(changed_pixels(small, k) <= max_difference for k in kept):
+                    continue
+                kept.append(small)
+                last = at
+                captions.append(
+                    (at, asyncio.ensure_future(self.get_image_description(frame)))
+                )
+            described = await asyncio.gather(*(caption for _, caption in captions))
+        except Exception:
+            for _, caption in captions:
+                caption.cancel()
+            logger.exception("Keyframe captioning failed", path=str(path))
+            return []
+        except BaseException:
+            for _, caption in captions:
+                caption.cancel()
+            raise
+        logger.debug(
+            "Video keyframes captioned", path=str(path), keyframes=len(captions)
+        )
+        return [(at, text) for (at, _), text in zip(captions, described)]
+
+    async def _segments(self, path: Path) -> AsyncIterator[Tuple[float, np.ndarray]]:
+        segmenter = SpeechSegmenter(self.settings.get("vad", {}))
+        async for samples in self._decode(path):
+            for segment in segmenter.feed(samples):
+                yield segment
+        for segment in segmenter.flush():
+            yield segment
+
+    async def _transcribe(
+        self,
+        audio: np.ndarray,
+        language: asyncio.Future,
+        detects: bool,
+        slots: asyncio.Semaphore,
+    ) -> str:
+        try:
+            # the first segment tells the language of the others
+            lang = None if detects else await asyncio.shield(language)
+            ref = ray.put(audio)
+            result = await self.pool.transcribe.remote([ref], lang)
+            if detects and not language.done():
+                language.set_result(result["language"])
+            return result["text"]
+        except BaseException:
+            if detects and not language.done():
+                language.set_result(None)
+            raise
+        finally:
+            slots.release()
 
     async def aload_document(
         self, file_path, metadata: dict = None, save_markdown=False
@@ -41,26 +487,56 @@ class VideoAudioLoader(BaseLoader):
             )
             return None
 
-        # load it in wave format
-        if path.suffix == ".wav":
-            audio_path_wav = path
-        else:
-            sound = AudioSegment.from_file(file=path, format=path.suffix[1:])
-
-            audio_path_wav = path.with_suffix(".wav")  # Export to wav format
-            sound.export(
-                audio_path_wav,
-                format="wav",
-            )
-
         logger.info(f"SOUND: {file_path}")
-        result = self.transcriber.model.transcribe(str(audio_path_wav))
-
-        if path.suffix != ".wav":
-            os.remove(audio_path_wav)
+        start = time.time()
+        language = asyncio.get_running_loop().create_future()
+        if self.language:
+            language.set_result(self.language)
+        slots = asyncio.Semaphore(self.max_pending)
+        ranges, tasks = [], []
+        keyframes = None
+        try:
+            # the first failing segment cancels the others
+            async with asyncio.TaskGroup() as group:
+                if (
+                    self.video is not None
+                    and path.suffix in VIDEO_FORMATS
+                    and self.config.loader["image_captioning"]
+                ):
+                    keyframes = group.create_task(self._keyframes(path))
+                async for offset, audio in self._segments(path):
+                    await slots.acquire()
+                    detects = not tasks and not self.language
+                    tasks.append(
+                        group.create_task(
+                            self._transcribe(audio, language, detects, slots)
+                        )
+                    )
+                    ranges.append(
+                        [round(offset, 2), round(offset + len(audio) / SAMPLE_RATE, 2)]
+                    )
+        except ExceptionGroup as e:
+            raise e.exceptions[0]
 
-        content = result["text"]
-        doc = Document(page_content=content, metadata=metadata)
+        # keyframe captions go between the transcript segments, by time
+        parts = [(r[0], r, task.result()) for r, task in zip(ranges, tasks)]
+        if keyframes is not None:
+            parts += [(at, [round(at, 2)] * 2, text) for at, text in keyframes.result()]
+        parts.sort(key=lambda part: part[0])
+        content = "".join(
+            f"{text.strip()}\n[PAGE_{n}]\n"
+            for n, (_, _, text) in enumerate(parts, start=1)
+        ).strip()
+        doc = Document(
+            page_content=content,
+            metadata={**(metadata or {}), "segments": [r for _, r, _ in parts]},
+        )
         if save_markdown:
             self.save_document(Document(page_content=content), str(file_path))
+        logger.info(
+            f"Transcribed {file_path} in {time.time() - start:.2f}s",
+            segments=len(tasks),
+            keyframes=len(parts) - len(tasks),
+            language=language.result() if language.done() else None,
+        )
         return doc
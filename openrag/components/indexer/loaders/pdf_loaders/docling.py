@@ -1,4 +1,5 @@
 import asyncio
+from typing import Dict, Optional, Tuple
 
 import torch
 from components.utils import SingletonMeta
@@ -19,6 +20,8 @@ from tqdm.asyncio import tqdm
 from utils.logger import get_logger
 
 from ..base import BaseLoader
+from ..substitution import substitute_in_order
+from .triage import PDFTriage, assemble_pages, page_runs
 
 logger = get_logger()
 
@@ -49,8 +52,11 @@ class DoclingConverter(metaclass=SingletonMeta):
             }
         )
 
-    async def convert_to_md(self, file_path) -> ConversionResult:
-        o = await asyncio.to_thread(self.converter.convert, str(file_path))
+    async def convert_to_md(
+        self, file_path, page_range: Optional[Tuple[int, int]] = None
+    ) -> ConversionResult:
+        kwargs = {} if page_range is None else {"page_range": page_range}
+        o = await asyncio.to_thread(self.converter.convert, str(file_path), **kwargs)
         return o
 
 
@@ -58,36 +64,67 @@ class DoclingLoader(BaseLoader):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.converter = DoclingConverter()
+        triage = self.config.loader.get("pdf_triage")
+        self.triage = PDFTriage(triage) if triage and triage.enable else None
 
     async def convert_to_md(self, file_path) -> ConversionResult:
         return await asyncio.to_thread(self.converter.convert, str(file_path))
 
+    def reset(self):
+        # free the cached activations of the model, kept for the next document
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
     async def aload_document(self, file_path, metadata, save_markdown=False):
-        with torch.no_grad():
-            result = await self.converter.convert_to_md(file_path)
+        page_count, ocr_pages = None, None
+        if self.triage is not None:
+            page_count, ocr_pages = await asyncio.to_thread(
+                self.triage.classify, str(file_path)
+            )
+            logger.info(
+                "PDF triage",
+                path=str(file_path),
+                pages=page_count,
+                ocr_pages=len(ocr_pages),
+            )
+
+        if ocr_pages is None or len(ocr_pages) == page_count:
+            pages = await self._convert_pages(file_path)
+            page_count = len(pages)
+        else:
+            # text layer for clean pages, Docling for the others
+            ocr = set(ocr_pages)
+            text_pages = [i for i in range(page_count) if i not in ocr]
+            pages = await self.triage.text_pages(str(file_path), text_pages, self)
+            for page_range in page_runs(ocr_pages):
+                pages.update(await self._convert_pages(file_path, page_range))
+
+        enriched_content = assemble_pages(pages, range(page_count))
+        doc = Document(page_content=enriched_content, metadata=metadata)
+        if save_markdown:
+            self.save_document(Document(page_content=enriched_content), str(file_path))
+        return doc
 
-        n_pages = len(result.pages)
+    async def _convert_pages(
+        self, file_path, page_range: Optional[Tuple[int, int]] = None
+    ) -> Dict[int, str]:
+        """Markdown of the converted (0-based) pages, images captioned."""
+        with torch.no_grad():
+            result = await self.converter.convert_to_md(file_path, page_range)
 
-        s = ""
-        for i in range(1, n_pages + 1):
-            s += result.document.export_to_markdown(page_no=i)
-            s += f"\n[PAGE_{i}]\n"
+        pages = {
+            page_no - 1: result.document.export_to_markdown(page_no=page_no)
+            for page_no in sorted(result.document.pages)
+        }
 
-        enriched_content = s
         if self.config.loader["image_captioning"]:
-            pictures = result.document.pictures
-            descriptions = await self.get_captions(pictures)
-            for description in descriptions:
-                enriched_content = enriched_content.replace(
-                    "<!-- image -->", description, 1
-                )
+            # pictures come in document order, like their placeholders
+            descriptions = iter(await self.get_captions(result.document.pictures))
+            for n, markdown in pages.items():
+                pages[n] = substitute_in_order(markdown, "<!-- image -->", descriptions)
         else:
             logger.debug("Image captioning disabled. Ignoring images.")
-
-        doc = Document(page_content=enriched_content, metadata=metadata)
-        if save_markdown:
-            self.save_document(Document(page_content=enriched_content), str(file_path))
-        return doc
+        return pages
 
     async def get_captions(self, pictures: list[PictureItem]):
         tasks = []
@@ -1,9 +1,14 @@
 import asyncio
 import gc
+import os
 import re
+import signal
+import threading
 import time
+import uuid
+from collections import deque
 from pathlib import Path
-from typing import Dict, Optional, Union
+from typing import AsyncIterator, Deque, Dict, List, Optional, Set, Tuple, Union
 
 import ray
 import torch
@@ -12,8 +17,12 @@ from langchain_core.documents.base import Document
 from marker.converters.pdf import PdfConverter
 from tqdm.asyncio import tqdm
 from utils.logger import get_logger
+from utils.metrics import metrics
 
+from ...actor_pool import ActorPool
 from ..base import BaseLoader
+from ..substitution import substitute
+from .triage import PDFTriage, assemble_pages
 
 logger = get_logger()
 config = load_config()
@@ -23,11 +32,12 @@ if torch.cuda.is_available():
 else:  # On CPU
     MARKER_NUM_GPUS = 0
 
+# seconds between checks of a running conversion for cancellation
+CANCEL_POLL_SECONDS = 1
+
 @ray.remote(num_gpus=MARKER_NUM_GPUS)
 class MarkerWorker:
     def __init__(self):
-        import os
-
         from config import load_config
         from utils.logger import get_logger
 
@@ -48,6 +58,10 @@ class MarkerWorker:
         os.environ["RAY_ADDRESS"] = "auto"
 
         self.pool = None
+        # (job id, pid) sent by each child process when it starts a conversion
+        self._started = None
+        self._child_pids: Dict[str, int] = {}
+        self._pids_lock = threading.Lock()
         self.init_resources()
 
     def init_resources(self):
@@ -79,25 +93,30 @@ class MarkerWorker:
 
         self.logger.info(f"Initializing MarkerWorker with {self._workers} workers")
         ctx = mp.get_context("spawn")
+        with self._pids_lock:
+            self._started = ctx.SimpleQueue()
+            self._child_pids.clear()
         self.pool = ctx.Pool(
             processes=self._workers,
             initializer=self._worker_init,
-            initargs=(self.model_dict,),
+            initargs=(self.model_dict, self._started),
             maxtasksperchild=self.maxtasksperchild,
         )
 
         self.logger.info("MarkerWorker initialized with multiprocessing pool")
 
     @staticmethod
-    def _worker_init(model_dict):
-        global worker_model_dict
+    def _worker_init(model_dict, started):
+        global worker_model_dict, worker_started
         worker_model_dict = model_dict
+        worker_started = started
         logger.debug("Worker initialized with model dictionary")
 
     @staticmethod
-    def _process_pdf(file_path, config):
+    def _process_pdf(file_path, config, job_id):
         global worker_model_dict
 
+        worker_started.put((job_id, os.getpid()))
         try:
             logger.debug("Processing PDF", path=file_path)
             converter = PdfConverter(
@@ -115,19 +134,34 @@ class MarkerWorker:
                 torch.cuda.empty_cache()
                 torch.cuda.ipc_collect()
 
-    async def process_pdf(self, file_path: str):
+    async def process_pdf(self, file_path: str, page_range: Optional[List[int]] = None):
+        """
+        Convert a PDF, or only the pages of `page_range` (0-based). Pages keep
+        their number in the whole document, in page markers and image keys.
+        """
         from multiprocessing.context import TimeoutError as MPTimeoutError
 
         config = self.converter_config.copy()
+        if page_range is not None:
+            config["page_range"] = page_range
         loop = asyncio.get_event_loop()
+        job_id = uuid.uuid4().hex
+        cancelled = threading.Event()
 
         def run_with_timeout():
-            async_result = self.pool.apply_async(self._process_pdf, (file_path, config))
+            async_result = self.pool.apply_async(
+                self._process_pdf, (file_path, config, job_id)
+            )
+            deadline = time.monotonic() + self.config.loader.get("marker_timeout")
             try:
-                result = async_result.get(
-                    timeout=self.config.loader.get("marker_timeout")
-                )
-                return result
+                while not async_result.ready():
+                    if cancelled.is_set() and self._kill_child(job_id):
+                        # the pool replaces the killed process
+                        return None
+                    if time.monotonic() >= deadline:
+                        raise MPTimeoutError
+                    async_result.wait(CANCEL_POLL_SECONDS)
+                return async_result.get()
             except MPTimeoutError:
                 self.logger.exception(
                     "MarkerWorker child process timed out", path=file_path
@@ -139,14 +173,53 @@ class MarkerWorker:
                     "Error processing with MarkerWorker", path=file_path
                 )
                 raise
+            finally:
+                self._child_pid(job_id)
+                with self._pids_lock:
+                    self._child_pids.pop(job_id, None)
 
-        result = await loop.run_in_executor(None, run_with_timeout)
+        with metrics.timer("marker", loader="MarkerLoader", file_type="pdf"):
+            try:
+                result = await loop.run_in_executor(None, run_with_timeout)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
         return result.markdown, result.images
 
+    def _child_pid(self, job_id: str) -> Optional[int]:
+        """Process converting a job, None until a child process picked it up."""
+        with self._pids_lock:
+            while not self._started.empty():
+                started_job, pid = self._started.get()
+                self._child_pids[started_job] = pid
+            return self._child_pids.get(job_id)
+
+    def _kill_child(self, job_id: str) -> bool:
+        pid = self._child_pid(job_id)
+        if pid is None:
+            return False
+        self.logger.info("Killing the Marker process of a cancelled PDF", pid=pid)
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        return True
+
     def get_current_pool_size(self):
         return len([p for p in self.pool._pool if p.is_alive()])
 
 
+async def _none():
+    return None
+
+
+def _page_count(file_path: str) -> int:
+    import pymupdf
+
+    with pymupdf.open(file_path) as pdf:
+        return pdf.page_count
+
+
 @ray.remote
 class MarkerPool:
     def __init__(self):
@@ -157,52 +230,111 @@ class MarkerPool:
         self.config = load_config()
         self.min_processes = self.config.loader.get("marker_min_processes")
         self.max_processes = self.config.loader.get("marker_max_processes")
-        self.pool_size = config.loader.get("marker_pool_size")
-        self.actors = [MarkerWorker.remote() for _ in range(self.pool_size)]
-        self._queue: asyncio.Queue[ray.actor.ActorHandle] = asyncio.Queue()
-
-        for _ in range(self.pool_size):
-            for actor in self.actors:
-                self._queue.put_nowait(actor)
+        self.split_min_pages = self.config.loader.get("marker_split_min_pages", 0)
+        # each worker runs one PDF per process of its multiprocessing pool
+        self.pool = ActorPool.from_config(
+            "marker",
+            MarkerWorker,
+            slots_per_actor=self.max_processes,
+            pools_config=self.config.ray.actor_pools,
+            health_check=self.ensure_worker_pool_healthy,
+            logger=self.logger,
+        )
 
         self.logger.info(
-            f"Marker pool: {self.pool_size} actors × {self.max_processes} slots = "
-            f"{self.pool_size * self.max_processes} PDF concurrency"
+            f"Marker pool: {self.pool.min_actors}-{self.pool.max_actors} actors × "
+            f"{self.max_processes} slots"
         )
 
-    async def ensure_worker_pool_healthy(self, worker):
+    async def ensure_worker_pool_healthy(self, worker) -> bool:
         current_alive = await worker.get_current_pool_size.remote()
         if current_alive < self.min_processes:
             self.logger.warning(
                 f"Only {current_alive}/{self.min_processes} worker processes alive. Reinitializing pool..."
             )
             await worker.setup_mp.remote()
+        return True
+
+    def _page_ranges(self, pages: List[int]) -> List[List[int]]:
+        """
+        Pages converted by each worker slot: all of them, or for long PDFs up
+        to one range per slot of the pool, of at least `split_min_pages`.
+        """
+        parts = 1
+        if self.split_min_pages:
+            parts = min(self.pool.capacity, len(pages) // self.split_min_pages)
+        if parts < 2:
+            return [pages]
+        bounds = [round(i * len(pages) / parts) for i in range(parts + 1)]
+        return [pages[start:end] for start, end in zip(bounds, bounds[1:])]
+
+    async def process_pdf(self, file_path: str, pages: Optional[List[int]] = None):
+        """
+        Convert a PDF, or only the given (0-based) pages; long ones are split
+        in page ranges converted at the same time by several worker processes,
+        then stitched back in order.
+        """
+        if pages is None and not self.split_min_pages:
+            return await self._convert(file_path)
+        whole = pages is None
+        if whole:
+            pages = list(range(await asyncio.to_thread(_page_count, file_path)))
+        page_ranges = self._page_ranges(pages)
+        if len(page_ranges) == 1:
+            return await self._convert(file_path, None if whole else pages)
 
-    async def process_pdf(self, file_path: str):
+        self.logger.info(
+            "Converting PDF in page ranges", path=file_path, parts=len(page_ranges)
+        )
+        try:
+            # the first failing range cancels the others
+            async with asyncio.TaskGroup() as group:
+                parts = [
+                    group.create_task(self._convert(file_path, page_range))
+                    for page_range in page_ranges
+                ]
+        except ExceptionGroup as e:
+            raise e.exceptions[0]
+        markdown = "\n\n".join(part.result()[0] for part in parts)
+        images = {}
+        for part in parts:
+            images.update(part.result()[1])  # keys hold the page number
+        return markdown, images
+
+    async def _convert(self, file_path: str, page_range: Optional[List[int]] = None):
         # Wait until any slot is free
-        worker = await self._queue.get()
-        if worker:
-            self.logger.info("MarkerWorker allocated")
-            # Ensure the worker pool is healthy
-            await self.ensure_worker_pool_healthy(worker)
+        worker = await self.pool.acquire()
+        self.logger.info("MarkerWorker allocated")
+        failed = False
+        ref = worker.process_pdf.remote(file_path, page_range)
         try:
-            markdown, images = await worker.process_pdf.remote(file_path)
+            markdown, images = await ref
             return markdown, images
+        except asyncio.CancelledError:
+            # the worker kills the process converting the PDF
+            ray.cancel(ref)
+            raise
         except Exception as e:
+            failed = isinstance(e, ray.exceptions.RayActorError)
             self.logger.exception(
                 "Error processing PDF with MarkerWorker", error=str(e)
             )
             raise
         finally:
-            await self._queue.put(worker)
+            self.pool.release(worker, failed=failed)
             self.logger.debug("MarkerWorker returned to pool")
 
+    async def get_stats(self) -> Dict:
+        return self.pool.stats()
+
 
 class MarkerLoader(BaseLoader):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.page_sep = "[PAGE_SEP]"
         self.worker = ray.get_actor("MarkerPool", namespace="openrag")
+        triage = self.config.loader.get("pdf_triage")
+        self.triage = PDFTriage(triage) if triage and triage.enable else None
 
     async def aload_document(
         self,
@@ -210,45 +342,171 @@ class MarkerLoader(BaseLoader):
         metadata: Optional[Dict] = None,
         save_markdown: bool = False,
     ) -> Document:
+        file_path_str = str(file_path)
+        try:
+            page_count, ocr = await self._triage(file_path_str)
+            return await self._load(
+                file_path_str, page_count, ocr, metadata or {}, save_markdown
+            )
+        except Exception:
+            logger.exception("Error in aload_document", path=file_path_str)
+            raise
+
+    async def aload_pages(
+        self,
+        file_path: Union[str, Path],
+        metadata: Optional[Dict] = None,
+        save_markdown: bool = False,
+    ) -> AsyncIterator[Document]:
+        """
+        Long PDFs come in batches of `page_streaming.batch_pages` pages, up to
+        `page_streaming.prefetch` of them being converted at the same time.
+        """
         if metadata is None:
             metadata = {}
-
         file_path_str = str(file_path)
-        start = time.time()
+        streaming = self.config.loader.page_streaming
 
         try:
-            markdown, images = await self.worker.process_pdf.remote(file_path_str)
+            page_count, ocr = await self._triage(file_path_str)
+            if page_count is None and streaming.batch_pages:
+                page_count = await asyncio.to_thread(_page_count, file_path_str)
+        except Exception:
+            logger.exception("Error in aload_pages", path=file_path_str)
+            raise
+        if not streaming.batch_pages or page_count < 2 * streaming.batch_pages:
+            yield await self._load(
+                file_path_str, page_count, ocr, metadata, save_markdown
+            )
+            return
+
+        if ocr is None:
+            ocr = set(range(page_count))
+        batches = [
+            list(range(first, min(first + streaming.batch_pages, page_count)))
+            for first in range(0, page_count, streaming.batch_pages)
+        ]
+        start = time.time()
+        parts = []
+        pending: Deque[Tuple[List[int], asyncio.Task]] = deque()
+
+        async def next_batch() -> Document:
+            pages, task = pending.popleft()
+            markdown = assemble_pages(await task, pages).replace("<br>", " <br> ")
+            logger.debug(
+                "Page batch converted",
+                path=file_path_str,
+                pages=f"{pages[0] + 1}-{pages[-1] + 1}",
+            )
+            if save_markdown:
+                parts.append(markdown)
+            return Document(page_content=markdown, metadata=metadata)
 
-            if not markdown:
-                raise RuntimeError(f"Conversion failed for {file_path_str}")
+        try:
+            for pages in batches:
+                task = asyncio.create_task(self._load_pages(file_path_str, pages, ocr))
+                pending.append((pages, task))
+                if len(pending) >= streaming.prefetch:
+                    yield await next_batch()
+            while pending:
+                yield await next_batch()
+        except Exception:
+            logger.exception("Error in aload_pages", path=file_path_str)
+            raise
+        finally:
+            for _, task in pending:
+                task.cancel()
 
-            if self.config["loader"]["image_captioning"]:
-                captions_dict = await self._get_captions(images)
-                for key, desc in captions_dict.items():
-                    tag = f"![]({key})"
-                    markdown = markdown.replace(tag, desc)
+        if save_markdown:
+            self.save_document(
+                Document(page_content="".join(parts).strip()), file_path_str
+            )
+        duration = time.time() - start
+        logger.info(
+            f"Processed {file_path_str} in {duration:.2f}s", batches=len(batches)
+        )
 
-            else:
-                logger.debug("Image captioning disabled.")
+    async def _triage(self, file_path: str) -> Tuple[Optional[int], Optional[Set[int]]]:
+        """Page count and pages needing OCR; (None, None) without triage."""
+        if self.triage is None:
+            return None, None
+        page_count, ocr_pages = await asyncio.to_thread(self.triage.classify, file_path)
+        logger.info(
+            "PDF triage", path=file_path, pages=page_count, ocr_pages=len(ocr_pages)
+        )
+        return page_count, set(ocr_pages)
 
+    async def _load(
+        self,
+        file_path: str,
+        page_count: Optional[int],
+        ocr: Optional[Set[int]],
+        metadata: Dict,
+        save_markdown: bool,
+    ) -> Document:
+        start = time.time()
+        if ocr is None or len(ocr) == page_count:
+            markdown = await self._convert(file_path)
             markdown = markdown.split(self.page_sep, 1)[1]
             markdown = re.sub(
                 r"\{(\d+)\}" + re.escape(self.page_sep), r"[PAGE_\1]", markdown
             )
-            markdown = markdown.replace("<br>", " <br> ").strip()
-
-            doc = Document(page_content=markdown, metadata=metadata)
-
-            if save_markdown:
-                self.save_document(doc, file_path_str)
+        else:
+            pages = await self._load_pages(file_path, list(range(page_count)), ocr)
+            markdown = assemble_pages(pages, range(page_count))
+        markdown = markdown.replace("<br>", " <br> ").strip()
+
+        doc = Document(page_content=markdown, metadata=metadata)
+
+        if save_markdown:
+            self.save_document(doc, file_path)
+
+        duration = time.time() - start
+        logger.info(f"Processed {file_path} in {duration:.2f}s")
+        return doc
+
+    async def _load_pages(
+        self, file_path: str, pages: List[int], ocr: Set[int]
+    ) -> Dict[int, str]:
+        """Markdown of some pages: text layer for the clean ones, Marker for the others."""
+        ocr_pages = [i for i in pages if i in ocr]
+        text_pages = [i for i in pages if i not in ocr]
+        text, converted = await asyncio.gather(
+            self.triage.text_pages(file_path, text_pages, self)
+            if text_pages
+            else _none(),
+            self._convert(file_path, ocr_pages) if ocr_pages else _none(),
+        )
+        markdown = text or {}
+        if converted is not None:
+            markdown.update(self._split_pages(converted))
+        return markdown
+
+    async def _convert(self, file_path: str, pages: Optional[List[int]] = None) -> str:
+        """Paginated Marker markdown of the PDF (or of some pages), images captioned."""
+        ref = self.worker.process_pdf.remote(file_path, pages)
+        try:
+            markdown, images = await ref
+        except asyncio.CancelledError:
+            ray.cancel(ref)
+            raise
 
-            duration = time.time() - start
-            logger.info(f"Processed {file_path_str} in {duration:.2f}s")
-            return doc
+        if not markdown:
+            raise RuntimeError(f"Conversion failed for {file_path}")
 
-        except Exception:
-            logger.exception("Error in aload_document", path=file_path_str)
-            raise
+        if self.config["loader"]["image_captioning"]:
+            captions_dict = await self._get_captions(images)
+            markdown = substitute(
+                markdown, {f"![]({key})": desc for key, desc in captions_dict.items()}
+            )
+        else:
+            logger.debug("Image captioning disabled.")
+        return markdown
+
+    def _split_pages(self, markdown: str) -> Dict[int, str]:
+        """Paginated Marker markdown, by (0-based) page number."""
+        parts = re.split(r"\{(\d+)\}" + re.escape(self.page_sep), markdown)
+        return {int(n): content for n, content in zip(parts[1::2], parts[2::2])}
 
     async def _get_captions(self, img_dict: dict) -> dict:
         if not img_dict:
@@ -0,0 +1,135 @@
+import asyncio
+import base64
+import re
+import unicodedata
+from io import BytesIO
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+import pymupdf
+import pymupdf4llm
+from PIL import Image
+from utils.logger import get_logger
+
+from ..substitution import substitute_in_order
+
+logger = get_logger()
+
+EMBEDDED_IMAGE = re.compile(r"!\[[^\]]*\]\(data:image/[\w.+-]+;base64,([^)\s]+)\)")
+
+
+def _image_coverage(page) -> float:
+    """Share of the page area covered by images (overlaps counted twice)."""
+    page_area = abs(page.rect) or 1
+    covered = 0.0
+    for info in page.get_image_info():
+        bbox = pymupdf.Rect(info["bbox"]) & page.rect
+        covered += abs(bbox)
+    return min(covered / page_area, 1.0)
+
+
+def _bad_glyph_ratio(text: str) -> float:
+    """Share of characters a broken font encoding produces: U+FFFD, controls, private use."""
+    chars = [c for c in text if not c.isspace()]
+    if not chars:
+        return 0.0
+    bad = sum(c == "\ufffd" or unicodedata.category(c) in ("Cc", "Co") for c in chars)
+    return bad / len(chars)
+
+
+class PDFTriage:
+    """
+    Sorts the pages of a PDF between the text layer and the OCR loader.
+
+    A page is sent to OCR when its text layer is (nearly) empty, when images
+    cover most of it (scans, slides exported as pictures), or when its text is
+    garbled by a broken font encoding. The other pages are rendered from their
+    text layer with pymupdf4llm, in milliseconds.
+    """
+
+    def __init__(self, settings):
+        self.min_chars = settings.get("min_chars", 50)
+        self.max_image_coverage = settings.get("max_image_coverage", 0.5)
+        self.max_bad_glyph_ratio = settings.get("max_bad_glyph_ratio", 0.05)
+
+    def _needs_ocr(self, page) -> bool:
+        text = page.get_text("text")
+        if len(text.strip()) < self.min_chars:
+            return True
+        if _image_coverage(page) > self.max_image_coverage:
+            return True
+        return _bad_glyph_ratio(text) > self.max_bad_glyph_ratio
+
+    def classify(self, file_path: str) -> Tuple[int, List[int]]:
+        """Page count and the (0-based) pages needing OCR. Blocks: call it from a thread."""
+        with pymupdf.open(file_path) as pdf:
+            ocr_pages = [page.number for page in pdf if self._needs_ocr(page)]
+            return pdf.page_count, ocr_pages
+
+    async def text_pages(
+        self, file_path: str, pages: List[int], loader
+    ) -> Dict[int, str]:
+        """Markdown of the given (0-based) pages from their text layer, images captioned by `loader`."""
+        captioning = loader.config.loader["image_captioning"]
+        chunks = await asyncio.to_thread(
+            pymupdf4llm.to_markdown,
+            file_path,
+            pages=pages,
+            page_chunks=True,
+            write_images=False,
+            embed_images=captioning,
+            show_progress=False,
+        )
+        markdown = {chunk["metadata"]["page"] - 1: chunk["text"] for chunk in chunks}
+        if captioning:
+            captioned = await asyncio.gather(
+                *(self._caption_images(text, loader) for text in markdown.values())
+            )
+            markdown = dict(zip(markdown, captioned))
+        return markdown
+
+    @staticmethod
+    async def _caption_images(text: str, loader) -> str:
+        matches = list(EMBEDDED_IMAGE.finditer(text))
+        if not matches:
+            return text
+        images = []
+        for match in matches:
+            try:
+                images.append(Image.open(BytesIO(base64.b64decode(match.group(1)))))
+            except Exception:
+                logger.warning("Skipping an undecodable embedded image")
+                images.append(None)
+        captions = await asyncio.gather(
+            *(
+                loader.get_image_description(image)
+                for image in images
+                if image is not None
+            )
+        )
+        captions = iter(captions)
+        return substitute_in_order(
+            text,
+            EMBEDDED_IMAGE,
+            (next(captions) if image is not None else "" for image in images),
+        )
+
+
+def assemble_pages(pages: Dict[int, str], page_numbers: Iterable[int]) -> str:
+    """Markdown of the given (0-based) pages, in order, each followed by its [PAGE_N] marker."""
+    return "".join(
+        f"{pages.get(i, '').strip()}\n[PAGE_{i + 1}]\n" for i in page_numbers
+    )
+
+
+def page_runs(pages: List[int]) -> Iterator[Tuple[int, int]]:
+    """Contiguous runs of sorted (0-based) pages, as 1-based inclusive (first, last) ranges."""
+    start = prev = None
+    for page in pages:
+        if prev is not None and page == prev + 1:
+            prev = page
+            continue
+        if start is not None:
+            yield start + 1, prev + 1
+        start = prev = page
+    if start is not None:
+        yield start + 1, prev + 1
@@ -1,5 +1,4 @@
 import html
-import re
 from io import BytesIO
 import pptx
 from langchain_core.documents.base import Document
@@ -7,6 +6,7 @@ from PIL import Image
 from tqdm.asyncio import tqdm
 
 from .base import BaseLoader
+from .substitution import substitute_in_order
 
 
 class PPTXConverter:
@@ -17,60 +17,54 @@ class PPTXConverter:
         self.page_separator = page_separator
 
     def convert(self, local_path):
-        md_content = ""
         presentation = pptx.Presentation(local_path)
-        slide_num = 0
+        slides = []
         images_list = []
-        for slide in presentation.slides:
-            slide_num += 1
-
+        for slide_num, slide in enumerate(presentation.slides, start=1):
+            parts = []
             title = slide.shapes.title
             for shape in slide.shapes:
                 if self._is_picture(shape):
                     images_list.append(Image.open(BytesIO(shape.image.blob)))
-                    md_content += self.image_placeholder
+                    parts.append(self.image_placeholder)
 
                 # Tables
                 if self._is_table(shape):
-                    html_table = "<html><body><table>"
-                    first_row = True
-                    for row in shape.table.rows:
-                        html_table += "<tr>"
-                        for cell in row.cells:
-                            if first_row:
-                                html_table += "<th>" + html.escape(cell.text) + "</th>"
-                            else:
-                                html_table += "<td>" + html.escape(cell.text) + "</td>"
-                        html_table += "</tr>"
-                        first_row = False
-                    html_table += "</table></body></html>"
-                    md_content += (
+                    rows = []
+                    for i, row in enumerate(shape.table.rows):
+                        tag = "th" if i == 0 else "td"
+                        cells = (
+                            f"<{tag}>{html.escape(cell.text)}</{tag}>"
+                            for cell in row.cells
+                        )
+                        rows.append(f"<tr>{''.join(cells)}</tr>")
+                    html_table = (
+                        f"<html><body><table>{''.join(rows)}</table></body></html>"
+                    )
+                    parts.append(
                         "\n" + self._convert(html_table).text_content.strip() + "\n"
                     )
 
                 # Charts
                 if shape.has_chart:
-                    md_content += self._convert_chart_to_markdown(shape.chart)
+                    parts.append(self._convert_chart_to_markdown(shape.chart))
 
                 # Text areas
                 elif shape.has_text_frame:
                     if shape == title:
-                        md_content += "# " + shape.text.lstrip() + "\n"
+                        parts.append("# " + shape.text.lstrip() + "\n")
                     else:
-                        md_content += shape.text + "\n"
-
-            md_content = md_content.strip()
+                        parts.append(shape.text + "\n")
 
             if slide.has_notes_slide:
-                md_content += "\n\n### Notes:\n"
+                parts.append("\n\n### Notes:\n")
                 notes_frame = slide.notes_slide.notes_text_frame
                 if notes_frame is not None:
-                    md_content += notes_frame.text
-                md_content = md_content.strip()
+                    parts.append(notes_frame.text)
 
-            md_content += f"\n[PAGE_{slide_num}]\n"
+            slides.append(f"{''.join(parts).strip()}\n[PAGE_{slide_num}]\n")
 
-        return md_content, images_list
+        return "".join(slides).lstrip(), images_list
 
     def _is_picture(self, shape):
         if shape.shape_type == pptx.enum.shapes.MSO_SHAPE_TYPE.PICTURE:
@@ -86,10 +80,8 @@ class PPTXConverter:
         return False
 
     def _convert_chart_to_markdown(self, chart):
-        md = "\n\n### Chart"
-        if chart.has_title:
-            md += f": {chart.chart_title.text_frame.text}"
-        md += "\n\n"
+        title = f": {chart.chart_title.text_frame.text}" if chart.has_title else ""
+        md = f"\n\n### Chart{title}\n\n"
         data = []
         category_names = [c.label for c in chart.plots[0].categories]
         series_names = [s.name for s in chart.series]
@@ -112,7 +104,7 @@ class PPTXConverter:
 class PPTXLoader(BaseLoader):
     def __init__(self, **kwargs) -> None:
         super().__init__(**kwargs)
-        self.image_placeholder = r"<image>"
+        self.image_placeholder = "<image>"
         self.converter = PPTXConverter(
             image_placeholder=self.image_placeholder, page_separator=self.page_sep
         )
@@ -125,14 +117,9 @@ class PPTXLoader(BaseLoader):
         md_content, imgs = self.converter.convert(local_path=file_path)
 
         images_captions = await self.get_captions(imgs)
-
-        for caption in images_captions:
-            md_content = re.sub(
-                self.image_placeholder,
-                caption.replace("\\", "/"),
-                md_content,
-                count=1,
-            )
+        md_content = substitute_in_order(
+            md_content, self.image_placeholder, images_captions
+        )
 
         doc = Document(page_content=md_content, metadata=metadata)
         if save_markdown:
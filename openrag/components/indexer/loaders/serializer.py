@@ -1,14 +1,21 @@
 import asyncio
-import gc
+import math
+import re
+import time
+from collections import deque
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Dict, Optional, Union
+from typing import Deque, Dict, Optional, Tuple, Type, Union
 
 import ray
 import torch
 from config import load_config
 from langchain_core.documents.base import Document
+from utils.metrics import file_type, metrics
 
+from ..actor_pool import ActorPool
 from . import get_loader_classes
+from .base import BaseLoader
 
 config = load_config()
 
@@ -18,9 +25,12 @@ if torch.cuda.is_available():
 else:  # On CPU
     NUM_GPUS = 0
 
-POOL_SIZE = config.ray.get("pool_size")
 MAX_TASKS_PER_WORKER = config.ray.get("max_tasks_per_worker")
 DICT_MIMETYPES = dict(config.loader["mimetypes"])
+PAGE_MARKER = re.compile(r"\[PAGE_(\d+)\]")
+
+# Priority classes, most urgent first
+PRIORITY_CLASSES = ("interactive", "bulk")
 
 
 @ray.remote(num_gpus=NUM_GPUS)
@@ -39,8 +49,48 @@ class DocSerializer:
 
         # Initialize loader classes:
         self.loader_classes = get_loader_classes(config=self.config)
+        # warm loader instances, created on first use and shared by documents
+        self._loaders: Dict[Type[BaseLoader], BaseLoader] = {}
         self.logger.info("DocSerializer initialized.")
 
+    def _get_loader(self, loader_cls: Type[BaseLoader]) -> BaseLoader:
+        loader = self._loaders.get(loader_cls)
+        if loader is None:
+            loader = self._loaders[loader_cls] = loader_cls(**self.kwargs)
+            self.logger.debug(f"Loader {loader_cls.__name__} initialized")
+        return loader
+
+    def _loader_for(self, path: Union[str, Path], metadata: Dict, log) -> BaseLoader:
+        p = Path(path)
+        file_ext = p.suffix
+        mimetype = metadata.get("mimetype", None)
+        # Get appropriate loader for the file type
+        if mimetype is None:
+            loader_cls = self.loader_classes.get(file_ext)
+        else:
+            loader_cls = self.loader_classes.get(DICT_MIMETYPES.get(mimetype))
+
+        if loader_cls is None:
+            log.warning(f"No loader available for {p.name}")
+            raise ValueError(f"No loader available for file type {file_ext}.")
+
+        log.debug(f"Loading document: {p.name} with loader {loader_cls.__name__}")
+        return self._get_loader(loader_cls)
+
+    async def _report_pages(
+        self, task_id: str, doc: Document, labels: Dict, counted: int = 0
+    ) -> int:
+        """
+        Record the pages of a serialized document, or of a page batch following
+        `counted` pages already recorded; returns the pages recorded so far.
+        """
+        pages = [int(n) for n in PAGE_MARKER.findall(doc.page_content)]
+        if not pages or max(pages) <= counted:
+            return counted
+        metrics.inc("openrag_pages_total", max(pages) - counted, **labels)
+        await self.task_state_manager.set_progress.remote(task_id, pages=max(pages))
+        return max(pages)
+
     async def serialize_document(
         self,
         task_id: str,
@@ -56,64 +106,203 @@ class DocSerializer:
         await self.task_state_manager.set_state.remote(task_id, "SERIALIZING")
 
         log.info("Starting document serialization")
+        loader = self._loader_for(path, metadata, log)
 
-        p = Path(path)
-        file_ext = p.suffix
-        mimetype = metadata.get("mimetype", None)
-        # Get appropriate loader for the file type
-        if mimetype is None:
-            loader_cls = self.loader_classes.get(file_ext)
-        else:
-            loader_cls = self.loader_classes.get(
-                DICT_MIMETYPES.get(mimetype)
-            )
+        labels = {
+            "loader": type(loader).__name__,
+            "file_type": file_type(path, metadata),
+            "partition": metadata.get("partition"),
+        }
+        try:
+            # Load the doc
+            with metrics.timer("serialize", **labels):
+                doc: Document = await loader.aload_document(
+                    file_path=path, metadata=metadata, save_markdown=self.save_markdown
+                )
 
+            log.info("Document serialized successfully")
+            await self._report_pages(task_id, doc, labels)
+            return doc
+        except Exception:
+            log.exception("Failed to serialize document")
+            raise
+        finally:
+            loader.reset()
 
-        if loader_cls is None:
-            log.warning(f"No loader available for {p.name}")
-            raise ValueError(f"No loader available for file type {file_ext}.")
+    @ray.method(num_returns="streaming")
+    async def serialize_pages(
+        self,
+        task_id: str,
+        path: Union[str, Path],
+        metadata: Optional[Dict] = {},
+    ):
+        """Like `serialize_document`, yielding the page batches of the loader."""
+        log = self.logger.bind(
+            file_id=metadata.get("file_id"),
+            partition=metadata.get("partition"),
+            task_id=task_id,
+        )
+        await self.task_state_manager.set_state.remote(task_id, "SERIALIZING")
 
-        log.debug(f"Loading document: {p.name} with loader {loader_cls.__name__}")
-        loader = loader_cls(**self.kwargs)
+        log.info("Starting document serialization")
+        loader = self._loader_for(path, metadata, log)
 
+        labels = {
+            "loader": type(loader).__name__,
+            "file_type": file_type(path, metadata),
+            "partition": metadata.get("partition"),
+        }
+        batches = pages = 0
         try:
-            # Load the doc
-            doc: Document = await loader.aload_document(
-                file_path=path, metadata=metadata, save_markdown=self.save_markdown
-            )
+            with metrics.timer("serialize", **labels):
+                async for batch in loader.aload_pages(
+                    file_path=path, metadata=metadata, save_markdown=self.save_markdown
+                ):
+                    batches += 1
+                    pages = await self._report_pages(
+                        task_id, batch, labels, counted=pages
+                    )
+                    yield batch
 
-            # Clean up resources
-            del loader
-            gc.collect()
-            if torch.cuda.is_available():
-                torch.cuda.empty_cache()
-                torch.cuda.ipc_collect()
-            log.info("Document serialized successfully")
-            return doc
+            log.info("Document serialized successfully", batches=batches)
         except Exception:
             log.exception("Failed to serialize document")
             raise
+        finally:
+            loader.reset()
+
+
+@dataclass
+class _Waiter:
+    task_id: str
+    partition: str
+    priority: str
+    enqueued_at: float = field(default_factory=time.monotonic)
+    future: asyncio.Future = field(
+        default_factory=lambda: asyncio.get_running_loop().create_future()
+    )
 
 
 @ray.remote
 class SerializerQueue:
+    """
+    Hands out the DocSerializer slots (MAX_TASKS_PER_WORKER per actor), from a
+    pool scaled between `ray.actor_pools.serializer.min_actors` and `max_actors`.
+
+    Waiting documents are served by priority class (`interactive` before `bulk`),
+    and fairly across partitions within a class: each partition gets slots in
+    proportion to its weight (`ray.serializer_queue.partition_weights`), so a
+    large backfill cannot starve other partitions. A bulk document waiting for
+    more than `aging_seconds` competes as an interactive one.
+    """
+
     def __init__(self):
         from utils.logger import get_logger
 
         self.logger = get_logger()
-        # Spawn pool of serializer workers
-        self.actors = [DocSerializer.remote() for _ in range(POOL_SIZE)]
-        # Build a slot-queue: each actor appears MAX_TASKS_PER_WORKER times
-        self._queue: asyncio.Queue[ray.actor.ActorHandle] = asyncio.Queue()
+        queue_config = config.ray.serializer_queue
+        self.aging_seconds = queue_config.aging_seconds
+        self.partition_weights = dict(queue_config.get("partition_weights") or {})
 
-        for _ in range(MAX_TASKS_PER_WORKER):
-            for actor in self.actors:
-                self._queue.put_nowait(actor)
-
-        self.total_slots = POOL_SIZE * MAX_TASKS_PER_WORKER
+        self.pool = ActorPool.from_config(
+            "serializer",
+            DocSerializer,
+            slots_per_actor=MAX_TASKS_PER_WORKER,
+            pools_config=config.ray.actor_pools,
+            backlog=self._backlog,
+            on_available=self._dispatch,
+            logger=self.logger,
+        )
+        # (priority, partition) -> waiting documents, in arrival order
+        self._waiters: Dict[Tuple[str, str], Deque[_Waiter]] = {}
+        self._by_task: Dict[str, _Waiter] = {}
+        # weighted fair queuing: virtual time of each partition
+        self._vtime: Dict[str, float] = {}
+        self._avg_duration: Optional[float] = None  # EMA of serialization time
         self.logger.info(
-            f"SerializerQueue: {POOL_SIZE} actors × {MAX_TASKS_PER_WORKER} slots = "
-            f"{POOL_SIZE * MAX_TASKS_PER_WORKER} all file concurrency"
+            f"SerializerQueue: {self.pool.min_actors}-{self.pool.max_actors} actors × "
+            f"{MAX_TASKS_PER_WORKER} slots"
+        )
+
+    def _weight(self, partition: str) -> float:
+        return float(self.partition_weights.get(partition, 1))
+
+    def _is_aged(self, waiter: _Waiter, now: float) -> bool:
+        return now - waiter.enqueued_at >= self.aging_seconds
+
+    def _pick(self) -> Optional[_Waiter]:
+        """Pop the next document to serve, or None if nobody waits."""
+        now = time.monotonic()
+        candidates = []  # (class rank, partition vtime, arrival, key)
+        for key, waiters in self._waiters.items():
+            head = waiters[0]
+            rank = PRIORITY_CLASSES.index(head.priority)
+            if rank > 0 and self._is_aged(head, now):
+                rank = 0
+            candidates.append(
+                (rank, self._vtime.get(head.partition, 0.0), head.enqueued_at, key)
+            )
+        if not candidates:
+            return None
+
+        *_, key = min(candidates)
+        waiters = self._waiters[key]
+        waiter = waiters.popleft()
+        if not waiters:
+            del self._waiters[key]
+        del self._by_task[waiter.task_id]
+        self._vtime[waiter.partition] = self._vtime.get(
+            waiter.partition, 0.0
+        ) + 1 / self._weight(waiter.partition)
+        return waiter
+
+    def _dispatch(self):
+        while self.pool.has_free_slot and (waiter := self._pick()) is not None:
+            if waiter.future.done():  # the caller went away
+                continue
+            waiter.future.set_result(self.pool.try_acquire())
+
+    def _backlog(self) -> Tuple[int, float]:
+        """Number of waiting documents and the wait of the oldest one."""
+        if not self._by_task:
+            return 0, 0.0
+        oldest = min(w[0].enqueued_at for w in self._waiters.values())
+        return len(self._by_task), time.monotonic() - oldest
+
+    async def _acquire(self, task_id: str, metadata: Dict, priority: str, log):
+        """Wait for a DocSerializer slot, in the queue order."""
+        if priority not in PRIORITY_CLASSES:
+            raise ValueError(
+                f"Unknown priority '{priority}', expected one of {PRIORITY_CLASSES}"
+            )
+        partition = metadata.get("partition") or ""
+
+        # A partition coming back from idle starts at the current virtual time,
+        # so it gets no credit for the time it did not use
+        active = [self._vtime.get(p, 0.0) for _, p in self._waiters]
+        if active and not any(p == partition for _, p in self._waiters):
+            self._vtime[partition] = max(self._vtime.get(partition, 0.0), min(active))
+
+        self.pool.start()
+        waiter = _Waiter(task_id=task_id, partition=partition, priority=priority)
+        self._waiters.setdefault((priority, partition), deque()).append(waiter)
+        self._by_task[task_id] = waiter
+        self._dispatch()
+
+        try:
+            actor = await waiter.future
+        except asyncio.CancelledError:
+            self._forget(waiter)
+            raise
+        log.info("Serializer worker allocated", priority=priority)
+        return actor
+
+    def _record_duration(self, started: float):
+        duration = time.monotonic() - started
+        self._avg_duration = (
+            duration
+            if self._avg_duration is None
+            else 0.9 * self._avg_duration + 0.1 * duration
         )
 
     async def submit_document(
@@ -121,22 +310,131 @@ class SerializerQueue:
         task_id: str,
         path: Union[str, Path],
         metadata: Optional[Dict] = {},
+        priority: str = "interactive",
     ) -> Document:
-        # wait until *any* slot is free
         log = self.logger.bind(
             file_id=metadata.get("file_id"),
             partition=metadata.get("partition"),
             task_id=task_id,
         )
-        actor = await self._queue.get()
-        if actor:
-            log.info("Serializer worker allocated")
+        actor = await self._acquire(task_id, metadata, priority, log)
+
+        started = time.monotonic()
+        failed = False
         try:
-            # 2) hand off to that actor
-            doc: Document = await actor.serialize_document.remote(
-                task_id, path, metadata
-            )
+            ref = actor.serialize_document.remote(task_id, path, metadata)
+            try:
+                doc: Document = await ref
+            except asyncio.CancelledError:
+                # stop the loader too, not just this wait
+                ray.cancel(ref, recursive=True)
+                raise
+            self._record_duration(started)
             return doc
+        except ray.exceptions.RayActorError:
+            failed = True
+            raise
+        finally:
+            # always return the slot, even on error
+            self.pool.release(actor, failed=failed)
+
+    @ray.method(num_returns="streaming")
+    async def submit_pages(
+        self,
+        task_id: str,
+        path: Union[str, Path],
+        metadata: Optional[Dict] = {},
+        priority: str = "interactive",
+    ):
+        """
+        Like `submit_document`, yielding the page batches of the document as its
+        loader produces them. The slot is held until the last one.
+        """
+        log = self.logger.bind(
+            file_id=metadata.get("file_id"),
+            partition=metadata.get("partition"),
+            task_id=task_id,
+        )
+        actor = await self._acquire(task_id, metadata, priority, log)
+
+        started = time.monotonic()
+        failed = False
+        try:
+            batches = actor.serialize_pages.remote(task_id, path, metadata)
+            try:
+                async for ref in batches:
+                    yield await ref
+            except (asyncio.CancelledError, GeneratorExit):
+                # stop the loader too, not just this wait
+                ray.cancel(batches, recursive=True)
+                raise
+            self._record_duration(started)
+        except ray.exceptions.RayActorError:
+            failed = True
+            raise
         finally:
-            # 3) always return the slot, even on error
-            await self._queue.put(actor)
+            # always return the slot, even on error
+            self.pool.release(actor, failed=failed)
+
+    def _forget(self, waiter: _Waiter):
+        if self._by_task.get(waiter.task_id) is not waiter:
+            return
+        del self._by_task[waiter.task_id]
+        key = (waiter.priority, waiter.partition)
+        self._waiters[key].remove(waiter)
+        if not self._waiters[key]:
+            del self._waiters[key]
+
+    async def get_position(self, task_id: str) -> Optional[Dict[str, float]]:
+        """
+        Estimated queue position and wait of a waiting document, None if it is
+        not waiting.
+
+        Documents of the same partition and class ahead of it are served first;
+        other partitions of its class get served in proportion to their weight
+        meanwhile, and more urgent classes before it.
+        """
+        waiter = self._by_task.get(task_id)
+        if waiter is None:
+            return None
+        rank = PRIORITY_CLASSES.index(waiter.priority)
+        own = self._waiters[(waiter.priority, waiter.partition)]
+        ahead_in_partition = own.index(waiter)
+        rounds = (ahead_in_partition + 1) / self._weight(waiter.partition)
+
+        position = ahead_in_partition + 1
+        for (priority, partition), waiters in self._waiters.items():
+            if partition == waiter.partition and priority == waiter.priority:
+                continue
+            other_rank = PRIORITY_CLASSES.index(priority)
+            if other_rank < rank:
+                position += len(waiters)
+            elif other_rank == rank:
+                position += min(
+                    len(waiters), math.ceil(rounds * self._weight(partition))
+                )
+
+        estimated_wait = None
+        if self._avg_duration is not None:
+            estimated_wait = round(
+                math.ceil(position / max(self.pool.capacity, 1)) * self._avg_duration
+            )
+        return {
+            "queue_position": position,
+            "priority": waiter.priority,
+            "waiting_seconds": round(time.monotonic() - waiter.enqueued_at),
+            "estimated_wait_seconds": estimated_wait,
+        }
+
+    async def get_stats(self) -> Dict:
+        """Serialization stage figures, shaped like the Indexer stage stats."""
+        queued_by_priority = {priority: 0 for priority in PRIORITY_CLASSES}
+        for (priority, _), waiters in self._waiters.items():
+            queued_by_priority[priority] += len(waiters)
+        return {
+            "workers": self.pool.capacity,
+            "busy": self.pool.busy,
+            "queued": len(self._by_task),
+            "queued_by_priority": queued_by_priority,
+            "pool": self.pool.stats(),
+        }
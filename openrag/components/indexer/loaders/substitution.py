@@ -0,0 +1,47 @@
+import re
+from typing import Callable, Iterable, Iterator, Mapping, Optional, Pattern, Union
+
+
+def _splice(
+    text: str, matches: Iterator[re.Match], replace: Callable[[re.Match], Optional[str]]
+) -> str:
+    """`text` with each match replaced by `replace(match)` (kept when None), in one pass."""
+    parts, last = [], 0
+    for match in matches:
+        replacement = replace(match)
+        if replacement is None:
+            continue
+        parts.append(text[last : match.start()])
+        parts.append(replacement)
+        last = match.end()
+    if not parts:
+        return text
+    parts.append(text[last:])
+    return "".join(parts)
+
+
+def substitute_in_order(
+    text: str, placeholder: Union[str, Pattern], replacements: Iterable[str]
+) -> str:
+    """
+    Replace the successive occurrences of a placeholder (a literal string or a
+    compiled regex) by the successive replacements, in a single pass over the
+    text. Occurrences left once the replacements run out are kept as they are.
+    """
+    if isinstance(placeholder, str):
+        placeholder = re.compile(re.escape(placeholder))
+    replacements = iter(replacements)
+    return _splice(text, placeholder.finditer(text), lambda m: next(replacements, None))
+
+
+def substitute(text: str, replacements: Mapping[str, str]) -> str:
+    """
+    Replace every occurrence of each placeholder of the mapping by its
+    replacement, in a single pass over the text, whatever their number.
+    """
+    if not replacements:
+        return text
+    # longest first, so that a placeholder prefixing another does not shadow it
+    keys = sorted(replacements, key=len, reverse=True)
+    pattern = re.compile("|".join(map(re.escape, keys)))
+    return _splice(text, pattern.finditer(text), lambda m: replacements[m.group(0)])
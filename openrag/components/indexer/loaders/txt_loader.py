@@ -10,6 +10,7 @@ from typing import Dict, Optional, Union
 
 import aiohttp
 from components.indexer.loaders.base import BaseLoader
+from components.indexer.loaders.substitution import substitute
 from langchain_community.document_loaders import TextLoader as LangchainTextLoader
 from langchain_core.documents.base import Document
 from PIL import Image
@@ -159,8 +160,7 @@ class MarkdownLoader(BaseLoader):
             logger.debug(
                 "Replacing image references", image_count=len(image_descriptions)
             )
-            for md_syntax, description in image_descriptions.items():
-                clean_text = clean_text.replace(md_syntax, description)
+            clean_text = substitute(clean_text, image_descriptions)
         else:
             logger.debug("No images found to process")
 
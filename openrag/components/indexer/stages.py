@@ -0,0 +1,176 @@
+import asyncio
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from langchain_core.documents.base import Document
+
+from .chunker import BaseChunker, ChunkingState
+
+
+@dataclass
+class StreamedFile:
+    """
+    A file indexed page batch by page batch, as its loader yields them: each
+    batch is an `IndexingJob` of its own, chunked in order.
+    """
+
+    chunking: ChunkingState = field(default_factory=ChunkingState)
+    futures: List[asyncio.Future] = field(default_factory=list)  # one per batch sent
+    pending: Optional[Document] = None  # latest batch, sent once the next one comes
+    file_metadata: Optional[Dict[str, Any]] = None  # registered once all are inserted
+    chunks: int = 0
+    embedded: int = 0
+    _next: int = 0  # index of the batch to chunk next
+    _turn: asyncio.Condition = field(default_factory=asyncio.Condition)
+
+    def failure(self) -> Optional[BaseException]:
+        """Error of the first batch that failed, if any."""
+        for future in self.futures:
+            if future.done() and not future.cancelled() and future.exception():
+                return future.exception()
+        return None
+
+    async def split(self, chunker: BaseChunker, job: "IndexingJob") -> List[Document]:
+        """Chunk a batch once the ones before it are, carrying the chunking state over."""
+        async with self._turn:
+            await self._turn.wait_for(lambda: self._next == job.batch)
+            try:
+                return await chunker.split_batch(
+                    job.doc, self.chunking, last=job.last_batch, task_id=job.task_id
+                )
+            finally:
+                self._next += 1
+                self._turn.notify_all()
+
+
+@dataclass
+class IndexingJob:
+    """A file travelling through the indexing stages."""
+
+    task_id: str
+    path: str
+    metadata: Dict[str, Any]
+    partition: str
+    log: Any
+    future: asyncio.Future
+    doc: Optional[Document] = None
+    chunks: List[Document] = field(default_factory=list)
+    embeddings: Optional[List[List[float]]] = None
+    labels: Dict[str, str] = field(default_factory=dict)  # metrics labels
+    checkpoint: Optional[str] = None  # CheckpointStore key, None when disabled
+    stream: Optional[StreamedFile] = None  # set on the page batches of a streamed file
+    batch: int = 0  # index of the page batch
+    last_batch: bool = True
+
+
+class PipelineStage:
+    """
+    A bounded queue served by a fixed number of worker coroutines.
+
+    `put` blocks while the queue is full, so a slow stage holds back the
+    workers of the stage feeding it instead of letting work pile up in memory.
+    The handler is responsible for forwarding the job to the next stage (or
+    resolving its future when it is the last one); any exception it raises
+    fails the job. Cancelling the future of a job stops its handler, wherever
+    it is awaiting.
+
+    A stage can be built anywhere, but belongs to the event loop `start` is
+    called from: jobs must be put from that loop. `stats` can be read from any.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        handler: Callable[[IndexingJob], Awaitable[None]],
+        workers: int,
+        queue_size: int,
+        logger=None,
+    ):
+        if workers <= 0:
+            raise ValueError(f"Stage '{name}' needs at least one worker")
+        self.name = name
+        self.handler = handler
+        self.workers = workers
+        self.queue: asyncio.Queue[IndexingJob] = asyncio.Queue(maxsize=queue_size)
+        self.logger = logger
+        self._tasks: List[asyncio.Task] = []
+        self._busy = 0
+        self._waiting = 0  # producers blocked on a full queue
+        self._processed = 0
+        self._failed = 0
+        self._cancelled = 0
+
+    def start(self):
+        """Spawn the workers. Must be called from a running event loop."""
+        if self._tasks:
+            return
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f"{self.name}-worker-{i}")
+            for i in range(self.workers)
+        ]
+
+    async def put(self, job: IndexingJob):
+        self._waiting += 1
+        try:
+            await self.queue.put(job)
+        finally:
+            self._waiting -= 1
+
+    def is_full(self) -> bool:
+        return self.queue.full()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "workers": self.workers,
+            "busy": self._busy,
+            "queued": self.queue.qsize(),
+            "capacity": self.queue.maxsize,
+            "waiting": self._waiting,
+            "processed": self._processed,
+            "failed": self._failed,
+            "cancelled": self._cancelled,
+        }
+
+    async def _worker(self):
+        while True:
+            job = await self.queue.get()
+            self._busy += 1
+            stop = None
+            try:
+                if job.future.done():
+                    continue
+                handler = asyncio.create_task(self.handler(job))
+
+                # bound to this handler: the worker serves other jobs after it
+                def stop(future: asyncio.Future, handler: asyncio.Task = handler):
+                    if future.cancelled():
+                        handler.get_loop().call_soon_threadsafe(handler.cancel)
+
+                job.future.add_done_callback(stop)
+                await handler
+                self._processed += 1
+            except asyncio.CancelledError:
+                if asyncio.current_task().cancelling():
+                    # the worker itself is stopped
+                    if not job.future.done():
+                        job.future.cancel()
+                    raise
+                if job.future.cancelled():
+                    self._cancelled += 1
+                else:
+                    # cancelled from within, not by its job: fail the job
+                    self._failed += 1
+                    if not job.future.done():
+                        job.future.set_exception(
+                            RuntimeError(f"Stage '{self.name}' was interrupted")
+                        )
+            except Exception as e:
+                self._failed += 1
+                if not job.future.done():
+                    job.future.set_exception(e)
+            finally:
+                if stop is not None:
+                    # the job may be cancelled once in a later stage
+                    job.future.remove_done_callback(stop)
+                self._busy -= 1
+                self.queue.task_done()
@@ -0,0 +1,283 @@
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import (
+    JSON,
+    Column,
+    DateTime,
+    Integer,
+    String,
+    Text,
+    create_engine,
+    func,
+)
+from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy_utils import create_database, database_exists
+
+TERMINAL_STATES = ("COMPLETED", "FAILED", "CANCELLED")
+
+Base = declarative_base()
+
+
+class TaskRecord(Base):
+    __tablename__ = "tasks"
+
+    task_id = Column(String, primary_key=True)
+    state = Column(String, nullable=True, index=True)
+    partition = Column(String, nullable=True, index=True)
+    file_id = Column(String, nullable=True, index=True)
+    batch_id = Column(String, nullable=True, index=True)
+    error = Column(Text, nullable=True)
+    details = Column(JSON, nullable=True, default={})
+    created_at = Column(DateTime, default=datetime.now, nullable=False, index=True)
+    updated_at = Column(DateTime, default=datetime.now, nullable=False)
+    finished_at = Column(DateTime, nullable=True, index=True)
+
+    def to_dict(self) -> dict:
+        return {
+            "state": self.state,
+            "error": self.error,
+            "details": self.details or {},
+            "batch_id": self.batch_id,
+        }
+
+    def __repr__(self):
+        return f"<TaskRecord(task_id='{self.task_id}', state='{self.state}')>"
+
+
+class TaskBatch(Base):
+    __tablename__ = "task_batches"
+
+    batch_id = Column(String, primary_key=True)
+    total = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.now, nullable=False, index=True)
+
+
+def task_store_url(config) -> str:
+    """Database URL of the task store, from `task_state.backend` or an explicit URL."""
+    task_config = config.task_state
+    if task_config.get("database_url"):
+        return task_config.database_url
+    if task_config.backend == "sqlite":
+        path = Path(config.paths.state_dir) / "tasks" / "tasks.db"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        return f"sqlite:///{path}"
+    if task_config.backend == "postgres":
+        rdb = config.rdb
+        return f"postgresql://{rdb.user}:{rdb.password}@{rdb.host}:{rdb.port}/openrag_tasks"
+    raise ValueError(
+        f"Unknown task state backend '{task_config.backend}'. Available: sqlite, postgres"
+    )
+
+
+class TaskStore:
+    """
+    Persistent record of the indexing tasks, indexed by state, partition,
+    file id and batch. All methods block: call them from a thread.
+    """
+
+    def __init__(self, database_url: str):
+        connect_args = {}
+        if database_url.startswith("sqlite"):
+            connect_args = {"check_same_thread": False, "timeout": 30}
+        self.engine = create_engine(database_url, connect_args=connect_args)
+        if not database_exists(database_url):
+            create_database(database_url)
+
+        Base.metadata.create_all(self.engine)
+        self.Session = sessionmaker(bind=self.engine)
+
+    def save(
+        self,
+        task_id: str,
+        *,
+        state: Optional[str],
+        error: Optional[str],
+        details: dict,
+        batch_id: Optional[str] = None,
+    ):
+        """Insert or update a task. A missing `batch_id` keeps the stored one."""
+        self.save_many([(task_id, state, error, details, batch_id)])
+
+    def save_many(
+        self,
+        tasks: List[Tuple[str, Optional[str], Optional[str], dict, Optional[str]]],
+    ):
+        """`save` several `(task_id, state, error, details, batch_id)` in one transaction."""
+        now = datetime.now()
+        with self.Session() as session:
+            for task_id, state, error, details, batch_id in tasks:
+                record = session.get(TaskRecord, task_id)
+                if record is None:
+                    record = TaskRecord(task_id=task_id, created_at=now)
+                    session.add(record)
+                record.state = state
+                record.error = error
+                record.details = details
+                record.partition = details.get("partition")
+                record.file_id = details.get("file_id")
+                if batch_id is not None:
+                    record.batch_id = batch_id
+                record.updated_at = now
+                record.finished_at = now if state in TERMINAL_STATES else None
+            session.commit()
+
+    def get(self, task_id: str) -> Optional[dict]:
+        with self.Session() as session:
+            record = session.get(TaskRecord, task_id)
+            return record.to_dict() if record else None
+
+    def fail_active(self, error: str) -> int:
+        """
+        Mark the tasks that did not reach a terminal state as failed with `error`
+        (their work died with the previous process). Returns their number.
+        """
+        now = datetime.now()
+        with self.Session() as session:
+            failed = (
+                session.query(TaskRecord)
+                .filter(
+                    TaskRecord.state.notin_(TERMINAL_STATES)
+                    | TaskRecord.state.is_(None)
+                )
+                .update(
+                    {
+                        TaskRecord.state: "FAILED",
+                        TaskRecord.error: error,
+                        TaskRecord.updated_at: now,
+                        TaskRecord.finished_at: now,
+                    },
+                    synchronize_session=False,
+                )
+            )
+            session.commit()
+        return failed
+
+    def list(
+        self,
+        states: Optional[List[str]] = None,
+        partition: Optional[str] = None,
+        file_id: Optional[str] = None,
+        batch_id: Optional[str] = None,
+        limit: int = 100,
+        offset: int = 0,
+    ) -> Tuple[int, List[dict]]:
+        """A page of tasks, most recent first, and the number of matching tasks."""
+        with self.Session() as session:
+            query = session.query(TaskRecord)
+            if states is not None:
+                query = query.filter(TaskRecord.state.in_(states))
+            for column, value in (
+                (TaskRecord.partition, partition),
+                (TaskRecord.file_id, file_id),
+                (TaskRecord.batch_id, batch_id),
+            ):
+                if value is not None:
+                    query = query.filter(column == value)
+            total = query.count()
+            records = (
+                query.order_by(TaskRecord.created_at.desc(), TaskRecord.task_id)
+                .offset(offset)
+                .limit(limit)
+            )
+            return total, [{"task_id": r.task_id, **r.to_dict()} for r in records]
+
+    def states(self, task_ids: Iterable[str]) -> Dict[str, Optional[str]]:
+        with self.Session() as session:
+            rows = session.query(TaskRecord.task_id, TaskRecord.state).filter(
+                TaskRecord.task_id.in_(list(task_ids))
+            )
+            return {task_id: state for task_id, state in rows}
+
+    def add_batch(self, batch_id: str, task_ids: List[str]):
+        """Record a batch and tag its tasks, creating the ones not stored yet."""
+        now = datetime.now()
+        with self.Session() as session:
+            session.merge(TaskBatch(batch_id=batch_id, total=len(task_ids)))
+            known = {
+                task_id
+                for (task_id,) in session.query(TaskRecord.task_id).filter(
+                    TaskRecord.task_id.in_(task_ids)
+                )
+            }
+            session.query(TaskRecord).filter(TaskRecord.task_id.in_(known)).update(
+                {TaskRecord.batch_id: batch_id}, synchronize_session=False
+            )
+            session.add_all(
+                TaskRecord(
+                    task_id=task_id,
+                    state="QUEUED",
+                    batch_id=batch_id,
+                    details={},
+                    created_at=now,
+                    updated_at=now,
+                )
+                for task_id in task_ids
+                if task_id not in known
+            )
+            session.commit()
+
+    def batch_progress(self, batch_id: str) -> Optional[dict]:
+        with self.Session() as session:
+            batch = session.get(TaskBatch, batch_id)
+            if batch is None:
+                return None
+            rows = session.query(TaskRecord.task_id, TaskRecord.state).filter(
+                TaskRecord.batch_id == batch_id
+            )
+            return {"total": batch.total, "states": dict(rows.all())}
+
+    def count_by_state(self) -> Dict[str, int]:
+        with self.Session() as session:
+            rows = session.query(TaskRecord.state, func.count()).group_by(
+                TaskRecord.state
+            )
+            return {state: count for state, count in rows}
+
+    def purge(
+        self,
+        completed_before: datetime,
+        failed_before: datetime,
+        max_finished: Optional[int] = None,
+    ) -> Dict[str, int]:
+        """
+        Delete finished tasks past their retention (cancelled tasks are kept as
+        long as completed ones), then the oldest ones above
+        `max_finished`, and batches past the shorter retention. Returns the
+        number of deleted tasks per state.
+        """
+        with self.Session() as session:
+            expired = (
+                TaskRecord.state.in_(("COMPLETED", "CANCELLED"))
+                & (TaskRecord.finished_at < completed_before)
+            ) | (
+                (TaskRecord.state == "FAILED")
+                & (TaskRecord.finished_at < failed_before)
+            )
+
+            if max_finished:
+                cutoff = (
+                    session.query(TaskRecord.finished_at)
+                    .filter(TaskRecord.finished_at.isnot(None))
+                    .order_by(TaskRecord.finished_at.desc())
+                    .offset(max_finished)
+                    .limit(1)
+                    .scalar()
+                )
+                if cutoff is not None:
+                    expired = expired | (TaskRecord.finished_at <= cutoff)
+
+            deleted = dict(
+                session.query(TaskRecord.state, func.count())
+                .filter(expired)
+                .group_by(TaskRecord.state)
+                .all()
+            )
+            session.query(TaskRecord).filter(expired).delete(synchronize_session=False)
+
+            session.query(TaskBatch).filter(
+                TaskBatch.created_at < max(completed_before, failed_before)
+            ).delete(synchronize_session=False)
+            session.commit()
+        return deleted
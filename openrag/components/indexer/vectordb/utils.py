@@ -92,6 +92,26 @@ class Partition(Base):
         return f"<Partition(key='{self.partition}', created_at='{self.created_at}', file_count={len(self.files)})>"
 
 
+class PartitionAlias(Base):
+    """
+    Physical partition (value of the Milvus partition key) currently serving a
+    logical partition, and the shadow one being rebuilt by a reindex job, if any.
+    Partitions without a row are stored under their own name.
+    """
+
+    __tablename__ = "partition_aliases"
+
+    partition = Column(String, primary_key=True)
+    physical = Column(String, nullable=False)
+    shadow = Column(String, nullable=True)
+    updated_at = Column(
+        DateTime, default=datetime.now, onupdate=datetime.now, nullable=False
+    )
+
+    def __repr__(self):
+        return f"<PartitionAlias(partition='{self.partition}', physical='{self.physical}')>"
+
+
 class PartitionFileManager:
     def __init__(self, database_url: str, logger=logger):
         self.engine = create_engine(database_url)
@@ -200,6 +220,9 @@ class PartitionFileManager:
                     )
                     if partition_obj and len(partition_obj.files) == 0:
                         session.delete(partition_obj)
+                        session.query(PartitionAlias).filter_by(
+                            partition=partition
+                        ).delete()
                         session.commit()
                         log.info("Deleted empty partition")
 
@@ -214,9 +237,13 @@ class PartitionFileManager:
     def delete_partition(self, partition: str):
         """Delete a partition and all its files"""
         with self.Session() as session:
+            partition_name = partition
             partition = session.query(Partition).filter_by(partition=partition).first()
             if partition:
                 session.delete(partition)  # Will delete all files due to cascade
+                session.query(PartitionAlias).filter_by(
+                    partition=partition_name
+                ).delete()
                 session.commit()
                 self.logger.info("Deleted partition", partition=partition)
                 return True
@@ -264,3 +291,63 @@ class PartitionFileManager:
                 .count()
                 > 0
             )
+
+    def existing_file_ids(self, partition: str, file_ids: List[str]) -> List[str]:
+        """Return the subset of `file_ids` already present in the partition (one query)"""
+        if not file_ids:
+            return []
+        with self.Session() as session:
+            rows = (
+                session.query(File.file_id)
+                .join(Partition)
+                .filter(Partition.partition == partition, File.file_id.in_(file_ids))
+                .all()
+            )
+            return [row.file_id for row in rows]
+
+    def list_file_metadata(self, partition: str) -> Dict[str, Dict]:
+        """Metadata of every file of a partition, by file id"""
+        with self.Session() as session:
+            rows = (
+                session.query(File.file_id, File.file_metadata)
+                .join(Partition)
+                .filter(Partition.partition == partition)
+                .all()
+            )
+            return {row.file_id: row.file_metadata or {} for row in rows}
+
+    def get_partition_aliases(self) -> Dict[str, Dict[str, Optional[str]]]:
+        """`{partition: {"physical", "shadow"}}` for the aliased partitions only"""
+        with self.Session() as session:
+            return {
+                alias.partition: {"physical": alias.physical, "shadow": alias.shadow}
+                for alias in session.query(PartitionAlias).all()
+            }
+
+    def set_partition_alias(
+        self, partition: str, physical: str, shadow: Optional[str] = None
+    ):
+        """Set the physical and shadow partitions of a logical one (one transaction)"""
+        with self.Session() as session:
+            try:
+                alias = session.get(PartitionAlias, partition)
+                if alias is None:
+                    session.add(
+                        PartitionAlias(
+                            partition=partition, physical=physical, shadow=shadow
+                        )
+                    )
+                else:
+                    alias.physical = physical
+                    alias.shadow = shadow
+                session.commit()
+                self.logger.info(
+                    "Partition alias updated",
+                    partition=partition,
+                    physical=physical,
+                    shadow=shadow,
+                )
+            except Exception:
+                session.rollback()
+                self.logger.exception("Error updating partition alias")
+                raise
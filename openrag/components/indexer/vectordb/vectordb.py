@@ -1,6 +1,8 @@
 import asyncio
 import random
+import uuid
 from abc import ABC, abstractmethod
+from collections import Counter
 from typing import Dict, List, Optional
 
 import numpy as np
@@ -9,9 +11,13 @@ from langchain_core.documents.base import Document
 from langchain_milvus import BM25BuiltInFunction, Milvus
 from langchain_openai import OpenAIEmbeddings
 from pymilvus import MilvusClient
+from utils.metrics import file_type, metrics
 
 from .utils import PartitionFileManager
 
+# metadata of a chunk that is not metadata of its file
+CHUNK_METADATA_KEYS = ("page", "start_time", "end_time")
+
 INDEX_PARAMS = [
     {
         "metric_type": "BM25",
@@ -36,7 +42,16 @@ class ABCVectorDB(ABC):
         pass
 
     @abstractmethod
-    async def async_add_documents(self, chunks, partition: Optional[str] = None):
+    async def async_add_documents(
+        self,
+        chunks,
+        embeddings: Optional[List[List[float]]] = None,
+        register: bool = True,
+    ):
+        pass
+
+    @abstractmethod
+    def register_file(self, file_metadata: Dict):
         pass
 
     @abstractmethod
@@ -66,10 +81,18 @@ class ABCVectorDB(ABC):
     def delete_file_points(self, points: list, file_id: str, partition: str):
         pass
 
+    @abstractmethod
+    def discard_file_chunks(self, file_id: str, partition: str):
+        pass
+
     @abstractmethod
     def file_exists(self, file_id: str, partition: Optional[str] = None):
         pass
 
+    @abstractmethod
+    def existing_file_ids(self, file_ids: List[str], partition: str) -> List[str]:
+        pass
+
     @abstractmethod
     def collection_exists(self, collection_name: str):
         pass
@@ -94,6 +117,28 @@ class ABCVectorDB(ABC):
     def list_partitions(self, **kwargs):
         pass
 
+    @abstractmethod
+    def list_partition_files(self, partition: str) -> Dict[str, Dict]:
+        pass
+
+    @abstractmethod
+    def create_shadow_partition(self, partition: str) -> str:
+        pass
+
+    @abstractmethod
+    async def add_shadow_chunks(
+        self, chunks: List[Document], embeddings: List[List[float]]
+    ):
+        pass
+
+    @abstractmethod
+    async def cutover_partition(self, partition: str, reindexed_file_ids: List[str]):
+        pass
+
+    @abstractmethod
+    def drop_shadow_partition(self, partition: str):
+        pass
+
 
 @ray.remote
 class MilvusDB(ABCVectorDB):
@@ -166,6 +211,14 @@ class MilvusDB(ABCVectorDB):
         self._collection_name = None
         self.vector_store = None
         self.partition_file_manager: PartitionFileManager = None
+        # logical -> physical partition (value of the partition key field),
+        # shadow physical partitions being filled by reindex jobs, and the files
+        # written to their partition since (their shadow copy is outdated)
+        self.partition_aliases: Dict[str, str] = {}
+        self.shadow_partitions: Dict[str, str] = {}
+        self._rewritten: Dict[str, set[str]] = {}
+        self._inflight_inserts: Counter = Counter()
+        self._cutovers: Dict[str, asyncio.Event] = {}
         self.default_partition = "_default"
         self.rdb_host = self.config.rdb.host
         self.rdb_port = self.config.rdb.port
@@ -209,6 +262,7 @@ class MilvusDB(ABCVectorDB):
         )
 
         self.logger = self.logger.bind(collection=name)
+        self._load_partition_aliases(name)
         self.logger.info("Milvus collection loaded.")
 
         if self.default_collection_name is None:
@@ -216,6 +270,54 @@ class MilvusDB(ABCVectorDB):
             self.logger.info(f"Default collection name set to `{name}`.")
         self._collection_name = name
 
+    def _load_partition_aliases(self, collection_name: str):
+        aliases = self.partition_file_manager.get_partition_aliases()
+        for partition, alias in aliases.items():
+            if alias["shadow"]:
+                # Reindex jobs do not survive a restart: drop what they left
+                self.client.delete(
+                    collection_name=collection_name,
+                    filter=f"partition == '{alias['shadow']}'",
+                )
+                self.partition_file_manager.set_partition_alias(
+                    partition, alias["physical"]
+                )
+                self.logger.warning(
+                    "Dropped leftover shadow partition",
+                    partition=partition,
+                    shadow=alias["shadow"],
+                )
+        self.partition_aliases = {
+            partition: alias["physical"] for partition, alias in aliases.items()
+        }
+        self.shadow_partitions = {}
+        self._rewritten = {}
+
+    def _physical(self, partition: str) -> str:
+        return self.partition_aliases.get(partition, partition)
+
+    def _to_logical(self, docs: List[Document]) -> List[Document]:
+        """Report chunks of aliased partitions under their logical partition name."""
+        reverse = {
+            physical: partition
+            for partition, physical in self.partition_aliases.items()
+            if physical != partition
+        }
+        if reverse:
+            for doc in docs:
+                physical = doc.metadata.get("partition")
+                doc.metadata["partition"] = reverse.get(physical, physical)
+        return docs
+
+    async def _wait_for_cutover(self, partition: str):
+        while (event := self._cutovers.get(partition)) is not None:
+            await event.wait()
+
+    def _track_write(self, file_id: str, partition: str):
+        """Record a write to a file of a partition being reindexed."""
+        if partition in self._rewritten:
+            self._rewritten[partition].add(file_id)
+
     async def get_collections(self) -> list[str]:
         return self.client.list_collections()
 
@@ -247,7 +349,12 @@ class MilvusDB(ABCVectorDB):
         expr_parts = []
 
         if partition != ["all"]:
-            expr_parts.append(f"partition in {partition}")
+            expr_parts.append(f"partition in {[self._physical(p) for p in partition]}")
+        elif self.shadow_partitions:
+            # partitions being rebuilt are not searchable before their cutover
+            expr_parts.append(
+                f"partition not in {list(self.shadow_partitions.values())}"
+            )
 
         for key, value in filter.items():
             expr_parts.append(f"{key} == '{value}'")
@@ -294,7 +401,7 @@ class MilvusDB(ABCVectorDB):
 
         docs = [doc for doc, score in docs_scores]
 
-        return docs
+        return self._to_logical(docs)
 
     async def async_multy_query_search(
         self,
@@ -336,12 +443,28 @@ class MilvusDB(ABCVectorDB):
 
         return retrieved_chunks
 
-    async def async_add_documents(self, chunks: list[Document]) -> None:
-        """Asynchronously add documents to the vector store."""
+    async def async_add_documents(
+        self,
+        chunks: list[Document],
+        embeddings: Optional[List[List[float]]] = None,
+        register: bool = True,
+    ) -> None:
+        """Asynchronously add documents to the vector store.
+
+        Args:
+            chunks (list[Document]): Chunks of a single file.
+            embeddings (Optional[List[List[float]]]): Precomputed dense vectors,
+                one per chunk. When omitted, the vector store embeds the chunks.
+            register (bool): Record the file in its partition. Files inserted
+                in several calls are recorded once done, with `register_file`.
+        """
 
         try:
-            file_metadata = dict(chunks[0].metadata)
-            file_metadata.pop("page")
+            file_metadata = {
+                k: v
+                for k, v in chunks[0].metadata.items()
+                if k not in CHUNK_METADATA_KEYS
+            }
             file_id, partition = (
                 file_metadata.get("file_id"),
                 file_metadata.get("partition"),
@@ -356,19 +479,57 @@ class MilvusDB(ABCVectorDB):
                     f"No Insertion: This File ({file_id}) already exists in Partition ({partition})"
                 )
 
-            await self.vector_store.aadd_documents(chunks)
+            # A partition cutover must not happen while its chunks are written
+            await self._wait_for_cutover(partition)
+            self._track_write(file_id, partition)
+            self._inflight_inserts[partition] += 1
+            labels = {
+                "file_type": file_type(
+                    file_metadata.get("filename", ""), file_metadata
+                ),
+                "partition": partition,
+            }
+            try:
+                with metrics.timer("insert", **labels):
+                    physical = self._physical(partition)
+                    if physical != partition:
+                        chunks = [
+                            Document(
+                                page_content=chunk.page_content,
+                                metadata={**chunk.metadata, "partition": physical},
+                            )
+                            for chunk in chunks
+                        ]
+                    if embeddings is None:
+                        await self.vector_store.aadd_documents(chunks)
+                    else:
+                        await asyncio.to_thread(
+                            self.vector_store.add_embeddings,
+                            texts=[chunk.page_content for chunk in chunks],
+                            embeddings=embeddings,
+                            metadatas=[chunk.metadata for chunk in chunks],
+                        )
+            finally:
+                self._inflight_inserts[partition] -= 1
             # asyncio.create_task(self.vector_store.aadd_documents(chunks)) # for prods
 
             # insert file_id and partition into partition_file_manager
-            self.partition_file_manager.add_file_to_partition(
-                file_id=file_id, partition=partition, file_metadata=file_metadata
-            )
+            if register:
+                self.register_file(file_metadata)
         except Exception as e:
             self.logger.exception(
                 "Error while adding documents to Milvus", error=str(e)
             )
             raise e
 
+    def register_file(self, file_metadata: Dict):
+        """Record a file in its partition, making it visible in file listings."""
+        self.partition_file_manager.add_file_to_partition(
+            file_id=file_metadata.get("file_id"),
+            partition=file_metadata.get("partition"),
+            file_metadata=file_metadata,
+        )
+
     def get_file_points(self, file_id: str, partition: str, limit: int = 100):
         """
         Retrieve file points from the vector database based on a filter.
@@ -390,7 +551,9 @@ class MilvusDB(ABCVectorDB):
                 return []
 
             # Adjust filter expression based on the type of value
-            filter_expression = f"partition == '{partition}' and file_id == '{file_id}'"
+            filter_expression = (
+                f"partition == '{self._physical(partition)}' and file_id == '{file_id}'"
+            )
 
             # Pagination parameters
             offset = 0
@@ -431,7 +594,9 @@ class MilvusDB(ABCVectorDB):
                 return []
 
             # Adjust filter expression based on the type of value
-            filter_expression = f"partition == '{partition}' and file_id == '{file_id}'"
+            filter_expression = (
+                f"partition == '{self._physical(partition)}' and file_id == '{file_id}'"
+            )
 
             # Pagination parameters
             offset = 0
@@ -466,7 +631,7 @@ class MilvusDB(ABCVectorDB):
                 for res in results
             ]
             log.info("Fetched file chunks.", count=len(results))
-            return docs
+            return self._to_logical(docs)
 
         except Exception:
             log.exception(f"Couldn't get file chunks for file_id {file_id}")
@@ -487,7 +652,7 @@ class MilvusDB(ABCVectorDB):
                 limit=1,
             )
             if response:
-                return Document(
+                doc = Document(
                     page_content=response[0]["text"],
                     metadata={
                         key: value
@@ -495,6 +660,7 @@ class MilvusDB(ABCVectorDB):
                         if key not in ["text", "vector"]
                     },
                 )
+                return self._to_logical([doc])[0]
             return None
         except Exception:
             self.logger.exception("Couldn't get chunk by ID", chunk_id=chunk_id)
@@ -512,14 +678,41 @@ class MilvusDB(ABCVectorDB):
                     f"This File ({file_id}) doesn't exist in Partition ({partition})"
                 )
 
+            self._track_write(file_id, partition)
             self.client.delete(collection_name=self.collection_name, ids=points)
             self.partition_file_manager.remove_file_from_partition(
                 file_id=file_id, partition=partition
             )
+            if not self.partition_file_manager.partition_exists(partition):
+                # the empty partition was removed, together with its alias
+                self.partition_aliases.pop(partition, None)
             log.info("File points deleted.")
         except Exception:
             log.exception("Error while deleting file points.")
 
+    def discard_file_chunks(self, file_id: str, partition: str):
+        """
+        Delete the chunks of a file whose insertion was interrupted before it was
+        registered (see `async_add_documents`), and its record if it has one.
+        """
+        log = self.logger.bind(file_id=file_id, partition=partition)
+        try:
+            self._track_write(file_id, partition)
+            self.client.delete(
+                collection_name=self.collection_name,
+                filter=f"partition == '{self._physical(partition)}' and file_id == '{file_id}'",
+            )
+            if self.partition_file_manager.file_exists_in_partition(
+                file_id=file_id, partition=partition
+            ):
+                self.partition_file_manager.remove_file_from_partition(
+                    file_id=file_id, partition=partition
+                )
+            log.info("File chunks discarded.")
+        except Exception:
+            log.exception("Error while discarding file chunks.")
+            raise
+
     def file_exists(self, file_id: str, partition: str):
         """
         Check if a file exists in Milvus
@@ -534,6 +727,20 @@ class MilvusDB(ABCVectorDB):
             )
             return False
 
+    def existing_file_ids(self, file_ids: List[str], partition: str) -> List[str]:
+        """
+        Bulk variant of `file_exists`: return the file ids already indexed in the partition.
+        """
+        try:
+            return self.partition_file_manager.existing_file_ids(
+                partition=partition, file_ids=file_ids
+            )
+        except Exception:
+            self.logger.exception(
+                "Bulk file existence check failed.", partition=partition
+            )
+            raise
+
     def get_partition(self, partition: str):
         try:
             partition_dict = self.partition_file_manager.get_partition(
@@ -567,10 +774,11 @@ class MilvusDB(ABCVectorDB):
         try:
             count = self.client.delete(
                 collection_name=self.collection_name,
-                filter=f"partition == '{partition}'",
+                filter=f"partition == '{self._physical(partition)}'",
             )
 
             self.partition_file_manager.delete_partition(partition)
+            self.partition_aliases.pop(partition, None)
 
             log.info("Deleted points from partition", count=count.get("delete_count"))
 
@@ -609,7 +817,9 @@ class MilvusDB(ABCVectorDB):
                 return []
 
             # Create a filter expression for the query
-            filter_expression = f"partition == '{partition}' and file_id in {file_ids}"
+            filter_expression = (
+                f"partition == '{self._physical(partition)}' and file_id in {file_ids}"
+            )
 
             ids = []
             iterator = self.client.query_iterator(
@@ -647,7 +857,7 @@ class MilvusDB(ABCVectorDB):
                 return []
 
             # Create a filter expression for the query
-            filter_expression = f"partition == '{partition}'"
+            filter_expression = f"partition == '{self._physical(partition)}'"
 
             excluded_keys = ["text"]
             if not include_embedding:
@@ -685,7 +895,7 @@ class MilvusDB(ABCVectorDB):
                     ]
                 )
 
-            return chunks
+            return self._to_logical(chunks)
 
         except Exception as e:
             self.logger.exception(
@@ -693,6 +903,137 @@ class MilvusDB(ABCVectorDB):
             )
             raise
 
+    def list_partition_files(self, partition: str) -> Dict[str, Dict]:
+        """File metadata of every file of a partition, by file id."""
+        return self.partition_file_manager.list_file_metadata(partition)
+
+    def create_shadow_partition(self, partition: str) -> str:
+        """
+        Reserve a new physical partition to rebuild `partition` into. Its chunks
+        are not searchable until `cutover_partition`.
+        """
+        if partition in self.shadow_partitions:
+            raise ValueError(f"Partition `{partition}` is already being reindexed")
+        shadow = f"{partition}#{uuid.uuid4().hex[:8]}"
+        self.partition_file_manager.set_partition_alias(
+            partition, self._physical(partition), shadow=shadow
+        )
+        self.shadow_partitions[partition] = shadow
+        self._rewritten[partition] = set()
+        self.logger.info(
+            "Shadow partition created.", partition=partition, shadow=shadow
+        )
+        return shadow
+
+    async def add_shadow_chunks(
+        self, chunks: List[Document], embeddings: List[List[float]]
+    ):
+        """Write chunks of a shadow partition (the files are already registered)."""
+        await asyncio.to_thread(
+            self.vector_store.add_embeddings,
+            texts=[chunk.page_content for chunk in chunks],
+            embeddings=embeddings,
+            metadatas=[chunk.metadata for chunk in chunks],
+        )
+
+    def drop_shadow_partition(self, partition: str):
+        """Abort a reindex: delete the shadow chunks and forget the shadow."""
+        shadow = self.shadow_partitions.pop(partition, None)
+        self._rewritten.pop(partition, None)
+        if shadow is None:
+            return
+        self.client.delete(
+            collection_name=self.collection_name, filter=f"partition == '{shadow}'"
+        )
+        if self.partition_file_manager.partition_exists(partition):
+            self.partition_file_manager.set_partition_alias(
+                partition, self._physical(partition)
+            )
+        self.logger.info(
+            "Shadow partition dropped.", partition=partition, shadow=shadow
+        )
+
+    async def cutover_partition(
+        self, partition: str, reindexed_file_ids: List[str]
+    ) -> Dict[str, int]:
+        """
+        Make the shadow partition the one served for `partition`, then delete the
+        previous chunks.
+
+        Files deleted during the reindex are removed from the shadow, and files
+        added, replaced or updated during it (or left out of it) are carried over
+        with their current chunks. Inserts into the partition are held while the
+        switch happens; readers see either the old or the new chunks, never both.
+        """
+        shadow = self.shadow_partitions.get(partition)
+        if shadow is None:
+            raise ValueError(f"No reindex in progress for partition `{partition}`")
+        if not self.partition_file_manager.partition_exists(partition):
+            self.drop_shadow_partition(partition)
+            raise ValueError(f"Partition `{partition}` was deleted during reindex")
+
+        event = asyncio.Event()
+        self._cutovers[partition] = event
+        try:
+            while self._inflight_inserts[partition]:
+                await asyncio.sleep(0.05)
+
+            old = self._physical(partition)
+            current = set(self.partition_file_manager.list_file_metadata(partition))
+            reindexed = set(reindexed_file_ids)
+            kept = (reindexed & current) - self._rewritten.pop(partition)
+            stale = list(reindexed - kept)
+            if stale:
+                self.client.delete(
+                    collection_name=self.collection_name,
+                    filter=f"partition == '{shadow}' and file_id in {stale}",
+                )
+            added = list(current - kept)
+            for file_id in added:
+                self._copy_file_chunks(file_id, old, shadow)
+
+            self.partition_file_manager.set_partition_alias(partition, shadow)
+            self.partition_aliases[partition] = shadow
+            del self.shadow_partitions[partition]
+
+            self.client.delete(
+                collection_name=self.collection_name, filter=f"partition == '{old}'"
+            )
+        finally:
+            del self._cutovers[partition]
+            event.set()
+
+        self.logger.info(
+            "Partition cut over.",
+            partition=partition,
+            physical=shadow,
+            removed=len(stale),
+            carried_over=len(added),
+        )
+        return {"removed": len(stale), "carried_over": len(added)}
+
+    def _copy_file_chunks(self, file_id: str, source: str, target: str):
+        """Copy the chunks (and vectors) of a file between physical partitions."""
+        iterator = self.client.query_iterator(
+            collection_name=self.collection_name,
+            filter=f"partition == '{source}' and file_id == '{file_id}'",
+            batch_size=1000,
+            output_fields=["*"],
+        )
+        while True:
+            result = iterator.next()
+            if not result:
+                iterator.close()
+                break
+            rows = [
+                {
+                    **{k: v for k, v in row.items() if k not in ("_id", "sparse")},
+                    "partition": target,
+                }
+                for row in result
+            ]
+            self.client.insert(collection_name=self.collection_name, data=rows)
+
 
 # class QdrantDB(ABCVectorDB):
 #     """
@@ -17,5 +17,6 @@ def load_config(config_path=CONFIG_PATH, overrides=None) -> OmegaConf:
     ):
         config = compose(config_name="config", overrides=overrides)
         config.paths.data_dir = Path(config.paths.data_dir).resolve()
+        config.paths.state_dir = Path(config.paths.state_dir).resolve()
 
         return config
@@ -1,7 +1,13 @@
+import asyncio
 import json
+import shutil
+import tarfile
+import uuid
+import zipfile
+from collections import Counter
 from datetime import datetime
 from pathlib import Path
-from typing import Any, Optional
+from typing import Any, List, Optional
 
 import ray
 
@@ -17,9 +23,25 @@ from fastapi import (
     UploadFile,
     status,
 )
-from fastapi.responses import JSONResponse
-from utils.dependencies import get_indexer, get_task_state_manager, get_vectordb
+from components.indexer.loaders.serializer import PRIORITY_CLASSES
+from components.indexer.task_store import TERMINAL_STATES
+from fastapi.responses import JSONResponse, StreamingResponse
+from utils.dependencies import (
+    get_indexer,
+    get_serializer_queue,
+    get_task_state_manager,
+    get_vectordb,
+)
+from utils.file_store import FileStore
 from utils.logger import get_logger
+from utils.task_events import TaskEventRelay
+from utils.uploads import (
+    FileTooLargeError,
+    extract_archive,
+    is_supported_format,
+    max_upload_size,
+    save_upload_file,
+)
 
 # load logger
 logger = get_logger()
@@ -29,17 +51,27 @@ config = load_config()
 DATA_DIR = config.paths.data_dir
 
 FORBIDDEN_CHARS_IN_FILE_ID = set("/")  # set('"<>#%{}|\\^`[]')
-LOG_FILE = Path(config.paths.log_dir or "logs") / "app.json"
 
 # supported file formats or mimetypes
 ACCEPTED_FILE_FORMATS = dict(config.loader["file_loaders"]).keys()
 DICT_MIMETYPES = dict(config.loader["mimetypes"])
 
+# seconds a client is asked to wait when the pipeline is saturated
+RETRY_AFTER_SECONDS = 30
+
+# seconds between keep-alive comments on idle event streams
+EVENTS_KEEPALIVE_SECONDS = 15
+
+
+# content-addressed store of the uploaded files
+file_store = FileStore(DATA_DIR)
 
 # Get the TaskStateManager actor
 task_state_manager = get_task_state_manager()
 indexer = get_indexer()
 vectordb = get_vectordb()
+serializer_queue = get_serializer_queue()
+task_events = TaskEventRelay(task_state_manager)
 
 # Create an APIRouter instance
 router = APIRouter()
@@ -73,6 +105,23 @@ async def validate_metadata(metadata: Optional[Any] = Form(None)):
         )
 
 
+def _validate_priority(priority: str) -> str:
+    if priority not in PRIORITY_CLASSES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid priority '{priority}'. Expected one of: {', '.join(PRIORITY_CLASSES)}",
+        )
+    return priority
+
+
+async def validate_priority(priority: str = Form("interactive")):
+    return _validate_priority(priority)
+
+
+async def validate_batch_priority(priority: str = Form("bulk")):
+    return _validate_priority(priority)
+
+
 async def validate_file_format(
     file: UploadFile,
     metadata: dict = Depends(validate_metadata),
@@ -82,10 +131,7 @@ async def validate_file_format(
     )
     mimetype = metadata.get("mimetype", None)
 
-    if (
-        file_extension not in ACCEPTED_FILE_FORMATS
-        and mimetype not in DICT_MIMETYPES.keys()
-    ):
+    if not is_supported_format(file.filename, mimetype):
         details = (
             f"Unsupported file format: {file_extension} or file mimetype.\n"
             f"Supported formats: {', '.join(ACCEPTED_FILE_FORMATS)}\n"
@@ -95,8 +141,79 @@ async def validate_file_format(
             status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
             detail=details,
         )
+
+    max_size = max_upload_size(file.filename, mimetype)
+    if file.size is not None and file.size > max_size:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=str(FileTooLargeError(file.filename, max_size)),
+        )
     return file
 
+
+async def ensure_indexer_capacity():
+    """Refuse uploads while the indexing pipeline is saturated (backpressure)."""
+    if await indexer.is_saturated.remote():
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="The indexing pipeline is saturated. Please retry later.",
+            headers={"Retry-After": str(RETRY_AFTER_SECONDS)},
+        )
+
+
+async def _store_upload(
+    file: UploadFile, partition: str, file_id: str, metadata: dict, log
+) -> Path:
+    """
+    Stream the upload to the file store and reference it from (partition, file_id).
+
+    Records the source path, file name and SHA-256 in `metadata`, and returns the
+    stored path.
+    """
+    tmp_path = file_store.temp_path()
+    try:
+        _, sha256 = await save_upload_file(
+            file, tmp_path, mimetype=metadata.get("mimetype", None)
+        )
+        file_path = await asyncio.to_thread(
+            file_store.add, tmp_path, sha256, file.filename, partition, file_id
+        )
+        log.debug("File saved to disk.")
+    except FileTooLargeError as e:
+        log.warning("Upload rejected: file too large.")
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e)
+        )
+    except Exception:
+        log.exception("Failed to save file to disk.")
+        tmp_path.unlink(missing_ok=True)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to save uploaded file.",
+        )
+    metadata.update(
+        {"source": str(file_path), "filename": file.filename, "sha256": sha256}
+    )
+    return file_path
+
+
+def _queue_file(
+    file_path: Path,
+    file_id: str,
+    partition: str,
+    metadata: dict,
+    priority: str = "interactive",
+):
+    """Append file-level metadata and submit the indexing task (non-blocking)."""
+    file_stat = Path(file_path).stat()
+    metadata["file_size"] = _human_readable_size(file_stat.st_size)
+    metadata["created_at"] = datetime.fromtimestamp(file_stat.st_ctime).isoformat()
+    metadata["file_id"] = file_id
+    return indexer.add_file.remote(
+        path=file_path, metadata=metadata, partition=partition, priority=priority
+    )
+
+
 def _human_readable_size(size_bytes: int) -> str:
     """Convert bytes to a human-readable format (e.g., '2.4 MB')."""
     for unit in ["B", "KB", "MB", "GB", "TB"]:
@@ -150,7 +267,9 @@ async def get_supported_types():
     - `message/rfc822` - Email files
     
     **Response:**
-    Returns 201 Created with a task status URL for tracking indexing progress.
+    Returns 201 Created with a task status URL for tracking indexing progress,
+    or 503 Service Unavailable (with a `Retry-After` header) when the indexing
+    pipeline is saturated.
     """,
 )
 async def add_file(
@@ -159,40 +278,21 @@ async def add_file(
     file_id: str = Depends(validate_file_id),
     file: UploadFile = Depends(validate_file_format),
     metadata: dict = Depends(validate_metadata),
+    priority: str = Depends(validate_priority),
 ):
     log = logger.bind(file_id=file_id, partition=partition, filename=file.filename)
 
+    await ensure_indexer_capacity()
+
     if await vectordb.file_exists.remote(file_id, partition):
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT,
             detail=f"File '{file_id}' already exists in partition {partition}",
         )
 
-    save_dir = Path(DATA_DIR)
-    save_dir.mkdir(parents=True, exist_ok=True)
-    file_path = save_dir / Path(file.filename).name
-    metadata.update({"source": str(file_path), "filename": file.filename})
-
-    try:
-        with open(file_path, "wb") as buffer:
-            buffer.write(await file.read())
-        log.debug("File saved to disk.")
-    except Exception:
-        log.exception("Failed to save file to disk.")
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Failed to save uploaded file.",
-        )
-    file_stat = Path(file_path).stat()
-
-    # Append extra metadata
-    metadata["file_size"] = _human_readable_size(file_stat.st_size)
-    metadata["created_at"] = datetime.fromtimestamp(file_stat.st_ctime).isoformat()
-    metadata["file_id"] = file_id
+    file_path = await _store_upload(file, partition, file_id, metadata, log)
     try:
-        task = indexer.add_file.remote(
-            path=file_path, metadata=metadata, partition=partition
-        )
+        task = _queue_file(file_path, file_id, partition, metadata, priority)
     except Exception:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -235,49 +335,32 @@ async def put_file(
     file_id: str = Depends(validate_file_id),
     file: UploadFile = Depends(validate_file_format),
     metadata: dict = Depends(validate_metadata),
+    priority: str = Depends(validate_priority),
 ):
     log = logger.bind(file_id=file_id, partition=partition, filename=file.filename)
 
+    await ensure_indexer_capacity()
+
     if not await vectordb.file_exists.remote(file_id, partition):
 
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"File '{file_id}' not found in partition '{partition}'.",
         )
-        
-    try:
-        await indexer.delete_file.remote(file_id, partition)
-    except Exception:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Failed to delete existing file.",
-        )
-
-    save_dir = Path(DATA_DIR)
-    save_dir.mkdir(parents=True, exist_ok=True)
-    file_path = save_dir / Path(file.filename).name
-    metadata.update({"source": str(file_path), "filename": file.filename})
 
+    # Storing the new content moves the (partition, file_id) reference to it,
+    # so the old points are deleted without releasing the source again
+    file_path = await _store_upload(file, partition, file_id, metadata, log)
     try:
-        with open(file_path, "wb") as buffer:
-            buffer.write(await file.read())
-        log.info("File saved to disk.")
+        await indexer.delete_file.remote(file_id, partition, keep_source=True)
     except Exception:
-        log.exception("Failed to save file to disk.")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Failed to save uploaded file.",
+            detail="Failed to delete existing file.",
         )
-    file_stat = Path(file_path).stat()
 
-    # Append extra metadata
-    metadata["file_size"] = _human_readable_size(file_stat.st_size)
-    metadata["created_at"] = datetime.fromtimestamp(file_stat.st_ctime).isoformat()
-    metadata["file_id"] = file_id
     try:
-        task = indexer.add_file.remote(
-            path=file_path, metadata=metadata, partition=partition
-        )
+        task = _queue_file(file_path, file_id, partition, metadata, priority)
     except Exception:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -294,6 +377,188 @@ async def put_file(
     )
 
 
+@router.post(
+    "/partition/{partition}/batch",
+    description="""Upload and index many files in a single request.
+
+    **Request Body (form-data):**
+    - `files` (binary, repeatable): Files to upload. Their file name is used as `file_id`.
+    - `archive` (binary, optional): A `.zip` or tar (`.tar`, `.tar.gz`, `.tgz`, ...) archive.
+      Members are unpacked straight to disk; their path inside the archive, with `/`
+      replaced by `_`, is used as `file_id`.
+    - `metadata` (JSON string): Metadata applied to every file of the batch.
+    - `priority` (string, optional): `interactive` or `bulk` (default). Bulk files
+      are serialized after interactive uploads, and fairly across partitions.
+
+    Files already present in the partition, duplicates, unsupported formats and
+    files above the upload size limit are skipped and reported. Multipart requests are limited to 1000 files; use an
+    archive for larger batches.
+
+    **Response:**
+    Returns 201 Created with a batch id, a batch status URL for aggregate progress,
+    and one task status URL per queued file.
+    """,
+)
+async def add_files_batch(
+    request: Request,
+    partition: str,
+    files: List[UploadFile] = File(default=[]),
+    archive: Optional[UploadFile] = File(default=None),
+    metadata: dict = Depends(validate_metadata),
+    priority: str = Depends(validate_batch_priority),
+):
+    log = logger.bind(partition=partition)
+    if not files and archive is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Provide at least one file or an archive.",
+        )
+
+    await ensure_indexer_capacity()
+
+    batch_id = uuid.uuid4().hex
+    mimetype = metadata.get("mimetype", None)
+    skipped: list[dict] = []
+
+    # (file_id, upload or (staged path, sha256)), in submission order
+    candidates: list[tuple[str, Any]] = []
+    for file in files:
+        name = Path(file.filename).name
+        if not is_supported_format(name, mimetype):
+            skipped.append({"file": file.filename, "reason": "unsupported format"})
+            continue
+        if file.size is not None and file.size > max_upload_size(name, mimetype):
+            skipped.append({"file": file.filename, "reason": "file too large"})
+            continue
+        candidates.append((name, file))
+
+    staging_dir = file_store.temp_path()
+    try:
+        if archive is not None:
+            staging_dir.mkdir(parents=True, exist_ok=True)
+            try:
+                extracted, rejected = await asyncio.to_thread(
+                    extract_archive,
+                    archive.file,
+                    archive.filename or "",
+                    staging_dir,
+                    mimetype,
+                )
+            except (tarfile.TarError, zipfile.BadZipFile) as e:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"Invalid archive: {e}",
+                )
+            skipped.extend(rejected)
+            candidates.extend(extracted)
+
+        # Drop in-batch duplicates, then check existence with a single call
+        unique: dict[str, Any] = {}
+        for file_id, source in candidates:
+            if file_id in unique:
+                skipped.append({"file": file_id, "reason": "duplicate in batch"})
+            else:
+                unique[file_id] = source
+
+        existing = set(await vectordb.existing_file_ids.remote(list(unique), partition))
+        for file_id in existing:
+            skipped.append({"file": file_id, "reason": "already exists"})
+
+        tasks = []
+        for file_id, source in unique.items():
+            if file_id in existing:
+                continue
+            try:
+                if isinstance(source, tuple):
+                    tmp_path, sha256 = source
+                else:
+                    tmp_path = file_store.temp_path()
+                    _, sha256 = await save_upload_file(source, tmp_path, mimetype)
+                file_path = await asyncio.to_thread(
+                    file_store.add, tmp_path, sha256, file_id, partition, file_id
+                )
+            except FileTooLargeError:
+                skipped.append({"file": file_id, "reason": "file too large"})
+                continue
+            except Exception:
+                log.exception("Failed to save file to disk.", file_id=file_id)
+                skipped.append({"file": file_id, "reason": "failed to save"})
+                continue
+
+            file_metadata = {
+                **metadata,
+                "source": str(file_path),
+                "filename": file_path.name,
+                "sha256": sha256,
+            }
+            task = _queue_file(file_path, file_id, partition, file_metadata, priority)
+            tasks.append((file_id, task.task_id().hex()))
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+    await task_state_manager.register_batch.remote(
+        batch_id, [task_id for _, task_id in tasks]
+    )
+    log.info(
+        "Batch queued.", batch_id=batch_id, queued=len(tasks), skipped=len(skipped)
+    )
+
+    return JSONResponse(
+        status_code=status.HTTP_201_CREATED,
+        content={
+            "batch_id": batch_id,
+            "batch_status_url": str(
+                request.url_for("get_batch_status", batch_id=batch_id)
+            ),
+            "queued": len(tasks),
+            "skipped": skipped,
+            "tasks": [
+                {
+                    "file_id": file_id,
+                    "task_status_url": str(
+                        request.url_for("get_task_status", task_id=task_id)
+                    ),
+                }
+                for file_id, task_id in tasks
+            ],
+        },
+    )
+
+
+@router.get("/batch/{batch_id}")
+async def get_batch_status(request: Request, batch_id: str):
+    progress = await task_state_manager.get_batch_progress.remote(batch_id)
+    if progress is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Batch '{batch_id}' not found.",
+        )
+
+    states = progress["states"]
+    state_counts = Counter(states.values())
+    total = progress["total"]
+    done = sum(state_counts.get(state, 0) for state in TERMINAL_STATES)
+
+    return JSONResponse(
+        status_code=status.HTTP_200_OK,
+        content={
+            "batch_id": batch_id,
+            "total": total,
+            "completed": state_counts.get("COMPLETED", 0),
+            "failed": state_counts.get("FAILED", 0),
+            "cancelled": state_counts.get("CANCELLED", 0),
+            "active": total - done,
+            "progress": round(done / total, 4) if total else 1.0,
+            "state_counts": dict(state_counts),
+            "failed_tasks": [
+                str(request.url_for("get_task_error", task_id=task_id))
+                for task_id, state in states.items()
+                if state == "FAILED"
+            ],
+        },
+    )
+
+
 @router.patch("/partition/{partition}/file/{file_id}")
 async def patch_file(
     partition: str,
@@ -322,6 +587,92 @@ async def patch_file(
     )
 
 
+def _sse(event: dict, name: str = "task") -> str:
+    event_id = f"id: {event['seq']}\n" if event.get("seq") else ""
+    return f"{event_id}event: {name}\ndata: {json.dumps(event)}\n\n"
+
+
+async def _stream_events(request: Request, subscription, initial: list[dict]):
+    try:
+        for event in initial:
+            yield _sse(event)
+            if subscription.task_id and event["state"] in TERMINAL_STATES:
+                return
+        while True:
+            if subscription.lagged and subscription.queue.empty():
+                # the client did not keep up: it has to reconnect and resync
+                yield _sse({"reason": "client too slow"}, name="lagged")
+                return
+            try:
+                event = await asyncio.wait_for(
+                    subscription.queue.get(), EVENTS_KEEPALIVE_SECONDS
+                )
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    return
+                yield ": keep-alive\n\n"
+                continue
+            yield _sse(event)
+            if subscription.task_id and event["state"] in TERMINAL_STATES:
+                return
+    finally:
+        task_events.unsubscribe(subscription)
+
+
+@router.get(
+    "/events",
+    description="""Stream task state transitions and progress as Server-Sent Events.
+
+    **Query Parameters:**
+    - `task_id`: Only this task. The stream starts with its current state and
+      ends once it is `COMPLETED`, `FAILED` or `CANCELLED`.
+    - `batch_id`: Only the tasks of this batch.
+    - `partition`: Only the tasks of this partition.
+
+    Without filter, every task is streamed. Each `task` event holds `seq`,
+    `task_id`, `state`, `partition`, `file_id`, `batch_id`, `time` and
+    `progress` (e.g. `pages`, `chunks`, `chunks_embedded`). A `lagged` event
+    closes the stream of a client that does not keep up.
+    """,
+)
+async def stream_task_events(
+    request: Request,
+    task_id: Optional[str] = None,
+    batch_id: Optional[str] = None,
+    partition: Optional[str] = None,
+):
+    # subscribe first, so nothing is missed between the snapshot and the stream
+    subscription = task_events.subscribe(
+        task_id=task_id, batch_id=batch_id, partition=partition
+    )
+    initial = []
+    if task_id is not None:
+        state = await task_state_manager.get_state.remote(task_id)
+        if state is None:
+            task_events.unsubscribe(subscription)
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Task '{task_id}' not found.",
+            )
+        details = await task_state_manager.get_details.remote(task_id) or {}
+        initial.append(
+            {
+                "seq": None,
+                "task_id": task_id,
+                "state": state,
+                "partition": details.get("partition"),
+                "file_id": details.get("file_id"),
+                "progress": details.get("progress"),
+            }
+        )
+
+    return StreamingResponse(
+        _stream_events(request, subscription, initial),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @router.get("/task/{task_id}")
 async def get_task_status(
     request: Request,
@@ -345,12 +696,65 @@ async def get_task_status(
         "details": details,
     }
 
+    if state == "QUEUED":
+        # None once the task holds a serializer slot (or skipped serialization)
+        position = await serializer_queue.get_position.remote(task_id)
+        if position is not None:
+            content.update(position)
+
     if state == "FAILED":
         content["error_url"] = str(request.url_for("get_task_error", task_id=task_id))
 
     return JSONResponse(status_code=status.HTTP_200_OK, content=content)
 
 
+def _cancelled_response(task_ids: list[str]) -> JSONResponse:
+    return JSONResponse(
+        status_code=status.HTTP_202_ACCEPTED,
+        content={"cancelled": task_ids, "count": len(task_ids)},
+    )
+
+
+@router.delete("/task/{task_id}")
+async def cancel_task(task_id: str):
+    state = await task_state_manager.get_state.remote(task_id)
+    if state is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Task '{task_id}' not found.",
+        )
+    if state in TERMINAL_STATES:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Task '{task_id}' is already {state}.",
+        )
+
+    cancelled = await indexer.cancel_tasks.remote([task_id])
+    if not cancelled:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Task '{task_id}' ({state}) cannot be cancelled.",
+        )
+    return _cancelled_response(cancelled)
+
+
+@router.delete("/batch/{batch_id}")
+async def cancel_batch(batch_id: str):
+    if await task_state_manager.get_batch_progress.remote(batch_id) is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Batch '{batch_id}' not found.",
+        )
+    task_ids = await task_state_manager.get_active_tasks.remote(batch_id=batch_id)
+    return _cancelled_response(await indexer.cancel_tasks.remote(task_ids))
+
+
+@router.delete("/partition/{partition}/tasks")
+async def cancel_partition_tasks(partition: str):
+    task_ids = await task_state_manager.get_active_tasks.remote(partition=partition)
+    return _cancelled_response(await indexer.cancel_tasks.remote(task_ids))
+
+
 @router.get("/task/{task_id}/error")
 async def get_task_error(task_id: str):
     try:
@@ -368,34 +772,66 @@ async def get_task_error(task_id: str):
         )
 
 
+async def _follow_logs(request: Request, task_id: str, cursor: int):
+    finishing = False
+    while True:
+        result = await task_state_manager.get_logs.remote(
+            task_id, max_lines=1000, after=cursor, timeout=2 if finishing else 15
+        )
+        for line in result["lines"]:
+            yield line + "\n"
+        cursor = result["cursor"]
+        if result["lines"]:
+            continue
+        if finishing or await request.is_disconnected():
+            return
+        # the last records may still be on their way once the task is over
+        finishing = (
+            await task_state_manager.get_state.remote(task_id) in TERMINAL_STATES
+        )
+
+
 @router.get("/task/{task_id}/logs")
-async def get_task_logs(task_id: str, max_lines: int = 100):
+async def get_task_logs(
+    request: Request, task_id: str, max_lines: int = 100, follow: bool = False
+):
+    """
+    Last `max_lines` log lines of a task. With `follow`, they are streamed as
+    plain text, then the new ones as they come, until the task is over.
+    """
     try:
-        if not LOG_FILE.exists():
-            raise HTTPException(status_code=500, detail="Log file not found.")
-
-        logs = []
-        with open(LOG_FILE, "r", errors="replace") as f:
-            for line in reversed(list(f)):
-                try:
-                    record = json.loads(line).get("record", {})
-                    if record.get("extra", {}).get("task_id") == task_id:
-                        logs.append(
-                            f"{record['time']['repr']} - {record['level']['name']} - {record['message']} - {(record['extra'])}"
-                        )
-                        if len(logs) >= max_lines:
-                            break
-                except json.JSONDecodeError:
-                    continue
+        buffered = await task_state_manager.get_logs.remote(task_id, max_lines)
+        if (
+            buffered is None
+            and await task_state_manager.get_state.remote(task_id) is None
+        ):
+            raise HTTPException(status_code=404, detail=f"Task '{task_id}' not found")
 
+        if follow:
+            buffered = buffered or {"cursor": 0, "lines": []}
+
+            async def stream():
+                for line in buffered["lines"]:
+                    yield line + "\n"
+                async for line in _follow_logs(request, task_id, buffered["cursor"]):
+                    yield line
+
+            return StreamingResponse(stream(), media_type="text/plain")
+
+        if buffered is None:
+            raise HTTPException(
+                status_code=404,
+                detail=f"Logs of task '{task_id}' expired: only those of the "
+                f"{config.task_state.logs.max_tasks} most recently active tasks "
+                "are kept",
+            )
+        logs = buffered["lines"]
         if not logs:
             raise HTTPException(
                 status_code=404, detail=f"No logs found for task '{task_id}'"
             )
 
-        return JSONResponse(
-            content={"task_id": task_id, "logs": logs[::-1]}
-        )  # restore order
+        return JSONResponse(content={"task_id": task_id, "logs": logs})
     except HTTPException:
         raise
     except Exception as e:
@@ -1,4 +1,5 @@
 import json
+from pathlib import Path
 from urllib.parse import quote
 
 from config.config import load_config
@@ -95,11 +96,21 @@ async def __get_partition_name(model_name, app_state):
     return partition
 
 
+def __static_path(doc_metadata: dict) -> str:
+    """Path of a document's source relative to the static (data) directory."""
+    try:
+        return (
+            Path(doc_metadata["source"]).relative_to(config.paths.data_dir).as_posix()
+        )
+    except (KeyError, ValueError):
+        return doc_metadata["filename"]
+
+
 def __prepare_sources(request: Request, docs: list[Document]):
     links = []
     for doc in docs:
         doc_metadata = dict(doc.metadata)
-        file_url = str(request.url_for("static", path=doc_metadata["filename"]))
+        file_url = str(request.url_for("static", path=__static_path(doc_metadata)))
         encoded_url = quote(file_url, safe=":/")
         links.append(
             {
@@ -1,14 +1,21 @@
-from fastapi import APIRouter, HTTPException, Request, Response, status
+import asyncio
+from typing import Any, Dict, Optional
+
+from config.config import load_config
+from fastapi import APIRouter, Body, HTTPException, Request, Response, status
 from fastapi.responses import JSONResponse
 from utils.dependencies import get_indexer, get_vectordb
+from utils.file_store import FileStore
 from utils.logger import get_logger
 
 logger = get_logger()
+config = load_config()
 
 router = APIRouter()
 
 indexer = get_indexer()
 vectordb = get_vectordb()
+file_store = FileStore(config.paths.data_dir)
 
 
 @router.get("/")
@@ -52,7 +59,8 @@ async def delete_partition(partition: str):
             detail="Partition not found",
         )
 
-    logger.debug("Partition successfully deleted.")
+    released = await asyncio.to_thread(file_store.release_partition, partition)
+    logger.debug("Partition successfully deleted.", released_files=released)
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 
@@ -100,6 +108,51 @@ async def list_files(
     return JSONResponse(status_code=status.HTTP_200_OK, content=partition_dict)
 
 
+@router.post(
+    "/{partition}/reindex",
+    description="""Re-chunk and re-embed every file of a partition in the background.
+
+    Files are rebuilt from their cached serialized output (no new OCR or captioning)
+    into a shadow partition, under a throughput cap, and searches switch over to it
+    atomically once it is complete. The partition stays searchable meanwhile.
+
+    **Request Body (optional JSON):**
+    - `chunker`: overrides of the `chunker` configuration for this job, e.g.
+      `{"chunker": {"chunk_size": 512, "contextual_retrieval": false}}`
+
+    **Response:**
+    Returns 202 Accepted with a task status URL whose details hold the progress
+    (`done`, `total`, `eta_seconds`, ...).
+    """,
+)
+async def reindex_partition(
+    request: Request,
+    partition: str,
+    chunker: Optional[Dict[str, Any]] = Body(default=None, embed=True),
+):
+    if not await vectordb.partition_exists.remote(partition):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Partition '{partition}' not found",
+        )
+    if await indexer.is_reindexing.remote(partition):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Partition '{partition}' is already being reindexed",
+        )
+
+    task = indexer.reindex_partition.remote(partition, chunker_params=chunker)
+    logger.info("Partition reindex queued.", partition=partition)
+    return JSONResponse(
+        status_code=status.HTTP_202_ACCEPTED,
+        content={
+            "task_status_url": str(
+                request.url_for("get_task_status", task_id=task.task_id().hex())
+            )
+        },
+    )
+
+
 @router.get("/check-file/{partition}/file/{file_id}")
 async def check_file_exists_in_partition(
     partition: str,
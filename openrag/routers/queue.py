@@ -1,9 +1,17 @@
-from collections import Counter
+import asyncio
 
 from config.config import load_config
-from fastapi import APIRouter, Request, status
+from fastapi import APIRouter, Query, Request, status
 from fastapi.responses import JSONResponse
-from utils.dependencies import get_serializer_queue, get_task_state_manager
+from utils.dependencies import (
+    get_caption_cache,
+    get_document_cache,
+    get_indexer,
+    get_marker_pool,
+    get_serializer_queue,
+    get_task_state_manager,
+    get_transcription_pool,
+)
 
 # load config
 config = load_config()
@@ -13,69 +21,114 @@ router = APIRouter()
 
 serializer_queue = get_serializer_queue()
 task_state_manager = get_task_state_manager()
-
-def _format_pool_info(worker_info: dict[str, int]) -> dict[str, int]:
+indexer = get_indexer()
+document_cache = get_document_cache()
+caption_cache = get_caption_cache()
+marker_pool = get_marker_pool()
+transcription_pool = get_transcription_pool()
+
+ACTIVE_STATUSES = [
+    "QUEUED",
+    "SERIALIZING",
+    "CHUNKING",
+    "EMBEDDING",
+    "INSERTING",
+    "REINDEXING",
+]
+
+
+def _format_pool_info(pool: dict) -> dict:
     """
-    Convert SerializerQueue.pool_info() output into a concise dict for the API.
+    Convert the serializer ActorPool stats into a concise dict for the API.
     """
     return {
-        "total_slots": worker_info["total_capacity"],
-        "pool_size": worker_info["pool_size"],
-        "max_per_actor": worker_info["max_tasks_per_worker"],
+        "total_slots": pool["capacity"],
+        "pool_size": pool["actors"],
+        "min_pool_size": pool["min_actors"],
+        "max_pool_size": pool["max_actors"],
+        "max_per_actor": pool["slots_per_actor"],
+        "busy": pool["busy"],
+        "utilization": pool["utilization"],
     }
 
 
 @router.get("/info")
 async def get_queue_info():
-    all_states: dict = await task_state_manager.get_all_states.remote()
-    status_counts = Counter(all_states.values())
+    """Task counts per state, maintained by the task state manager (one call)."""
+    status_counts: dict = await task_state_manager.get_state_counts.remote()
 
-    active_statuses = ["QUEUED", "SERIALIZING", "CHUNKING", "INSERTING"]
-    active = {s: status_counts.get(s, 0) for s in active_statuses}
+    active = {s: status_counts.get(s, 0) for s in ACTIVE_STATUSES}
 
     task_summary = {
         "active": sum(active.values()),
         "active_statuses": active,
         "total_completed": status_counts.get("COMPLETED", 0),
         "total_failed": status_counts.get("FAILED", 0),
+        "total_cancelled": status_counts.get("CANCELLED", 0),
     }
+    return {"tasks": task_summary}
+
 
-    worker_info = await task_state_manager.get_pool_info.remote()
-    workers_block = _format_pool_info(worker_info)
+@router.get("/stats")
+async def get_queue_stats():
+    """
+    Workers, queue depth and throughput of the indexing stages, and the stats
+    of the caches and actor pools they use.
+    """
+    calls = {
+        "pipeline": indexer.get_pipeline_stats.remote(),
+        "document_cache": document_cache.get_stats.remote(),
+        "caption_cache": caption_cache.get_stats.remote(),
+    }
+    if marker_pool is not None:
+        calls["marker_pool"] = marker_pool.get_stats.remote()
+    if transcription_pool is not None:
+        calls["transcription_pool"] = transcription_pool.get_stats.remote()
+    stats = dict(zip(calls, await asyncio.gather(*calls.values()), strict=True))
 
-    return {"workers": workers_block, "tasks": task_summary}
+    # per-stage workers and queue depth: serialize -> chunk -> embed -> insert
+    workers_block = _format_pool_info(stats["pipeline"]["serialize"]["pool"])
+    return {"workers": workers_block, **stats}
 
 
 @router.get("/tasks", name="list_tasks")
-async def list_tasks(request: Request, task_status: str | None = None):
+async def list_tasks(
+    request: Request,
+    task_status: str | None = None,
+    partition: str | None = None,
+    file_id: str | None = None,
+    batch_id: str | None = None,
+    limit: int = Query(100, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+):
     """
-    - ?task_status=active  → QUEUED | SERIALIZING | CHUNKING | INSERTING
+    - ?task_status=active  → QUEUED | SERIALIZING | CHUNKING | EMBEDDING | INSERTING | REINDEXING
     - ?task_status=<exact> → exact match (case-insensitive)
     - (none)               → all tasks
-    """
-    # fetck task info
-    all_info: dict[str, dict] = await task_state_manager.get_all_info.remote()
 
+    Filtered by `partition`, `file_id` and `batch_id` if given, most recent
+    first, `limit` tasks from `offset`.
+    """
     if task_status is None:
-        filtered = all_info.items()
+        states = None
+    elif task_status.lower() == "active":
+        states = ACTIVE_STATUSES
     else:
-        if task_status.lower() == "active":
-            active_states = {"QUEUED", "SERIALIZING", "CHUNKING", "INSERTING"}
-            filtered = [
-                (tid, info)
-                for tid, info in all_info.items()
-                if info["state"] in active_states
-            ]
-        else:
-            filtered = [
-                (tid, info)
-                for tid, info in all_info.items()
-                if info["state"].lower() == task_status.lower()
-            ]
+        states = [task_status.upper()]
+
+    page = await task_state_manager.list_tasks.remote(
+        states=states,
+        partition=partition,
+        file_id=file_id,
+        batch_id=batch_id,
+        limit=limit,
+        offset=offset,
+    )
 
     # format the response
     tasks = []
-    for task_id, info in filtered:
+    for info in page["tasks"]:
+        task_id = info["task_id"]
         item = {
             "task_id": task_id,
             "state": info["state"],
@@ -90,4 +143,14 @@ async def list_tasks(request: Request, task_status: str | None = None):
         }
         tasks.append(item)
 
-    return JSONResponse(status_code=status.HTTP_200_OK, content={"tasks": tasks})
+    content = {
+        "total": page["total"],
+        "limit": limit,
+        "offset": offset,
+        "tasks": tasks,
+    }
+    if offset + limit < page["total"]:
+        content["next_url"] = str(
+            request.url.include_query_params(offset=offset + limit)
+        )
+    return JSONResponse(status_code=status.HTTP_200_OK, content=content)
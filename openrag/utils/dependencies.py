@@ -1,11 +1,15 @@
 import ray
 import ray.actor
 from components import ABCVectorDB
+from components.indexer.caption_cache import CaptionCache
+from components.indexer.document_cache import DocumentCache
 from components.indexer.indexer import Indexer, TaskStateManager
+from components.indexer.loaders.media_loader import TranscriptionPool
 from components.indexer.loaders.pdf_loaders.marker import MarkerPool
 from components.indexer.loaders.serializer import SerializerQueue
 from components.indexer.vectordb.vectordb import MilvusDB
 from config import load_config
+from utils.metrics import MetricsCollector
 
 
 def get_or_create_actor(name, cls, namespace="openrag", **options):
@@ -36,6 +40,19 @@ def get_marker_pool():
         return get_or_create_actor("MarkerPool", MarkerPool)
 
 
+def get_transcription_pool():
+    if "VideoAudioLoader" in config.loader.file_loaders.values():
+        return get_or_create_actor("TranscriptionPool", TranscriptionPool)
+
+
+def get_document_cache():
+    return get_or_create_actor("DocumentCache", DocumentCache)
+
+
+def get_caption_cache():
+    return get_or_create_actor("CaptionCache", CaptionCache)
+
+
 def get_indexer():
     return get_or_create_actor("Indexer", Indexer)
 
@@ -44,6 +61,14 @@ def get_vectordb() -> ABCVectorDB:
     return get_or_create_actor("Vectordb", MilvusDB)
 
 
+def get_metrics_collector():
+    return get_or_create_actor("MetricsCollector", MetricsCollector)
+
+
+metrics_collector = get_metrics_collector()
 vectordb = get_vectordb()
+document_cache = get_document_cache()
+caption_cache = get_caption_cache()
 indexer = get_indexer()
 marker_pool = get_marker_pool()
+transcription_pool = get_transcription_pool()
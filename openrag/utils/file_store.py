@@ -0,0 +1,151 @@
+import fcntl
+import os
+import shutil
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional
+from urllib.parse import quote
+
+
+def _ref_name(partition: str, file_id: str) -> str:
+    return f"{quote(partition, safe='')}@{quote(file_id, safe='')}"
+
+
+class FileStore:
+    """
+    Content-addressed store for uploaded files, shared by the API and the indexer.
+
+    Layout under `<data_dir>/store`::
+
+        objects/<sha[:2]>/<sha>/files/<filename> the content (hard links for other names)
+        objects/<sha[:2]>/<sha>/refs/<ref>       one marker per (partition, file_id), holds the filename
+        refs/<ref>                               reverse index: (partition, file_id) -> sha
+        tmp/                                     uploads being streamed and hashed
+
+    An object is removed with its last reference. All methods block on the
+    filesystem and a store-wide lock: call them from a thread in async code.
+    """
+
+    def __init__(self, data_dir):
+        self.data_dir = Path(data_dir)
+        self.root = self.data_dir / "store"
+        self.objects_dir = self.root / "objects"
+        self.refs_dir = self.root / "refs"
+        self.tmp_dir = self.root / "tmp"
+        for d in (self.objects_dir, self.refs_dir, self.tmp_dir):
+            d.mkdir(parents=True, exist_ok=True)
+        self._lock_path = self.root / ".lock"
+
+    @contextmanager
+    def _locked(self):
+        with open(self._lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def object_dir(self, sha256: str) -> Path:
+        return self.objects_dir / sha256[:2] / sha256
+
+    def temp_path(self) -> Path:
+        """A fresh path in the staging area, to stream an upload to before `add`."""
+        return self.tmp_dir / uuid.uuid4().hex
+
+    def add(
+        self, tmp_path: Path, sha256: str, filename: str, partition: str, file_id: str
+    ) -> Path:
+        """
+        Move a staged upload into the store and reference it from (partition, file_id).
+
+        The staged file is dropped when the content is already stored. Returns the
+        path of the stored file under `filename`.
+        """
+        filename = Path(filename).name
+        obj_dir = self.object_dir(sha256)
+        target = obj_dir / "files" / filename
+        ref = _ref_name(partition, file_id)
+        with self._locked():
+            (obj_dir / "refs").mkdir(parents=True, exist_ok=True)
+            (obj_dir / "files").mkdir(exist_ok=True)
+            if not target.exists():
+                existing = next(self._stored_files(obj_dir), None)
+                if existing is not None:
+                    os.link(existing, target)
+                else:
+                    os.replace(tmp_path, target)
+            Path(tmp_path).unlink(missing_ok=True)
+
+            # Replacing a reference releases the content (or the name) it pointed to
+            previous = self._read_ref(ref)
+            if previous is not None and previous != sha256:
+                self._drop_ref(previous, ref)
+            marker = obj_dir / "refs" / ref
+            renamed = marker.read_text() if previous == sha256 else None
+            marker.write_text(filename)
+            (self.refs_dir / ref).write_text(sha256)
+            if renamed is not None and renamed != filename:
+                self._unlink_unused(obj_dir, renamed)
+        return target
+
+    def release(self, partition: str, file_id: str) -> bool:
+        """Drop the reference of (partition, file_id); False if it had none."""
+        ref = _ref_name(partition, file_id)
+        with self._locked():
+            sha256 = self._read_ref(ref)
+            if sha256 is None:
+                return False
+            self._drop_ref(sha256, ref)
+        return True
+
+    def release_partition(self, partition: str) -> int:
+        """Drop every reference held by a partition. Returns how many were dropped."""
+        prefix = f"{quote(partition, safe='')}@"
+        released = 0
+        with self._locked():
+            for ref_path in self.refs_dir.glob(f"{prefix}*"):
+                sha256 = self._read_ref(ref_path.name)
+                if sha256 is not None:
+                    self._drop_ref(sha256, ref_path.name)
+                    released += 1
+        return released
+
+    def ref_count(self, sha256: str) -> int:
+        refs = self.object_dir(sha256) / "refs"
+        return sum(1 for _ in refs.iterdir()) if refs.is_dir() else 0
+
+    def _read_ref(self, ref: str) -> Optional[str]:
+        try:
+            return (self.refs_dir / ref).read_text().strip() or None
+        except FileNotFoundError:
+            return None
+
+    @staticmethod
+    def _stored_files(obj_dir: Path):
+        """Existing content files, found through the names recorded by the references."""
+        for marker in (obj_dir / "refs").iterdir():
+            path = obj_dir / "files" / marker.read_text()
+            if path.is_file():
+                yield path
+
+    def _drop_ref(self, sha256: str, ref: str):
+        obj_dir = self.object_dir(sha256)
+        marker = obj_dir / "refs" / ref
+        try:
+            filename = marker.read_text()
+        except FileNotFoundError:
+            filename = None
+        marker.unlink(missing_ok=True)
+        (self.refs_dir / ref).unlink(missing_ok=True)
+
+        if not (obj_dir / "refs").is_dir() or not any((obj_dir / "refs").iterdir()):
+            shutil.rmtree(obj_dir, ignore_errors=True)
+        elif filename:
+            self._unlink_unused(obj_dir, filename)
+
+    @staticmethod
+    def _unlink_unused(obj_dir: Path, filename: str):
+        """Remove a name of the content once no reference uses it anymore."""
+        if filename not in (m.read_text() for m in (obj_dir / "refs").iterdir()):
+            (obj_dir / "files" / filename).unlink(missing_ok=True)
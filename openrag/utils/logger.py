@@ -1,10 +1,70 @@
 from loguru import logger
 import sys
 import os
+import threading
+import time
 from config import load_config
 
 config = load_config()
 
+# log records buffered per process while the TaskStateManager is unreachable
+TASK_LOG_BUFFER_SIZE = 10000
+
+
+class TaskLogSink:
+    """
+    Forwards the records bound to a `task_id` to the TaskStateManager, which
+    keeps the last lines of each task. Records are sent in batches from a
+    background thread, so logging never waits on the actor.
+    """
+
+    def __init__(self, flush_interval: float):
+        self.flush_interval = flush_interval
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._task_state_manager = None
+        threading.Thread(target=self._flush_loop, daemon=True).start()
+
+    def __call__(self, message):
+        record = message.record
+        line = (
+            f"{record['time']} - {record['level'].name} - {record['message']} - "
+            f"{record['extra']}"
+        )
+        with self._lock:
+            if len(self._buffer) < TASK_LOG_BUFFER_SIZE:
+                self._buffer.append((record["extra"]["task_id"], line))
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            with self._lock:
+                batch, self._buffer = self._buffer, []
+            if not batch:
+                continue
+            try:
+                self._get_task_state_manager().append_logs.remote(batch)
+            except Exception:
+                # not reachable yet: keep the records for the next attempt
+                self._task_state_manager = None
+                with self._lock:
+                    self._buffer[:0] = batch[-TASK_LOG_BUFFER_SIZE:]
+                    del self._buffer[TASK_LOG_BUFFER_SIZE:]
+
+    def _get_task_state_manager(self):
+        import ray
+
+        if self._task_state_manager is None:
+            if not ray.is_initialized():
+                raise RuntimeError("Ray is not initialized")
+            self._task_state_manager = ray.get_actor(
+                "TaskStateManager", namespace="openrag"
+            )
+        return self._task_state_manager
+
+
+_task_log_sink = None
+
 
 def get_logger():
     def formatter(record):
@@ -43,4 +103,14 @@ def get_logger():
         enqueue=True,
     )
 
+    # Per-task lines, served by GET /indexer/task/{task_id}/logs
+    global _task_log_sink
+    if _task_log_sink is None:
+        _task_log_sink = TaskLogSink(config.task_state.logs.flush_interval)
+    logger.add(
+        _task_log_sink,
+        level=config.verbose.level,
+        filter=lambda record: "task_id" in record["extra"],
+    )
+
     return logger
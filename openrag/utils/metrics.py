@@ -0,0 +1,200 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import ray
+from config import load_config
+
+config = load_config()
+DICT_MIMETYPES = dict(config.loader["mimetypes"])
+
+# samples buffered per process while the MetricsCollector is unreachable
+METRICS_BUFFER_SIZE = 100000
+
+# seconds, from a text file chunk to a long audio transcription
+DURATION_BUCKETS = (
+    0.01,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+    30,
+    60,
+    120,
+    300,
+    600,
+    1800,
+    3600,
+)
+
+# name -> (type, help)
+METRICS = {
+    "openrag_stage_duration_seconds": (
+        "histogram",
+        "Time spent by a file in an indexing stage "
+        "(serialize, caption, marker, transcribe, chunk, contextualize, embed, insert)",
+    ),
+    "openrag_pages_total": ("counter", "Pages parsed"),
+    "openrag_images_total": ("counter", "Images sent to the VLM for captioning"),
+    "openrag_images_skipped_total": (
+        "counter",
+        "Images left uncaptioned by the image filter, by reason (size, aspect_ratio, entropy)",
+    ),
+    "openrag_vlm_requests_total": ("counter", "Captioning requests sent to the VLM"),
+    "openrag_image_payload_bytes_total": (
+        "counter",
+        "Bytes of base64 image payload sent to the VLM",
+    ),
+    "openrag_caption_cache_total": (
+        "counter",
+        "Caption cache lookups, by result (hit, miss)",
+    ),
+    "openrag_chunks_total": ("counter", "Chunks produced"),
+    "openrag_files_total": ("counter", "Files whose indexing ended, by status"),
+}
+
+# labels of every indexing metric, "" when unknown to the recording component
+FILE_LABELS = ("loader", "file_type", "partition")
+
+
+def file_type(path, metadata: Optional[Dict] = None) -> str:
+    """Extension of a file, from its mimetype when given (as the loaders pick it)."""
+    mimetype = (metadata or {}).get("mimetype")
+    extension = DICT_MIMETYPES.get(mimetype) if mimetype else Path(path).suffix
+    return (extension or "").lstrip(".").lower()
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...], **extra) -> str:
+    items = [*labels, *extra.items()]
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items) + "}"
+
+
+@ray.remote
+class MetricsCollector:
+    """Aggregates the samples recorded by every process and renders them for Prometheus."""
+
+    def __init__(self):
+        # (name, labels) -> value
+        self.counters: Dict[Tuple[str, tuple], float] = {}
+        # (name, labels) -> [per-bucket counts (+Inf last), sum, count]
+        self.histograms: Dict[Tuple[str, tuple], list] = {}
+
+    def record(self, samples: List[Tuple[str, Dict[str, str], float]]):
+        for name, labels, value in samples:
+            key = (name, tuple(sorted(labels.items())))
+            if METRICS[name][0] == "counter":
+                self.counters[key] = self.counters.get(key, 0) + value
+                continue
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [
+                    [0] * (len(DURATION_BUCKETS) + 1),
+                    0.0,
+                    0,
+                ]
+            histogram[0][bisect.bisect_left(DURATION_BUCKETS, value)] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def render(self) -> str:
+        """Metrics in the Prometheus text exposition format."""
+        lines = []
+        for name, (kind, help_text) in METRICS.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind == "counter":
+                for (metric, labels), value in self.counters.items():
+                    if metric == name:
+                        lines.append(f"{name}{_format_labels(labels)} {value}")
+                continue
+            for (metric, labels), (buckets, total, count) in self.histograms.items():
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, bucket in zip((*DURATION_BUCKETS, "+Inf"), buckets):
+                    cumulative += bucket
+                    lines.append(
+                        f"{name}_bucket{_format_labels(labels, le=bound)} {cumulative}"
+                    )
+                lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+                lines.append(f"{name}_count{_format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+class MetricsRecorder:
+    """
+    Records samples in the current process and ships them to the
+    MetricsCollector in batches from a background thread, so recording never
+    waits on the actor.
+    """
+
+    def __init__(self, flush_interval: float = 1.0):
+        self.flush_interval = flush_interval
+        self._buffer: List[Tuple[str, Dict[str, str], float]] = []
+        self._lock = threading.Lock()
+        self._collector = None
+        self._flusher: Optional[threading.Thread] = None
+
+    def _add(self, name: str, value: float, labels: Dict):
+        labels = {k: str(labels.get(k) or "") for k in FILE_LABELS} | {
+            k: str(v) for k, v in labels.items() if k not in FILE_LABELS
+        }
+        with self._lock:
+            if len(self._buffer) < METRICS_BUFFER_SIZE:
+                self._buffer.append((name, labels, value))
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+                self._flusher.start()
+
+    def observe(self, stage: str, seconds: float, **labels):
+        self._add("openrag_stage_duration_seconds", seconds, {**labels, "stage": stage})
+
+    def inc(self, name: str, value: float = 1, **labels):
+        self._add(name, value, labels)
+
+    @contextmanager
+    def timer(self, stage: str, **labels):
+        """Time the enclosed block (awaits included) as a stage of a file."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start, **labels)
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            with self._lock:
+                batch, self._buffer = self._buffer, []
+            if not batch:
+                continue
+            try:
+                if self._collector is None:
+                    if not ray.is_initialized():
+                        raise RuntimeError("Ray is not initialized")
+                    self._collector = ray.get_actor(
+                        "MetricsCollector", namespace="openrag"
+                    )
+                self._collector.record.remote(batch)
+            except Exception:
+                # not reachable yet: keep the samples for the next attempt
+                self._collector = None
+                with self._lock:
+                    self._buffer[:0] = batch
+                    del self._buffer[METRICS_BUFFER_SIZE:]
+
+
+metrics = MetricsRecorder()
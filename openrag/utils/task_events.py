@@ -0,0 +1,85 @@
+import asyncio
+from dataclasses import dataclass, field
+from typing import Optional, Set
+
+from utils.logger import get_logger
+
+logger = get_logger()
+
+# events buffered per subscriber before it is dropped as too slow
+SUBSCRIBER_QUEUE_SIZE = 1000
+
+
+@dataclass(eq=False)
+class Subscription:
+    """Events of the tasks matching every given filter; all tasks without one."""
+
+    task_id: Optional[str] = None
+    batch_id: Optional[str] = None
+    partition: Optional[str] = None
+    queue: asyncio.Queue = field(
+        default_factory=lambda: asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+    )
+    lagged: bool = False
+
+    def matches(self, event: dict) -> bool:
+        return all(
+            expected is None or event.get(key) == expected
+            for key, expected in (
+                ("task_id", self.task_id),
+                ("batch_id", self.batch_id),
+                ("partition", self.partition),
+            )
+        )
+
+
+class TaskEventRelay:
+    """
+    Fans the TaskStateManager event log out to the streams of this process.
+
+    A single long-poll loop follows the log, whatever the number of connected
+    clients, and runs only while some are.
+    """
+
+    def __init__(self, task_state_manager, poll_timeout: float = 15.0):
+        self.task_state_manager = task_state_manager
+        self.poll_timeout = poll_timeout
+        self.subscriptions: Set[Subscription] = set()
+        self._poller: Optional[asyncio.Task] = None
+
+    def subscribe(self, **filters) -> Subscription:
+        subscription = Subscription(**filters)
+        self.subscriptions.add(subscription)
+        if self._poller is None or self._poller.done():
+            self._poller = asyncio.create_task(self._poll())
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        self.subscriptions.discard(subscription)
+
+    def _dispatch(self, event: dict):
+        for subscription in list(self.subscriptions):
+            if not subscription.matches(event):
+                continue
+            try:
+                subscription.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                subscription.lagged = True
+                self.unsubscribe(subscription)
+
+    async def _poll(self):
+        cursor = None
+        while self.subscriptions:
+            try:
+                result = await self.task_state_manager.get_events.remote(
+                    after=cursor, timeout=self.poll_timeout
+                )
+            except Exception:
+                logger.exception("Failed to fetch task events.")
+                await asyncio.sleep(1)
+                continue
+            if result["lost"]:
+                logger.warning("Task event relay fell behind, events were lost.")
+            for event in result["events"]:
+                self._dispatch(event)
+            cursor = result["seq"]
@@ -0,0 +1,145 @@
+import asyncio
+import hashlib
+import tarfile
+import zipfile
+from pathlib import Path, PurePosixPath
+from typing import BinaryIO, Dict, List, Optional, Tuple
+
+from config import load_config
+from fastapi import UploadFile
+
+config = load_config()
+
+UPLOAD_CHUNK_SIZE = config.upload.get("chunk_size", 1024 * 1024)
+MAX_SIZE_MB = dict(config.upload["max_size_mb"])
+DICT_MIMETYPES = dict(config.loader["mimetypes"])
+ACCEPTED_FILE_FORMATS = dict(config.loader["file_loaders"]).keys()
+
+
+class FileTooLargeError(ValueError):
+    def __init__(self, filename: str, max_size: int):
+        self.filename = filename
+        self.max_size = max_size
+        super().__init__(
+            f"File '{filename}' exceeds the maximum size of {max_size // (1024 * 1024)} MB"
+        )
+
+
+def is_supported_format(filename: str, mimetype: Optional[str] = None) -> bool:
+    file_extension = filename.split(".")[-1].lower() if "." in filename else ""
+    return file_extension in ACCEPTED_FILE_FORMATS or mimetype in DICT_MIMETYPES
+
+
+def max_upload_size(filename: str, mimetype: Optional[str] = None) -> int:
+    """Maximum accepted size in bytes for a file, based on its extension (or mimetype)."""
+    extension = filename.rsplit(".", 1)[-1].lower() if "." in filename else ""
+    if extension not in MAX_SIZE_MB and mimetype in DICT_MIMETYPES:
+        extension = DICT_MIMETYPES[mimetype].lstrip(".")
+    return int(MAX_SIZE_MB.get(extension, MAX_SIZE_MB["default"]) * 1024 * 1024)
+
+
+def max_request_size() -> int:
+    """Largest per-file limit, used to reject oversized bodies before parsing them."""
+    return int(max(MAX_SIZE_MB.values()) * 1024 * 1024)
+
+
+def copy_and_hash(
+    src: BinaryIO, dest: Path, max_size: Optional[int] = None, filename: str = ""
+) -> Tuple[int, str]:
+    """
+    Copy `src` to `dest` in fixed-size chunks while computing its SHA-256.
+
+    Blocking: run it in a thread. The partial file is removed if the size limit
+    is exceeded or the copy fails. Returns `(size_in_bytes, sha256_hexdigest)`.
+    """
+    sha256 = hashlib.sha256()
+    size = 0
+    try:
+        with open(dest, "wb") as out:
+            while chunk := src.read(UPLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                if max_size is not None and size > max_size:
+                    raise FileTooLargeError(filename or dest.name, max_size)
+                sha256.update(chunk)
+                out.write(chunk)
+    except BaseException:
+        dest.unlink(missing_ok=True)
+        raise
+    return size, sha256.hexdigest()
+
+
+async def save_upload_file(
+    file: UploadFile, dest: Path, mimetype: Optional[str] = None
+) -> Tuple[int, str]:
+    """
+    Stream an uploaded file to `dest` off the event loop, enforcing its size limit.
+
+    The limit is checked against the announced size first, so oversized files
+    fail before anything is written. Returns `(size_in_bytes, sha256_hexdigest)`.
+    """
+    max_size = max_upload_size(file.filename or dest.name, mimetype)
+    if file.size is not None and file.size > max_size:
+        raise FileTooLargeError(file.filename, max_size)
+
+    await file.seek(0)
+    return await asyncio.to_thread(
+        copy_and_hash, file.file, dest, max_size, file.filename
+    )
+
+
+def archive_member_id(name: str) -> str:
+    """Flatten an archive member path into a valid file id ('a/b/c.pdf' -> 'a_b_c.pdf')."""
+    parts = [p for p in PurePosixPath(name).parts if p not in ("", ".", "..", "/")]
+    return "_".join(parts)
+
+
+def extract_archive(fileobj, archive_name: str, dest_dir: Path, mimetype=None):
+    """
+    Unpack the supported members of a zip or tar archive straight to `dest_dir`.
+
+    Tar archives are read as a stream (`r|*`), so compressed tarballs are
+    never loaded in memory. Members are hashed while written and checked against
+    the upload size limits. A member whose flattened id was already extracted
+    ('a/b_c.pdf' and 'a_b/c.pdf', or a repeated entry) is skipped, so that it
+    does not overwrite the first one. Returns the extracted
+    `(file_id, (path, sha256))` pairs and the skipped `{"file", "reason"}` entries.
+    """
+    extracted: List[Tuple[str, Tuple[Path, str]]] = []
+    skipped: List[Dict[str, str]] = []
+    seen = set()
+
+    def accept(name: str, size: int) -> Optional[Path]:
+        file_id = archive_member_id(name)
+        if not file_id or not is_supported_format(file_id, mimetype):
+            skipped.append({"file": name, "reason": "unsupported format"})
+            return None
+        if file_id in seen:
+            skipped.append({"file": name, "reason": "duplicate in batch"})
+            return None
+        if size > max_upload_size(file_id, mimetype):
+            skipped.append({"file": name, "reason": "file too large"})
+            return None
+        seen.add(file_id)
+        return dest_dir / file_id
+
+    if archive_name.lower().endswith(".zip"):
+        with zipfile.ZipFile(fileobj) as zf:
+            for member in zf.infolist():
+                if member.is_dir():
+                    continue
+                if (target := accept(member.filename, member.file_size)) is None:
+                    continue
+                with zf.open(member) as src:
+                    _, sha256 = copy_and_hash(src, target)
+                extracted.append((target.name, (target, sha256)))
+    else:
+        with tarfile.open(fileobj=fileobj, mode="r|*") as tf:
+            for member in tf:
+                if not member.isfile():
+                    continue
+                if (target := accept(member.name, member.size)) is None:
+                    continue
+                with tf.extractfile(member) as src:
+                    _, sha256 = copy_and_hash(src, target)
+                extracted.append((target.name, (target, sha256)))
+    return extracted, skipped
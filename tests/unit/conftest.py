@@ -0,0 +1,17 @@
+import os
+import tempfile
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+ROOT = Path(__file__).resolve().parents[2]
+SCRATCH = Path(tempfile.mkdtemp(prefix="openrag-tests-"))
+
+# Outside the container: the config of the repository, with the example
+# settings, and data and logs kept out of the way
+os.environ.setdefault("CONFIG_PATH", str(ROOT / ".hydra_config"))
+os.environ.setdefault("PROMPTS_DIR", str(ROOT / "prompts" / "example3"))
+os.environ.setdefault("DATA_DIR", str(SCRATCH / "data"))
+os.environ.setdefault("STATE_DIR", str(SCRATCH / "state"))
+os.environ.setdefault("LOG_DIR", str(SCRATCH / "logs"))
+load_dotenv(ROOT / ".env.example")
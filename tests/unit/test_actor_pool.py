@@ -0,0 +1,178 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from components.indexer import actor_pool
+from components.indexer.actor_pool import ActorPool
+
+
+class StubActor:
+    """Stands for an actor class: `options(...).remote()` returns a new handle."""
+
+    def __init__(self):
+        self.spawned = []
+
+    def options(self, **options):
+        return self
+
+    def remote(self):
+        handle = SimpleNamespace(name=f"actor-{len(self.spawned)}")
+        self.spawned.append(handle)
+        return handle
+
+
+@pytest.fixture
+def killed(monkeypatch):
+    killed = []
+    monkeypatch.setattr(actor_pool.ray, "kill", killed.append)
+    return killed
+
+
+def make_pool(slots_per_actor=1, min_actors=1, max_actors=1, unhealthy=(), **kwargs):
+    async def health_check(handle):
+        return handle.name not in unhealthy
+
+    # maintenance is driven by the tests, through _autoscale and _check
+    kwargs.setdefault("scale_interval", 3600)
+    return ActorPool(
+        "test",
+        StubActor(),
+        slots_per_actor=slots_per_actor,
+        min_actors=min_actors,
+        max_actors=max_actors,
+        health_check=health_check,
+        **kwargs,
+    )
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_slots_go_to_the_least_busy_actor_then_to_waiters_in_order():
+    async def main():
+        pool = make_pool(slots_per_actor=2, min_actors=2, max_actors=2)
+        handles = [pool.try_acquire() for _ in range(4)]
+        assert [h.name for h in handles] == ["actor-0", "actor-1"] * 2
+        assert pool.try_acquire() is None
+
+        first = asyncio.create_task(pool.acquire())
+        second = asyncio.create_task(pool.acquire())
+        await settle()
+        assert pool.stats()["queued"] == 2
+        pool.release(handles[1])
+        pool.release(handles[0])
+        assert (await first).name == "actor-1"
+        assert (await second).name == "actor-0"
+        assert (pool.busy, pool.stats()["queued"]) == (4, 0)
+
+    asyncio.run(main())
+
+
+def test_cancelled_waiters_do_not_take_a_slot():
+    async def main():
+        pool = make_pool()
+        handle = pool.try_acquire()
+        waiter = asyncio.create_task(pool.acquire())
+        await settle()
+        waiter.cancel()
+        await settle()
+        pool.release(handle)
+        assert pool.busy == 0 and pool.has_free_slot
+
+    asyncio.run(main())
+
+
+def test_scale_up_when_work_waits_up_to_max_actors():
+    async def main():
+        pool = make_pool(max_actors=2, scale_up_wait=0)
+        pool.try_acquire()
+        pool._autoscale()  # nothing waits
+        assert len(pool.actors) == 1
+
+        waiters = [asyncio.create_task(pool.acquire()) for _ in range(2)]
+        await settle()
+        pool._autoscale()
+        assert (await waiters[0]).name == "actor-1"
+        pool._autoscale()
+        assert len(pool.actors) == 2 and not waiters[1].done()
+        assert pool.stats()["scale_ups"] == 1
+        waiters[1].cancel()
+
+    asyncio.run(main())
+
+
+def test_idle_actors_are_dropped_down_to_min_actors(killed):
+    pool = make_pool(min_actors=1, max_actors=3, idle_timeout=0)
+    pool._add_actor()
+    pool._add_actor()
+    busy = pool.try_acquire()
+
+    pool._autoscale()
+    assert [a.handle for a in pool.actors] == [busy]
+    assert [h.name for h in killed] == ["actor-1", "actor-2"]
+    assert pool.stats()["scale_downs"] == 2
+
+
+def test_no_scale_down_while_work_is_queued():
+    pool = make_pool(
+        min_actors=1,
+        max_actors=2,
+        idle_timeout=0,
+        scale_up_wait=60,
+        backlog=lambda: (1, 0.0),
+    )
+    pool._add_actor()
+    pool._autoscale()
+    assert len(pool.actors) == 2
+
+
+def test_failed_actor_passing_its_health_check_serves_again():
+    async def main():
+        pool = make_pool(slots_per_actor=2)
+        handle = pool.try_acquire()
+        pool.release(handle, failed=True)
+        assert pool.capacity == 0 and pool.busy == 0
+        await settle()
+        assert pool.capacity == 2
+        assert pool.try_acquire() is handle
+        assert pool.stats()["replaced"] == 0
+
+    asyncio.run(main())
+
+
+def test_unhealthy_actor_is_replaced_and_removed_once_idle(killed):
+    async def main():
+        pool = make_pool(slots_per_actor=2, unhealthy={"actor-0"})
+        broken = pool.try_acquire()
+        assert pool.try_acquire() is broken
+        waiter = asyncio.create_task(pool.acquire())
+        await settle()
+
+        pool.release(broken, failed=True)
+        await settle()
+        # the replacement takes the waiting work; the other slot keeps running
+        replacement = await waiter
+        assert replacement.name == "actor-1"
+        stats = pool.stats()
+        assert (stats["actors"], stats["draining"], stats["replaced"]) == (1, 1, 1)
+        assert (pool.capacity, pool.busy) == (2, 2)
+        assert killed == []
+
+        pool.release(broken)
+        assert [a.handle for a in pool.actors] == [replacement]
+        assert killed == [broken]
+        assert pool.busy == 1
+
+    asyncio.run(main())
+
+
+def test_health_checks_replace_idle_unhealthy_actors(killed):
+    async def main():
+        pool = make_pool(min_actors=2, max_actors=2, unhealthy={"actor-0"})
+        await asyncio.gather(*(pool._check(a) for a in list(pool.actors)))
+        assert [a.handle.name for a in pool.actors] == ["actor-1", "actor-2"]
+        assert [h.name for h in killed] == ["actor-0"]
+
+    asyncio.run(main())
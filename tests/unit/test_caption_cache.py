@@ -0,0 +1,80 @@
+import asyncio
+
+import pytest
+from components.indexer.caption_cache import CaptionCache, dhash, image_digest
+from PIL import Image, ImageDraw
+
+
+def slide(title: str) -> Image.Image:
+    """A slide of a template: same background and layout, different text."""
+    image = Image.new("RGB", (640, 360), "white")
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((0, 0, 640, 60), fill="navy")
+    draw.text((40, 120), title, fill="black")
+    return image
+
+
+def test_template_slides_share_a_dhash_but_not_a_digest():
+    first, second = slide("Quarterly results"), slide("Hiring plan")
+    assert dhash(first) == dhash(second)
+    assert image_digest(first) != image_digest(second)
+    assert image_digest(first) == image_digest(slide("Quarterly results"))
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setenv("CAPTION_CACHE_PATH", str(tmp_path / "captions.db"))
+
+    def make(max_entries=100, max_distance=0):
+        cache = CaptionCache.__ray_actor_class__()
+        cache.enabled = True
+        cache.max_entries = max_entries
+        cache.max_distance = max_distance
+        return cache
+
+    return make
+
+
+def test_exact_matches_only_by_default(cache):
+    async def main():
+        captions = cache()
+        first, second = slide("Quarterly results"), slide("Hiring plan")
+        await captions.put(image_digest(first), dhash(first), "p", "results")
+        assert await captions.get(image_digest(second), dhash(second), "p") is None
+        assert await captions.get(image_digest(first), None, "p") == "results"
+        assert await captions.get(image_digest(first), None, "other") is None
+
+    asyncio.run(main())
+
+
+def test_near_matches_are_opt_in(cache):
+    async def main():
+        captions = cache(max_distance=4)
+        original = slide("Logo")
+        rescaled = original.resize((320, 180))
+        await captions.put(image_digest(original), dhash(original), "p", "logo")
+        assert (
+            await captions.get(image_digest(rescaled), dhash(rescaled), "p") == "logo"
+        )
+        assert (await captions.get_stats())["near_duplicate_hits"] == 1
+
+    asyncio.run(main())
+
+
+def test_least_recently_used_captions_are_evicted(cache):
+    async def main():
+        captions = cache(max_entries=2)
+        await captions.put("a", None, "p", "A")
+        await captions.put("b", None, "p", "B")
+        assert await captions.get("a", None, "p") == "A"  # b is now the oldest
+        await captions.put("c", None, "p", "C")
+        assert await captions.get("b", None, "p") is None
+        assert await captions.get("a", None, "p") == "A"
+        stats = await captions.get_stats()
+        assert (stats["entries"], stats["evictions"]) == (2, 1)
+
+        # the order survives a restart
+        reloaded = cache(max_entries=2)
+        assert list(reloaded._captions) == [("p", "c"), ("p", "a")]
+
+    asyncio.run(main())
@@ -0,0 +1,20 @@
+from components.indexer.checkpoints import checkpoint_key
+
+UPLOAD = {
+    "file_id": "report",
+    "partition": "p",
+    "sha256": "abc",
+    "filename": "report.pdf",
+    "created_at": "2025-01-01T00:00:00",
+}
+
+
+def test_checkpoint_key():
+    key = checkpoint_key(UPLOAD)
+    # the same content uploaded again, at another time
+    assert checkpoint_key({**UPLOAD, "created_at": "2025-01-02T00:00:00"}) == key
+    assert checkpoint_key({**UPLOAD, "partition": "other"}) != key
+    assert checkpoint_key({**UPLOAD, "sha256": "def"}) != key
+    # a resubmission correcting the metadata does not resume
+    assert checkpoint_key({**UPLOAD, "author": "Jane"}) != key
+    assert checkpoint_key({k: v for k, v in UPLOAD.items() if k != "sha256"}) is None
@@ -0,0 +1,73 @@
+import asyncio
+
+from components.indexer import document_cache
+from components.indexer.document_cache import (
+    loader_config_hash,
+    loader_name_for,
+    make_cache_key,
+)
+from config import load_config
+from langchain_core.documents import Document
+from omegaconf import OmegaConf
+
+config = load_config()
+
+
+def with_loader_settings(**settings):
+    return OmegaConf.merge(config, {"loader": settings})
+
+
+def test_loader_name_for():
+    assert loader_name_for(config, "/data/notes.md", {}) == "MarkdownLoader"
+    assert loader_name_for(config, "/data/blob", {"mimetype": "text/plain"}) == (
+        "TextLoader"
+    )
+    assert loader_name_for(config, "/data/archive.xyz", {}) is None
+
+
+def test_resource_settings_do_not_change_the_key():
+    reference = loader_config_hash(config, "MarkerLoader")
+    assert loader_config_hash(config, "MarkerLoader") == reference
+    tuned = with_loader_settings(
+        marker_max_processes=64, image_encoding={"workers": 32}
+    )
+    assert loader_config_hash(tuned, "MarkerLoader") == reference
+    changed = with_loader_settings(image_encoding={"quality": 10})
+    assert loader_config_hash(changed, "MarkerLoader") != reference
+    assert loader_config_hash(config, "DoclingLoader") != reference
+
+
+def test_output_versions_change_the_key(monkeypatch):
+    marker = loader_config_hash(config, "MarkerLoader")
+    docx = loader_config_hash(config, "MarkItDownLoader")
+
+    monkeypatch.setitem(document_cache.LOADER_OUTPUT_VERSIONS, "MarkItDownLoader", 99)
+    assert loader_config_hash(config, "MarkItDownLoader") != docx
+    assert loader_config_hash(config, "MarkerLoader") == marker
+
+    monkeypatch.setattr(document_cache, "CACHE_VERSION", 99)
+    assert loader_config_hash(config, "MarkerLoader") != marker
+
+
+def test_make_cache_key():
+    key = make_cache_key("sha", "MarkerLoader", "settings")
+    assert key == make_cache_key("sha", "MarkerLoader", "settings")
+    assert key != make_cache_key("other", "MarkerLoader", "settings")
+    assert key != make_cache_key("sha", "DoclingLoader", "settings")
+
+
+def test_entries_removed_behind_the_cache_free_their_size(monkeypatch, tmp_path):
+    monkeypatch.setenv("DOCUMENT_CACHE_PATH", str(tmp_path))
+
+    async def main():
+        cache = document_cache.DocumentCache.__ray_actor_class__()
+        cache.enabled = True
+        doc = Document(page_content="text", metadata={"page": 1})
+        await cache.put("a", doc)
+        await cache.put("b", doc)
+        size = (await cache.get_stats())["size_bytes"]
+        cache.backend.delete("a")
+        assert await cache.get("a") is None
+        assert (await cache.get_stats())["size_bytes"] == size / 2
+
+    asyncio.run(main())
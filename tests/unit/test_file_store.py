@@ -0,0 +1,59 @@
+from utils.file_store import FileStore
+
+
+def stage(store: FileStore, content: bytes):
+    path = store.temp_path()
+    path.write_bytes(content)
+    return path
+
+
+def test_content_is_shared_and_removed_with_its_last_reference(tmp_path):
+    store = FileStore(tmp_path)
+    first = store.add(stage(store, b"same"), "ab12", "report.pdf", "p1", "f1")
+    second = store.add(stage(store, b"same"), "ab12", "copy.pdf", "p2", "f2")
+    assert first.read_bytes() == second.read_bytes() == b"same"
+    assert store.ref_count("ab12") == 2
+    assert not any(store.tmp_dir.iterdir())
+
+    assert store.release("p1", "f1")
+    assert not first.exists()  # no reference uses that name anymore
+    assert second.read_bytes() == b"same"
+    assert store.ref_count("ab12") == 1
+
+    assert not store.release("p1", "f1")
+    assert store.release("p2", "f2")
+    assert not store.object_dir("ab12").exists()
+
+
+def test_replacing_a_reference_releases_the_previous_content(tmp_path):
+    store = FileStore(tmp_path)
+    store.add(stage(store, b"v1"), "aa01", "doc.txt", "p", "f")
+    store.add(stage(store, b"v2"), "bb02", "doc.txt", "p", "f")
+    assert not store.object_dir("aa01").exists()
+    assert store.ref_count("bb02") == 1
+
+
+def test_release_partition(tmp_path):
+    store = FileStore(tmp_path)
+    store.add(stage(store, b"a"), "aa01", "a.txt", "p", "a")
+    store.add(stage(store, b"b"), "bb02", "b.txt", "p", "b")
+    store.add(stage(store, b"b"), "bb02", "b.txt", "other", "b")
+    assert store.release_partition("p") == 2
+    assert not store.object_dir("aa01").exists()
+    assert store.ref_count("bb02") == 1
+
+
+def test_renaming_a_reference_removes_the_unused_name(tmp_path):
+    store = FileStore(tmp_path)
+    old = store.add(stage(store, b"same"), "ab12", "draft.pdf", "p", "f")
+    shared = store.add(stage(store, b"same"), "ab12", "draft.pdf", "other", "f")
+    new = store.add(stage(store, b"same"), "ab12", "final.pdf", "p", "f")
+    assert new.read_bytes() == b"same"
+    assert shared.exists()  # still the name of the other reference
+    assert store.ref_count("ab12") == 2
+
+    store.add(stage(store, b"same"), "ab12", "final.pdf", "other", "f")
+    assert not old.exists()
+    assert sorted(p.name for p in (store.object_dir("ab12") / "files").iterdir()) == [
+        "final.pdf"
+    ]
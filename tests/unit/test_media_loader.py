@@ -0,0 +1,134 @@
+import io
+
+import numpy as np
+import pytest
+from components.indexer.loaders.media_loader import (
+    SAMPLE_RATE,
+    SpeechSegmenter,
+    changed_pixels,
+    thumbnail,
+)
+from PIL import Image, ImageDraw, ImageFont
+
+MAX_DIFFERENCE = 0.002  # transcription.video.max_difference
+
+
+def slide(lines, cursor=None) -> Image.Image:
+    """A 960 px wide frame of a slide deck: one template, different text."""
+    image = Image.new("RGB", (960, 540), "white")
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((0, 0, 960, 80), fill="navy")
+    font = ImageFont.load_default(size=28)
+    for i, line in enumerate(lines):
+        draw.text((60, 130 + i * 50), line, fill="black", font=font)
+    if cursor is not None:
+        x, y = cursor
+        draw.polygon([(x, y), (x, y + 18), (x + 12, y + 12)], fill="black")
+    return image
+
+
+def reencoded(image: Image.Image, quality: int) -> Image.Image:
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=quality)
+    return Image.open(io.BytesIO(buffer.getvalue())).convert("RGB")
+
+
+def difference(first: Image.Image, second: Image.Image) -> float:
+    return changed_pixels(thumbnail(first), thumbnail(second))
+
+
+def test_slides_shown_again_are_repeats():
+    kept = slide(["Quarterly results", "Revenue up 4%"])
+    assert difference(kept, reencoded(kept, quality=30)) <= MAX_DIFFERENCE
+    with_cursor = slide(["Quarterly results", "Revenue up 4%"], cursor=(500, 300))
+    assert difference(kept, reencoded(with_cursor, quality=40)) <= MAX_DIFFERENCE
+
+
+def test_slides_of_one_template_are_distinct():
+    kept = slide(["Quarterly results", "Revenue up 4%"])
+    for other in (
+        slide(["Hiring plan", "Two engineers"]),
+        slide(["Quarterly results", "Revenue up 4%", "Costs flat"]),
+        slide(["Q3", "Revenue up 4%"]),
+    ):
+        assert difference(kept, other) > MAX_DIFFERENCE
+
+
+def test_frames_of_another_size_are_distinct():
+    kept = slide(["Quarterly results"])
+    assert difference(kept, kept.resize((960, 720))) == 1.0
+
+
+VAD = {
+    "threshold_db": -45,
+    "min_silence_ms": 500,
+    "min_segment_seconds": 10,
+    "max_segment_seconds": 30,
+    "padding_ms": 200,
+}
+
+
+def audio(*parts):
+    """Concatenated (speech or silence, seconds) parts; times are 30 ms frames."""
+    samples = []
+    for speech, seconds in parts:
+        n = round(seconds * SAMPLE_RATE)
+        tone = 0.1 * np.sin(np.arange(n) * 2 * np.pi * 440 / SAMPLE_RATE)
+        samples.append(tone.astype(np.float32) if speech else np.zeros(n, np.float32))
+    return np.concatenate(samples)
+
+
+def segment(samples, chunk=None):
+    segmenter = SpeechSegmenter(VAD)
+    chunk = chunk or len(samples)
+    segments = []
+    for i in range(0, len(samples), chunk):
+        segments += segmenter.feed(samples[i : i + chunk])
+    return segments + segmenter.flush()
+
+
+def spans(segments):
+    """(start, end) in seconds of the segments."""
+    return [
+        (pytest.approx(start), pytest.approx(start + len(samples) / SAMPLE_RATE))
+        for start, samples in segments
+    ]
+
+
+def test_silence_makes_no_segment_and_is_not_kept():
+    segmenter = SpeechSegmenter(VAD)
+    for _ in range(20):
+        assert segmenter.feed(audio((False, 3))) == []
+    assert len(segmenter._buffer) <= segmenter.padding + segmenter.frame
+    assert segmenter.flush() == []
+
+
+def test_long_silences_end_segments_with_padding():
+    samples = audio((True, 3), (False, 3), (True, 2))
+    assert spans(segment(samples)) == [(0.0, 3.2), (5.8, 8.0)]
+
+
+def test_short_pauses_keep_short_segments_open():
+    samples = audio((True, 4.5), (False, 0.6), (True, 3), (False, 3))
+    assert spans(segment(samples)) == [(0.0, 8.3)]
+
+
+def test_long_speech_is_cut_at_its_last_pause():
+    samples = audio((True, 8.4), (False, 0.6), (True, 10.8), (False, 0.3), (True, 20.1))
+    # the 0.3 s pause is too short to end the segment, but it is where it is cut
+    assert spans(segment(samples)) == [(0.0, 19.95), (19.95, 40.2)]
+
+
+def test_long_speech_without_pauses_is_cut_at_the_window():
+    samples = audio((True, 70.02))
+    assert spans(segment(samples)) == [(0.0, 30.0), (30.0, 60.0), (60.0, 70.02)]
+
+
+def test_segments_do_not_depend_on_how_the_stream_is_read():
+    samples = audio((True, 12), (False, 0.9), (True, 25), (False, 2.4), (True, 5))
+    whole = segment(samples)
+    assert len(whole) == 3
+    for chunk in (1234, 4800, SAMPLE_RATE * 5):
+        chunked = segment(samples, chunk)
+        assert [start for start, _ in chunked] == [start for start, _ in whole]
+        assert all(np.array_equal(a, b) for (_, a), (_, b) in zip(chunked, whole))
@@ -0,0 +1,49 @@
+import pymupdf
+import pytest
+from components.indexer.loaders.pdf_loaders.triage import (
+    PDFTriage,
+    _bad_glyph_ratio,
+    assemble_pages,
+    page_runs,
+)
+
+
+@pytest.mark.parametrize(
+    "pages, runs",
+    [
+        ([], []),
+        ([0], [(1, 1)]),
+        ([0, 1, 2], [(1, 3)]),
+        ([0, 2, 3, 7], [(1, 1), (3, 4), (8, 8)]),
+    ],
+)
+def test_page_runs(pages, runs):
+    assert list(page_runs(pages)) == runs
+
+
+def test_assemble_pages():
+    pages = {0: "  first\n", 2: "third"}
+    assert assemble_pages(pages, range(3)) == (
+        "first\n[PAGE_1]\n\n[PAGE_2]\nthird\n[PAGE_3]\n"
+    )
+
+
+def test_bad_glyph_ratio():
+    assert _bad_glyph_ratio("") == 0.0
+    assert _bad_glyph_ratio("plain text") == 0.0
+    assert _bad_glyph_ratio("ab\ufffd\ufffd") == 0.5
+    assert _bad_glyph_ratio("a\ue000  ") == 0.5  # private use
+
+
+def test_classify(tmp_path):
+    path = tmp_path / "doc.pdf"
+    with pymupdf.open() as pdf:
+        text = pdf.new_page()
+        text.insert_text((72, 72), "A page with a clean text layer. " * 3)
+        pdf.new_page()  # blank: a scan, as far as the text layer tells
+        short = pdf.new_page()
+        short.insert_text((72, 72), "Title only")
+        pdf.save(path)
+
+    triage = PDFTriage({"min_chars": 50})
+    assert triage.classify(str(path)) == (3, [1, 2])
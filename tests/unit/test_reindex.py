@@ -0,0 +1,131 @@
+import asyncio
+import inspect
+from collections import Counter
+from types import SimpleNamespace
+
+import ray
+from components.indexer.indexer import Indexer
+from components.indexer.vectordb.vectordb import MilvusDB
+from utils.logger import get_logger
+
+
+class Handle:
+    """Stand-in for an actor handle: `handle.method.remote(...)` runs `method`."""
+
+    def __init__(self, target):
+        self.target = target
+
+    def __getattr__(self, name):
+        method = getattr(self.target, name)
+
+        async def remote(*args, **kwargs):
+            result = method(*args, **kwargs)
+            return await result if inspect.isawaitable(result) else result
+
+        return SimpleNamespace(remote=remote)
+
+
+class PartitionFiles:
+    """The files of a single partition, by file id."""
+
+    def __init__(self, *file_ids):
+        self.files = {file_id: {"file_id": file_id} for file_id in file_ids}
+
+    def list_file_metadata(self, partition):
+        return dict(self.files)
+
+    def partition_exists(self, partition):
+        return bool(self.files)
+
+    def file_exists_in_partition(self, file_id, partition):
+        return file_id in self.files
+
+    def remove_file_from_partition(self, file_id, partition):
+        del self.files[file_id]
+
+    def set_partition_alias(self, partition, physical, shadow=None):
+        pass
+
+
+def vectordb(*file_ids):
+    db = object.__new__(MilvusDB.__ray_actor_class__)
+    db.logger = get_logger()
+    db._collection_name = "test"
+    db.partition_file_manager = PartitionFiles(*file_ids)
+    db.partition_aliases, db.shadow_partitions, db._rewritten = {}, {}, {}
+    db._inflight_inserts, db._cutovers = Counter(), {}
+    db.deleted, db.copied = [], []
+    db.client = SimpleNamespace(
+        delete=lambda collection_name, filter=None, ids=None: db.deleted.append(
+            filter or ids
+        )
+    )
+    db._copy_file_chunks = lambda file_id, source, target: db.copied.append(file_id)
+    return db
+
+
+class Tasks:
+    def __init__(self):
+        self.states = []
+
+    def set_state(self, task_id, state):
+        self.states.append(state)
+
+    def set_details(self, task_id, **details):
+        pass
+
+    def set_progress(self, task_id, **progress):
+        self.progress = progress
+
+    def set_error(self, task_id, tb):
+        pass
+
+
+def test_files_left_out_of_a_reindex_are_carried_over(monkeypatch):
+    monkeypatch.setattr(
+        ray,
+        "get_runtime_context",
+        lambda: SimpleNamespace(get_task_id=lambda: "task"),
+    )
+    db, tasks = vectordb("a", "gone", "b"), Tasks()
+    indexer = object.__new__(Indexer.__ray_actor_class__)
+    indexer.logger = get_logger()
+    indexer._reindexing = set()
+    indexer.chunker = None
+    indexer.max_reindex_rate = 0
+    indexer.vectordb, indexer.task_state_manager = Handle(db), Handle(tasks)
+
+    async def reindex_file(task_id, metadata, shadow, chunker, log):
+        # no cached serialization nor source for "gone"
+        return None if metadata["file_id"] == "gone" else 2
+
+    indexer._reindex_file = reindex_file
+
+    result = asyncio.run(indexer.reindex_partition("p"))
+    assert result == {"files": 2, "skipped": 1, "chunks": 4}
+    assert tasks.states == ["REINDEXING", "COMPLETED"]
+    assert (tasks.progress["done"], tasks.progress["skipped"]) == (3, 1)
+    assert db.copied == ["gone"]
+    assert db.partition_aliases["p"].startswith("p#")
+
+
+def test_files_written_during_a_reindex_keep_their_new_chunks():
+    async def main():
+        db = vectordb("kept", "replaced", "deleted")
+        shadow = db.create_shadow_partition("p")
+
+        # "replaced" is deleted then added again, e.g. by a PUT or a PATCH
+        db.delete_file_points(["id"], "replaced", "p")
+        db.partition_file_manager.files["replaced"] = {"file_id": "replaced"}
+        db.delete_file_points(["id"], "deleted", "p")
+        db.partition_file_manager.files["added"] = {"file_id": "added"}
+
+        result = await db.cutover_partition("p", ["kept", "replaced", "deleted"])
+        assert result == {"removed": 2, "carried_over": 2}
+        assert sorted(db.copied) == ["added", "replaced"]
+        stale = db.deleted[2]
+        assert stale.startswith(f"partition == '{shadow}'")
+        assert "'replaced'" in stale and "'deleted'" in stale and "kept" not in stale
+        assert db.partition_aliases["p"] == shadow
+
+    asyncio.run(main())
@@ -0,0 +1,80 @@
+import time
+from collections import deque
+
+import pytest
+from components.indexer.loaders.serializer import SerializerQueue, _Waiter
+
+
+@pytest.fixture
+def queue():
+    # the scheduling state only, without the actor pool of the DocSerializers
+    queue = object.__new__(SerializerQueue.__ray_actor_class__)
+    queue.aging_seconds = 300
+    queue.partition_weights = {}
+    queue._waiters = {}
+    queue._by_task = {}
+    queue._vtime = {}
+    return queue
+
+
+def enqueue(queue, task_id: str, partition: str, priority="interactive", age=0.0):
+    waiter = _Waiter(
+        task_id=task_id,
+        partition=partition,
+        priority=priority,
+        enqueued_at=time.monotonic() - age,
+        future=None,
+    )
+    queue._waiters.setdefault((priority, partition), deque()).append(waiter)
+    queue._by_task[task_id] = waiter
+
+
+def drain(queue):
+    order = []
+    while (waiter := queue._pick()) is not None:
+        order.append(waiter.task_id)
+    assert not queue._waiters and not queue._by_task
+    return order
+
+
+def test_pick_from_an_empty_queue(queue):
+    assert queue._pick() is None
+
+
+def test_interactive_before_bulk(queue):
+    enqueue(queue, "bulk-1", "p", "bulk", age=10)
+    enqueue(queue, "bulk-2", "p", "bulk", age=5)
+    enqueue(queue, "interactive", "p")
+    assert drain(queue) == ["interactive", "bulk-1", "bulk-2"]
+
+
+def test_partitions_share_their_class_fairly(queue):
+    for i in range(4):
+        enqueue(queue, f"backfill-{i}", "backfill", "bulk", age=10 - i)
+    for i in range(2):
+        enqueue(queue, f"other-{i}", "other", "bulk", age=1 - i / 10)
+    assert drain(queue) == [
+        "backfill-0",
+        "other-0",
+        "backfill-1",
+        "other-1",
+        "backfill-2",
+        "backfill-3",
+    ]
+
+
+def test_partition_weights(queue):
+    queue.partition_weights = {"heavy": 2}
+    for i in range(6):
+        enqueue(queue, f"heavy-{i}", "heavy", age=10 - i)
+        enqueue(queue, f"light-{i}", "light", age=10 - i)
+    served = [task_id.split("-")[0] for task_id in drain(queue)]
+    assert served[:6].count("heavy") == 4
+    assert served[:9].count("heavy") == 6
+
+
+def test_aged_bulk_documents_compete_as_interactive(queue):
+    enqueue(queue, "old-bulk", "p", "bulk", age=queue.aging_seconds + 1)
+    enqueue(queue, "interactive", "p", age=1)
+    enqueue(queue, "recent-bulk", "p", "bulk")
+    assert drain(queue) == ["old-bulk", "interactive", "recent-bulk"]
@@ -0,0 +1,179 @@
+import asyncio
+import threading
+
+import pytest
+from components.indexer.stages import IndexingJob, PipelineStage
+
+
+def make_job(task_id: str) -> IndexingJob:
+    return IndexingJob(
+        task_id=task_id,
+        path=f"{task_id}.txt",
+        metadata={},
+        partition="test",
+        log=None,
+        future=asyncio.get_running_loop().create_future(),
+    )
+
+
+def test_jobs_go_through_the_stages():
+    async def main():
+        done = []
+
+        async def first(job):
+            job.chunks.append("first")
+            await second.put(job)
+
+        async def last(job):
+            job.chunks.append("last")
+            done.append(job.task_id)
+            job.future.set_result(True)
+
+        second = PipelineStage("last", last, workers=1, queue_size=1)
+        stage = PipelineStage("first", first, workers=2, queue_size=1)
+        stage.start()
+        second.start()
+
+        jobs = [make_job(f"task-{i}") for i in range(5)]
+        for job in jobs:
+            await stage.put(job)
+        assert await asyncio.gather(*(job.future for job in jobs)) == [True] * 5
+        await stage.queue.join()
+        await second.queue.join()
+        assert sorted(done) == sorted(job.task_id for job in jobs)
+        assert all(job.chunks == ["first", "last"] for job in jobs)
+        assert stage.stats()["processed"] == second.stats()["processed"] == 5
+
+    asyncio.run(main())
+
+
+def test_put_blocks_while_the_queue_is_full():
+    async def main():
+        release = asyncio.Event()
+
+        async def handler(job):
+            await release.wait()
+            job.future.set_result(True)
+
+        stage = PipelineStage("slow", handler, workers=1, queue_size=1)
+        stage.start()
+        jobs = [make_job(f"task-{i}") for i in range(3)]
+        await stage.put(jobs[0])  # taken by the worker
+        await asyncio.sleep(0)
+        await stage.put(jobs[1])  # fills the queue
+        blocked = asyncio.create_task(stage.put(jobs[2]))
+        await asyncio.sleep(0.01)
+        assert not blocked.done()
+        assert stage.stats()["waiting"] == 1
+        assert stage.is_full()
+
+        release.set()
+        await blocked
+        await asyncio.gather(*(job.future for job in jobs))
+        assert stage.stats()["waiting"] == 0
+
+    asyncio.run(main())
+
+
+def test_handler_errors_fail_the_job():
+    async def main():
+        async def handler(job):
+            if job.task_id == "bad":
+                raise ValueError("boom")
+            job.future.set_result(True)
+
+        stage = PipelineStage("flaky", handler, workers=1, queue_size=2)
+        stage.start()
+        bad, good = make_job("bad"), make_job("good")
+        await stage.put(bad)
+        await stage.put(good)
+        with pytest.raises(ValueError, match="boom"):
+            await bad.future
+        assert await good.future is True
+        await stage.queue.join()
+        stats = stage.stats()
+        assert (stats["failed"], stats["processed"]) == (1, 1)
+
+    asyncio.run(main())
+
+
+def test_stage_built_outside_a_loop_serves_the_loop_it_is_started_from():
+    async def handler(job):
+        job.future.set_result(True)
+
+    stage = PipelineStage("late", handler, workers=1, queue_size=1)
+
+    # another event loop (e.g. another Ray concurrency group) only reads stats
+    stats = []
+    reader = threading.Thread(target=lambda: stats.append(asyncio.run(read(stage))))
+    reader.start()
+    reader.join()
+    assert stats[0]["processed"] == 0
+
+    async def main():
+        stage.start()
+        job = make_job("task")
+        await stage.put(job)
+        return await asyncio.wait_for(job.future, timeout=1)
+
+    assert asyncio.run(main()) is True
+
+
+async def read(stage: PipelineStage):
+    return stage.stats()
+
+
+def test_cancelling_a_job_stops_only_its_own_handler():
+    async def main():
+        in_embed = asyncio.Event()
+        release = asyncio.Event()
+
+        async def chunk(job):
+            if job.task_id == "b":
+                await release.wait()
+            await embed.put(job)
+
+        async def embed_handler(job):
+            in_embed.set()
+            await release.wait()
+            job.future.set_result(True)
+
+        embed = PipelineStage("embed", embed_handler, workers=1, queue_size=2)
+        stage = PipelineStage("chunk", chunk, workers=1, queue_size=2)
+        embed.start()
+        stage.start()
+
+        a, b = make_job("a"), make_job("b")
+        await stage.put(a)
+        await in_embed.wait()  # a left the chunk stage, whose worker took b
+        await stage.put(b)
+        await asyncio.sleep(0.01)
+
+        a.future.cancel()
+        await asyncio.sleep(0.01)
+        release.set()
+        assert await asyncio.wait_for(b.future, timeout=1) is True
+        await stage.queue.join()
+        await embed.queue.join()
+        assert stage.stats()["cancelled"] == 0
+        assert stage.stats()["processed"] == 2
+        assert embed.stats()["cancelled"] == 1
+
+    asyncio.run(main())
+
+
+def test_handler_cancelled_from_within_fails_the_job():
+    async def handler(job):
+        raise asyncio.CancelledError
+
+    async def main():
+        stage = PipelineStage("cancelling", handler, workers=1, queue_size=1)
+        stage.start()
+        job = make_job("task")
+        await stage.put(job)
+        with pytest.raises(RuntimeError, match="interrupted"):
+            await asyncio.wait_for(job.future, timeout=1)
+        await stage.queue.join()
+        assert stage.stats()["failed"] == 1
+
+    asyncio.run(main())
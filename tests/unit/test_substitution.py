@@ -0,0 +1,41 @@
+import re
+
+from components.indexer.loaders.substitution import substitute, substitute_in_order
+
+IMAGE = "<!-- image -->"
+
+
+def test_substitute_in_order():
+    text = f"a {IMAGE} b {IMAGE} c"
+    assert substitute_in_order(text, IMAGE, ["one", "two"]) == "a one b two c"
+
+
+def test_substitute_in_order_with_a_regex():
+    text = "![](img1.png) and ![alt](img2.png)"
+    pattern = re.compile(r"!\[[^\]]*\]\([^)]*\)")
+    assert substitute_in_order(text, pattern, ["one", "two"]) == "one and two"
+
+
+def test_occurrences_beyond_the_replacements_are_kept():
+    text = f"{IMAGE}|{IMAGE}|{IMAGE}"
+    assert substitute_in_order(text, IMAGE, ["one"]) == f"one|{IMAGE}|{IMAGE}"
+    assert substitute_in_order(text, IMAGE, []) == text
+    assert substitute_in_order("no image", IMAGE, ["unused"]) == "no image"
+
+
+def test_replacements_are_inserted_as_is():
+    # a caption mentioning the placeholder or holding backslashes is not rewritten
+    text = f"{IMAGE} {IMAGE}"
+    captions = [f"a diagram, then {IMAGE}", r"C:\new\1 folder"]
+    assert substitute_in_order(text, IMAGE, captions) == " ".join(captions)
+
+
+def test_substitute():
+    text = "[IMG1] then [IMG10], [IMG1] again"
+    replacements = {"[IMG1": "?", "[IMG1]": "one", "[IMG10]": r"ten \g<0>"}
+    assert substitute(text, replacements) == r"one then ten \g<0>, one again"
+
+
+def test_substitute_is_a_single_pass():
+    assert substitute("a b", {"a": "b", "b": "a"}) == "b a"
+    assert substitute("text", {}) == "text"
@@ -0,0 +1,92 @@
+from datetime import datetime, timedelta
+
+import pytest
+from components.indexer.task_store import TaskRecord, TaskStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return TaskStore(f"sqlite:///{tmp_path / 'tasks.db'}")
+
+
+def finish(store: TaskStore, task_id: str, state: str, hours_ago: float):
+    """Store a finished task, as if it finished `hours_ago` hours ago."""
+    store.save(task_id, state=state, error=None, details={"partition": "p"})
+    with store.Session() as session:
+        record = session.get(TaskRecord, task_id)
+        record.finished_at = datetime.now() - timedelta(hours=hours_ago)
+        session.commit()
+
+
+def test_save_many_keeps_the_stored_batch(store):
+    store.add_batch("batch", ["t1", "t2"])
+    store.save_many(
+        [
+            ("t1", "CHUNKING", None, {"partition": "p", "file_id": "f1"}, None),
+            ("t3", "FAILED", "boom", {"partition": "p", "file_id": "f3"}, None),
+        ]
+    )
+    assert store.get("t1") == {
+        "state": "CHUNKING",
+        "error": None,
+        "details": {"partition": "p", "file_id": "f1"},
+        "batch_id": "batch",
+    }
+    assert store.get("t3")["error"] == "boom"
+    assert store.batch_progress("batch") == {
+        "total": 2,
+        "states": {"t1": "CHUNKING", "t2": "QUEUED"},
+    }
+    assert store.count_by_state() == {"CHUNKING": 1, "QUEUED": 1, "FAILED": 1}
+
+    total, tasks = store.list(states=["CHUNKING", "FAILED"], partition="p")
+    assert total == 2
+    assert {task["task_id"] for task in tasks} == {"t1", "t3"}
+
+
+def test_purge_by_retention(store):
+    finish(store, "old-completed", "COMPLETED", hours_ago=10)
+    finish(store, "old-cancelled", "CANCELLED", hours_ago=10)
+    finish(store, "new-completed", "COMPLETED", hours_ago=1)
+    finish(store, "old-failed", "FAILED", hours_ago=10)
+    finish(store, "new-failed", "FAILED", hours_ago=4)
+    store.save("running", state="EMBEDDING", error=None, details={})
+
+    now = datetime.now()
+    deleted = store.purge(
+        completed_before=now - timedelta(hours=5),
+        failed_before=now - timedelta(hours=8),
+    )
+    assert deleted == {"COMPLETED": 1, "CANCELLED": 1, "FAILED": 1}
+    assert store.states(
+        ["old-completed", "old-cancelled", "new-completed", "old-failed", "new-failed"]
+    ) == {"new-completed": "COMPLETED", "new-failed": "FAILED"}
+    assert store.get("running")["state"] == "EMBEDDING"
+
+
+def test_purge_keeps_the_most_recent_finished_tasks(store):
+    for hours_ago in range(1, 6):
+        finish(store, f"task-{hours_ago}", "COMPLETED", hours_ago=hours_ago)
+    store.save("running", state="QUEUED", error=None, details={})
+
+    long_ago = datetime.now() - timedelta(days=365)
+    deleted = store.purge(long_ago, long_ago, max_finished=2)
+    assert deleted == {"COMPLETED": 3}
+    assert store.count_by_state() == {"COMPLETED": 2, "QUEUED": 1}
+    assert store.get("task-1") is not None and store.get("task-2") is not None
+
+
+def test_fail_active(store):
+    finish(store, "done", "COMPLETED", hours_ago=1)
+    store.save("running", state="EMBEDDING", error=None, details={"partition": "p"})
+    store.add_batch("batch", ["queued"])
+
+    assert store.fail_active("Interrupted by a restart") == 2
+    assert store.count_by_state() == {"COMPLETED": 1, "FAILED": 2}
+    running = store.get("running")
+    assert running["error"] == "Interrupted by a restart"
+    assert running["details"] == {"partition": "p"}
+
+    # they are then purged like any failed task
+    deleted = store.purge(datetime.now(), datetime.now() + timedelta(seconds=1))
+    assert deleted == {"COMPLETED": 1, "FAILED": 2}
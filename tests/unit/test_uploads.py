@@ -0,0 +1,71 @@
+import hashlib
+import io
+import tarfile
+import warnings
+import zipfile
+
+import pytest
+from utils.uploads import archive_member_id, extract_archive
+
+
+@pytest.mark.parametrize(
+    "name, file_id",
+    [
+        ("report.pdf", "report.pdf"),
+        ("a/b/c.pdf", "a_b_c.pdf"),
+        ("./a/../b.pdf", "a_b.pdf"),
+        ("/abs/path.txt", "abs_path.txt"),
+        ("dir/", "dir"),
+        ("..", ""),
+    ],
+)
+def test_archive_member_id(name, file_id):
+    assert archive_member_id(name) == file_id
+
+
+def make_zip(members):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as zf, warnings.catch_warnings():
+        warnings.simplefilter("ignore")  # duplicate names are on purpose
+        for name, content in members:
+            zf.writestr(name, content)
+    buffer.seek(0)
+    return buffer
+
+
+def make_tar(members):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as tf:
+        for name, content in members:
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            tf.addfile(info, io.BytesIO(content))
+    buffer.seek(0)
+    return buffer
+
+
+@pytest.mark.parametrize(
+    "archive_name, make", [("docs.zip", make_zip), ("docs.tgz", make_tar)]
+)
+def test_extract_archive(tmp_path, archive_name, make):
+    members = [
+        ("a/b_c.txt", b"first"),
+        ("a_b/c.txt", b"second"),
+        ("notes.md", b"# notes"),
+        ("notes.md", b"# notes again"),
+        ("image.xyz", b"?"),
+    ]
+    extracted, skipped = extract_archive(make(members), archive_name, tmp_path)
+
+    assert [file_id for file_id, _ in extracted] == ["a_b_c.txt", "notes.md"]
+    for file_id, (path, sha256) in extracted:
+        assert path == tmp_path / file_id
+        assert sha256 == hashlib.sha256(path.read_bytes()).hexdigest()
+    # the first member keeps its content, the colliding ones are reported
+    assert (tmp_path / "a_b_c.txt").read_bytes() == b"first"
+    assert (tmp_path / "notes.md").read_bytes() == b"# notes"
+    assert skipped == [
+        {"file": "a_b/c.txt", "reason": "duplicate in batch"},
+        {"file": "notes.md", "reason": "duplicate in batch"},
+        {"file": "image.xyz", "reason": "unsupported format"},
+    ]
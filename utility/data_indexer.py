@@ -2,9 +2,13 @@
 
 import httpx
 import argparse
+import time
 from pathlib import Path
 from loguru import logger
 
+# seconds to wait before retrying a batch refused without a Retry-After header
+DEFAULT_RETRY_AFTER = 30
+
 
 parser = argparse.ArgumentParser(description="Index documents from local file system")
 parser.add_argument(
@@ -27,6 +31,13 @@ parser.add_argument(
 parser.add_argument(
     "-p", "--partition", required=True, type=str, help="Target partition"
 )
+parser.add_argument(
+    "-b",
+    "--batch-size",
+    default=100,
+    type=int,
+    help="Number of files sent per upload request (max 1000)",
+)
 args = parser.parse_args()
 
 headers = {"accept": "application/json"}
@@ -47,50 +58,65 @@ def __check_api(base_url):
         raise e
 
 
-def __check_file_exists(base_url, partition, file_name, headers):
+def __post_batch(url, file_paths, headers):
+    handles = [open(file_path, "rb") for file_path in file_paths]
     try:
-        url = f"{base_url}/partition/check-file/{partition}/file/{file_name}"
-        response = httpx.get(url, headers=headers, timeout=60)
-        if 200 == response.status_code:
-            return True
-    except Exception as e:
-        logger.debug(f"An error occurred: {e}")
-        raise e
+        files = [
+            ("files", (file_path.name, f, f"application/{file_path.suffix[1:]}"))
+            for file_path, f in zip(file_paths, handles)
+        ]
+        files.append(("metadata", (None, "")))
+        return httpx.post(url, files=files, headers=headers, timeout=600)
+    finally:
+        for f in handles:
+            f.close()
+
+
+def __retry_after(response) -> float:
+    try:
+        return float(response.headers.get("Retry-After", DEFAULT_RETRY_AFTER))
+    except ValueError:  # an HTTP date: not sent by OpenRAG
+        return DEFAULT_RETRY_AFTER
+
+
+def __upload_batch(base_url, partition, file_paths, headers):
+    url = f"{base_url}/indexer/partition/{partition}/batch"
+    response = __post_batch(url, file_paths, headers)
+    # the indexing pipeline is saturated: send the batch again once it drained
+    while response.status_code == 503:
+        delay = __retry_after(response)
+        logger.warning(f"Indexer saturated, retrying the batch in {delay:g}s")
+        time.sleep(delay)
+        response = __post_batch(url, file_paths, headers)
 
-    return False
+    if response.status_code != 201:
+        logger.error(f"Batch upload failed: {response.status_code} - {response.text}")
+        return
+
+    content = response.json()
+    for skipped in content["skipped"]:
+        logger.info(f'"{skipped["file"]}" skipped: {skipped["reason"]}')
+    logger.info(
+        f"Queued {content['queued']} files, progress: {content['batch_status_url']}"
+    )
 
 
 __check_api(args.url)
 
 print(dir_path.is_dir())
 
+# Existence checks happen server side, in bulk, for each batch
+batch = []
 for file_path in dir_path.glob("**/*"):
-    logger.info(f"file: {file_path}")
     if file_path.is_file():
-        file_ext = file_path.suffix[1:]  # Get the file extension without the dot
-        filename = file_path.name  # Get the filename without the directory path
-
-        file_id = filename  # or generate a unique ID if necessary
-
-        if __check_file_exists(args.url, args.partition, filename, headers):
-            logger.info(f'"{filename}" exists')
-            continue
-        else:
-            logger.info(f'"{filename}" doesn\'t exist')
-
-        # file_id = str(uuid.uuid4())
-
-        url_template = f"{args.url}/indexer/partition/{args.partition}/file/{file_id}"
-        url = url_template.format(partition_name=args.partition, file_id=file_id)
-
-        with open(file_path, "rb") as f:
-            files = {
-                "file": (filename, f, f"application/{file_ext}"),
-                "metadata": (None, ""),
-            }
-
-            response = httpx.post(url, files=files, headers=headers, timeout=60)
-            print(f"Uploaded {filename}: {response.status_code} - {response.text}")
+        logger.info(f"file: {file_path}")
+        batch.append(file_path)
+    if len(batch) >= args.batch_size:
+        __upload_batch(args.url, args.partition, batch, headers)
+        batch = []
+
+if batch:
+    __upload_batch(args.url, args.partition, batch, headers)
 
 
 # How to run this code: